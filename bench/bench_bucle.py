@@ -0,0 +1,143 @@
+"""Benchmark: retraso del event loop mientras se reconstruye el prefiltro, con y sin trabajadores.
+
+    python bench/bench_bucle.py [--filas 50000] [--umbral-ms 20] [--trabajadores 2]
+
+Reconstruye el índice de trigramas del prefiltro sobre `filas` carátulas (páginas de 1000
+pre-armadas, así el stand-in no consume CPU del loop) mientras otros clientes consultan
+timelines sin parar. Mide el retraso del loop con una sonda cada 5 ms, la latencia de esas
+consultas y los bloqueos que registra MonitorBucle (umbral bajo, para verlos), primero con
+todo en el loop (BUCLE_TRABAJADORES=0) y después con el pool de trabajadores.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+os.environ.setdefault("PREFETCH_MAX_CASOS", "0")
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+from standin import APELLIDOS, DEMANDADAS, NOMBRES, SupabaseLocal, sembrar  # noqa: E402
+
+HEADERS = {"apikey": "bench", "Authorization": "Bearer bench"}
+
+
+def paginas_expedientes(filas: int) -> dict:
+    """offset -> cuerpo JSON de la página del prefiltro (select=caratula, de a 1000)."""
+    rnd = random.Random(filas)
+    caratulas = [
+        f"{rnd.choice(APELLIDOS)} {rnd.choice(NOMBRES)} {rnd.choice(NOMBRES)} C/ {rnd.choice(DEMANDADAS)} "
+        f"S/ ACCIDENTE - LEY ESPECIAL - {rnd.randint(10000, 99999)}/{rnd.randint(2015, 2025)}"
+        for _ in range(filas)
+    ]
+    return {
+        i: json.dumps([{"caratula": c} for c in caratulas[i:i + 1000]]).encode()
+        for i in range(0, filas + 1, 1000)
+    }
+
+
+def transporte(db: SupabaseLocal, paginas: dict) -> httpx.MockTransport:
+    async def manejar(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/expedientes") and request.url.params.get("select") == "caratula":
+            await asyncio.sleep(0.002)
+            return httpx.Response(200, content=paginas[int(request.url.params["offset"])],
+                                  headers={"content-type": "application/json"})
+        if request.url.path.endswith("/casos_srt") and request.url.params.get("select") == "nombre":
+            return httpx.Response(200, json=[])
+        return await db.manejar(request)
+    return httpx.MockTransport(manejar)
+
+
+async def sondear(retrasos: list, parar: asyncio.Event) -> None:
+    while not parar.is_set():
+        esperado = time.monotonic() + 0.005
+        await asyncio.sleep(0.005)
+        retrasos.append(max(0.0, time.monotonic() - esperado))
+
+
+async def consultar(casos: list, tiempos: list, parar: asyncio.Event) -> None:
+    rnd = random.Random(1)
+    while not parar.is_set():
+        caso = rnd.choice(casos)
+        inicio = time.perf_counter()
+        await server.obtener_y_generar_movimientos(
+            caso_id=caso["id"], estado_str=caso["estado"], es_srt=False,
+            es_despido=caso["tipo_caso"] == "despido", headers=HEADERS, campo_id="expediente_id",
+        )
+        tiempos.append(time.perf_counter() - inicio)
+
+
+async def escenario(casos: list, pool, umbral: float) -> dict:
+    server._trabajadores = pool
+    monitor = server.MonitorBucle(0.01, umbral, 1000)
+    retrasos, tiempos = [], []
+    parar = asyncio.Event()
+    tareas = [
+        asyncio.create_task(monitor.medir()),
+        asyncio.create_task(sondear(retrasos, parar)),
+        *(asyncio.create_task(consultar(casos, tiempos, parar)) for _ in range(4)),
+    ]
+    await asyncio.sleep(0.2)
+    inicio = time.perf_counter()
+    await server.indice_nombres.reconstruir()
+    duracion = time.perf_counter() - inicio
+    parar.set()
+    await asyncio.gather(*tareas[1:])
+    tareas[0].cancel()
+    await asyncio.gather(tareas[0], return_exceptions=True)
+    return {"duracion": duracion, "retrasos": sorted(retrasos), "tiempos": sorted(tiempos), "bloqueos": list(monitor.bloqueos)}
+
+
+def percentil(valores: list, p: float) -> float:
+    return valores[min(len(valores) - 1, int(len(valores) * p))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=50000)
+    parser.add_argument("--umbral-ms", type=float, default=20)
+    parser.add_argument("--trabajadores", type=int, default=2)
+    args = parser.parse_args()
+
+    db = SupabaseLocal(latencia=0.002)
+    # Pocos casos: el stand-in filtra recorriendo las tablas y eso también corre en el loop
+    sembrar(db, casos=30)
+    server._TRANSPORTE = transporte(db, paginas_expedientes(args.filas))
+    server.TIMELINE_DELTA = False
+    server.BUCLE_DESCARGAR_FILAS = 1000
+    casos = [c for c in db.tabla("expedientes") if not server.es_caso_finalizado(c["estado"])]
+
+    print(f"prefiltro de {args.filas} carátulas mientras 4 clientes consultan timelines; umbral de bloqueo {args.umbral_ms:.0f} ms")
+    print(f"{'modo':<16} {'índice s':>8} | {'retraso p99':>11} {'máx ms':>7} | {'consulta p50':>12} {'p99 ms':>7} {'n':>5} | bloqueos")
+    resultados = {}
+    for modo, pool in (("en el loop", None), (f"{args.trabajadores} trabajadores", ThreadPoolExecutor(args.trabajadores))):
+        # Los bloqueos se informan también por stderr: acá solo interesa el resumen
+        with contextlib.redirect_stderr(io.StringIO()):
+            r = resultados[modo] = await escenario(casos, pool, args.umbral_ms / 1000)
+        print(
+            f"{modo:<16} {r['duracion']:>8.2f} | {percentil(r['retrasos'], 0.99):>11.1f} {r['retrasos'][-1] * 1000:>7.1f} | "
+            f"{statistics.median(r['tiempos']) * 1000:>12.1f} {percentil(r['tiempos'], 0.99):>7.1f} {len(r['tiempos']):>5} | "
+            f"{len(r['bloqueos'])}"
+        )
+    bloqueos = resultados["en el loop"]["bloqueos"]
+    if bloqueos:
+        peor = max(bloqueos, key=lambda b: b["ms"])
+        print(f"\nbloqueo más largo en el loop: {peor['ms']} ms (tool: {peor['tool']})")
+        for linea in (peor["pila"] or [])[-6:]:
+            print(f"    {linea}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
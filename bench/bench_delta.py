@@ -0,0 +1,101 @@
+"""Benchmark: refresco de timelines por delta vs relectura completa, contra el stand-in local.
+
+    python bench/bench_delta.py [--casos 200] [--rondas 10] [--cambian 0.05] [--latencia 0.02]
+
+Cada ronda consulta todos los casos; entre rondas una fracción de los casos recibe un
+movimiento nuevo. Corre lo mismo con TIMELINE_DELTA (solo filas posteriores a la más nueva
+que se tiene) y con la lectura completa de siempre (RPC), sobre copias idénticas de los datos,
+y compara bytes recibidos, pedidos y latencia de las rondas de refresco, verificando que las
+timelines sean las mismas.
+"""
+
+import argparse
+import asyncio
+import copy
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+import server  # noqa: E402
+from standin import MOVIMIENTOS, SupabaseLocal, sembrar  # noqa: E402
+
+HEADERS = {"apikey": "bench", "Authorization": "Bearer bench"}
+
+
+def agregar_movimientos(db: SupabaseLocal, casos: list, fraccion: float, ronda: int) -> None:
+    rnd = random.Random(ronda)
+    # Más nuevo que todo lo sembrado: un movimiento que llega con fecha vieja solo lo ve la lectura completa
+    cuando = datetime.now() + timedelta(minutes=ronda)
+    for caso in rnd.sample(casos, max(1, int(len(casos) * fraccion))):
+        tipo, descripcion = rnd.choice(MOVIMIENTOS)
+        db.tabla(rnd.choice(["movimientos_pjn", "movimientos_judicial"])).append({
+            "expediente_id": caso["id"], "fecha": cuando.strftime("%Y-%m-%dT%H:%M:%S"), "tipo": tipo, "descripcion": descripcion,
+        })
+
+
+async def correr(db: SupabaseLocal, casos: list, rondas: int, fraccion: float, delta: bool):
+    server._TRANSPORTE = db.transporte()
+    server.TIMELINE_DELTA = delta
+    server.timelines.limpiar()
+    tenant = server.tenant_actual()
+    tenant.rpc_timeline = None
+    db.rpc = True
+
+    resultados = []
+    tiempos = []
+    bytes_refresco = pedidos_refresco = 0
+    for ronda in range(rondas + 1):
+        if ronda:
+            agregar_movimientos(db, casos, fraccion, ronda)
+        bytes_antes, pedidos_antes = db.bytes_enviados, len(db.pedidos)
+        for caso in casos:
+            inicio = time.perf_counter()
+            resultados.append(await server.obtener_y_generar_movimientos(
+                caso_id=caso["id"], estado_str=caso["estado"], es_srt=False,
+                es_despido=caso["tipo_caso"] == "despido", headers=HEADERS, campo_id="expediente_id",
+            ))
+            if ronda:
+                tiempos.append(time.perf_counter() - inicio)
+        if ronda:
+            bytes_refresco += db.bytes_enviados - bytes_antes
+            pedidos_refresco += len(db.pedidos) - pedidos_antes
+    return resultados, tiempos, bytes_refresco, pedidos_refresco
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--casos", type=int, default=200)
+    parser.add_argument("--rondas", type=int, default=10)
+    parser.add_argument("--cambian", type=float, default=0.05, help="fracción de casos con un movimiento nuevo por ronda")
+    parser.add_argument("--latencia", type=float, default=0.02, help="RTT simulado por pedido (s)")
+    args = parser.parse_args()
+
+    base = SupabaseLocal(latencia=args.latencia)
+    sembrar(base, casos=args.casos)
+    casos = [c for c in base.tabla("expedientes") if not server.es_caso_finalizado(c["estado"])]
+
+    filas = {}
+    for nombre, delta in (("completa", False), ("delta", True)):
+        filas[nombre] = await correr(copy.deepcopy(base), casos, args.rondas, args.cambian, delta)
+
+    n = len(casos) * args.rondas
+    print(f"casos: {len(casos)}   rondas de refresco: {args.rondas}   cambian por ronda: {args.cambian:.0%}   "
+          f"latencia simulada: {args.latencia * 1000:.0f} ms")
+    for nombre, (_, tiempos, enviados, pedidos) in filas.items():
+        ms = sorted(t * 1000 for t in tiempos)
+        print(f"{nombre:<9} KB/consulta {enviados / n / 1024:7.2f}   pedidos/consulta {pedidos / n:5.2f}   "
+              f"media {statistics.mean(ms):7.2f} ms   p95 {ms[int(len(ms) * 0.95) - 1]:7.2f} ms")
+    iguales = filas["completa"][0] == filas["delta"][0]
+    print(f"timelines idénticas: {'sí' if iguales else 'NO'}")
+    return 0 if iguales else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,152 @@
+"""Benchmark: formato de las lecturas a PostgREST (JSON con dicts vs tuplas desde JSON o CSV).
+
+    python bench/bench_formato.py [--casos 200] [--repeticiones 300]
+
+Primero toma respuestas reales del stand-in para cada lectura (movimientos de un caso, la RPC
+timeline_caso, seguimientos_auto, comunicaciones y una página del prefiltro) y compara bytes en
+el cable (crudos y con gzip, que httpx negocia igual en los dos formatos) y tiempo de
+decodificación: como se leía antes (resp.json() + dicts, con las columnas de antes) contra
+leer_tuplas con POSTGREST_FORMATO=json y =csv (el prefiltro, de una columna, queda en JSON en
+los dos: se muestra para justificarlo). Después arma todas las timelines y comunicaciones
+con los dos formatos, con y sin RPC, y verifica que las salidas sean idénticas.
+"""
+
+import argparse
+import asyncio
+import copy
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+os.environ["TIMELINE_DELTA"] = "0"
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+from standin import SupabaseLocal, sembrar  # noqa: E402
+
+HEADERS = {"apikey": "bench", "Authorization": "Bearer bench"}
+
+
+def pedir(db: SupabaseLocal, ruta: str, params: dict = None, cuerpo: dict = None, csv: bool = False) -> bytes:
+    headers = {"accept": "text/csv"} if csv else {}
+    url = f"{server.tenant_actual().url}/rest/v1/{ruta}"
+    if cuerpo is None:
+        request = httpx.Request("GET", url, params=params, headers=headers)
+    else:
+        request = httpx.Request("POST", url, content=json.dumps(cuerpo), headers=headers)
+    return db._responder(request).content
+
+
+def lecturas(db: SupabaseLocal) -> list:
+    """(nombre, ruta, params de antes, decodificación de antes, columnas, params, cuerpo RPC)."""
+    movs = {}
+    for tabla in ("movimientos_pjn", "movimientos_judicial"):
+        for m in db.tabla(tabla):
+            movs[m["expediente_id"]] = movs.get(m["expediente_id"], 0) + 1
+    caso = max(movs, key=lambda c: (sum(s.get("expediente_id") == c for s in db.tabla("seguimientos_auto")), movs[c]))
+    srt = next(c for c in db.tabla("comunicaciones_srt"))["caso_srt_id"]
+    por_caso = {"expediente_id": f"eq.{caso}", "order": "fecha.desc"}
+    rpc = {"p_caso_id": caso, "p_es_srt": False, "p_limite": 50}
+    comunicaciones = {"caso_srt_id": f"eq.{srt}", "order": "fecha_notificacion.desc", "limit": "3"}
+    pagina = {"order": "id", "limit": "1000", "offset": "0"}
+    return [
+        ("movimientos", "movimientos_pjn", {"select": "fecha,tipo,descripcion", **por_caso, "limit": "50"},
+         lambda datos: [{"origen": "movimientos_pjn", **m} for m in datos],
+         ("fecha", "tipo", "descripcion"), {**por_caso, "limit": "50"}, None),
+        ("rpc timeline", "rpc/timeline_caso", None, lambda datos: [f for f in datos if f.get("origen")],
+         server._COLUMNAS_RPC_TIMELINE, None, rpc),
+        ("seguimientos", "seguimientos_auto", {"select": "fecha,tipo,descripcion", **por_caso}, lambda datos: datos,
+         server._COLUMNAS_SEGUIMIENTOS, por_caso, None),
+        ("comunicaciones", "comunicaciones_srt", {"select": "fecha_notificacion,tipo_comunicacion,detalle,estado", **comunicaciones},
+         lambda datos: [{"fecha": c.get("fecha_notificacion", ""), "tipo": c.get("tipo_comunicacion", ""),
+                         "detalle": c.get("detalle", "")} for c in datos],
+         ("fecha_notificacion", "tipo_comunicacion", "detalle"), comunicaciones, None),
+        ("prefiltro", "expedientes", {"select": "caratula", **pagina}, lambda datos: [f.get("caratula") for f in datos],
+         ("caratula",), pagina, None),
+    ]
+
+
+def cronometrar(funcion, repeticiones: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+def comparar_cuerpos(db: SupabaseLocal, repeticiones: int) -> None:
+    print(f"{'lectura':<15} {'filas':>5} | {'KB antes':>8} {'json':>6} {'csv':>6} | {'gzip antes':>10} {'json':>6} {'csv':>6} | "
+          f"{'µs antes':>8} {'json':>7} {'csv':>7}")
+    for nombre, ruta, params_antes, decodificar_antes, columnas, params, cuerpo in lecturas(db):
+        if cuerpo is not None:
+            antes = crudo_json = pedir(db, ruta, cuerpo=cuerpo)
+            crudo_csv = pedir(db, ruta, cuerpo=cuerpo, csv=True)
+        else:
+            antes = pedir(db, ruta, params_antes)
+            seleccion = {"select": ",".join(columnas), **params}
+            crudo_json = pedir(db, ruta, seleccion)
+            crudo_csv = pedir(db, ruta, seleccion, csv=True)
+        texto_csv = crudo_csv.decode()
+        us_antes = cronometrar(lambda: decodificar_antes(json.loads(antes)), repeticiones)
+        us_json = cronometrar(lambda: server._tuplas_json(json.loads(crudo_json), columnas), repeticiones)
+        us_csv = cronometrar(lambda: server._tuplas_csv(texto_csv, columnas), repeticiones)
+        n = len(json.loads(crudo_json))
+        kb = [len(b) / 1024 for b in (antes, crudo_json, crudo_csv)]
+        gz = [len(gzip.compress(b)) / 1024 for b in (antes, crudo_json, crudo_csv)]
+        print(f"{nombre:<15} {n:>5} | {kb[0]:>8.2f} {kb[1]:>6.2f} {kb[2]:>6.2f} | {gz[0]:>10.2f} {gz[1]:>6.2f} {gz[2]:>6.2f} | "
+              f"{us_antes:>8.1f} {us_json:>7.1f} {us_csv:>7.1f}")
+
+
+async def armar_todo(db: SupabaseLocal, formato: str, rpc: bool) -> tuple:
+    server._TRANSPORTE = db.transporte()
+    server.POSTGREST_FORMATO = formato
+    server.timelines.limpiar()
+    server.tenant_actual().rpc_timeline = None
+    db.rpc = rpc
+    casos = [c for c in db.tabla("expedientes") if not server.es_caso_finalizado(c["estado"])]
+    resultados = []
+    bytes_antes = db.bytes_enviados
+    # Dos pasadas: en la segunda ya hay seguimientos guardados para leer
+    for _ in range(2):
+        for caso in casos:
+            resultados.append(await server.obtener_y_generar_movimientos(
+                caso_id=caso["id"], estado_str=caso["estado"], es_srt=False,
+                es_despido=caso["tipo_caso"] == "despido", headers=HEADERS, campo_id="expediente_id",
+            ))
+        await asyncio.sleep(0)
+    for caso in db.tabla("casos_srt"):
+        resultados.append(await server.leer_comunicaciones_srt(caso["id"], caso.get("numero_srt"), HEADERS))
+    return resultados, db.bytes_enviados - bytes_antes
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--casos", type=int, default=200)
+    parser.add_argument("--repeticiones", type=int, default=300)
+    args = parser.parse_args()
+
+    base = SupabaseLocal(rpc=True)
+    sembrar(base, casos=args.casos)
+    # Una pasada previa deja seguimientos guardados, como en una base en uso
+    await armar_todo(base, "json", True)
+    comparar_cuerpos(base, args.repeticiones)
+
+    print()
+    distintos = 0
+    for rpc in (False, True):
+        salidas = {}
+        for formato in ("json", "csv"):
+            salidas[formato] = await armar_todo(copy.deepcopy(base), formato, rpc)
+        iguales = salidas["json"][0] == salidas["csv"][0]
+        distintos += not iguales
+        print(f"{'rpc' if rpc else 'rest':<5} KB recibidos json {salidas['json'][1] / 1024:8.1f}   csv {salidas['csv'][1] / 1024:8.1f}   "
+              f"salidas idénticas: {'sí' if iguales else 'NO'}")
+    return 1 if distintos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
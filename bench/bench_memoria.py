@@ -0,0 +1,114 @@
+"""Benchmark: memoria de las respuestas de Supabase en Python y pico de memoria por tool.
+
+    python bench/bench_memoria.py [--filas 50 200 1000 5000] [--llamadas 40]
+
+Primero mide cuánto ocupa en el heap de Python (tracemalloc) el resp.json() de un pedido de
+movimientos y de seguimientos_auto de N filas, contra los bytes recibidos. Después corre las
+cuatro tools contra el stand-in con MEMORIA_ACTIVA=1 y MEMORIA_MUESTREO=1 (cada llamada
+medida, de a una) y resume el pico por tool, como lo ve /debug/memoria.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+os.environ["MEMORIA_ACTIVA"] = "1"
+os.environ["MEMORIA_MUESTREO"] = "1"
+# Con tracemalloc todo va más lento: el monitor del loop informaría bloqueos en cada llamada
+os.environ.setdefault("BUCLE_MONITOR", "0")
+os.environ.setdefault("RATE_LIMIT_POR_MINUTO", "0")
+os.environ.setdefault("PREFETCH_MAX_CASOS", "0")
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+from fastmcp import Client  # noqa: E402
+from standin import MOVIMIENTOS, SupabaseLocal, sembrar  # noqa: E402
+
+
+def filas_movimientos(n: int) -> list:
+    rnd = random.Random(n)
+    hoy = datetime(2026, 6, 1)
+    return [
+        {"fecha": (hoy - timedelta(days=rnd.randint(0, 900))).strftime("%Y-%m-%dT%H:%M:%S"), "tipo": t, "descripcion": d}
+        for t, d in (rnd.choice(MOVIMIENTOS) for _ in range(n))
+    ]
+
+
+def filas_seguimientos(n: int) -> list:
+    hoy = datetime(2026, 6, 1)
+    return [
+        {"fecha": (hoy - timedelta(days=3 * i)).strftime("%Y-%m-%d"), "tipo": "control_plazos", "descripcion": "Control de plazos procesales"}
+        for i in range(n)
+    ]
+
+
+def expansion(filas: list) -> tuple:
+    """(bytes en el cable, bytes en el heap tras resp.json())."""
+    respuesta = httpx.Response(200, content=json.dumps(filas).encode())
+    respuesta.read()
+    tracemalloc.reset_peak()
+    antes = tracemalloc.get_traced_memory()[0]
+    datos = respuesta.json()
+    despues = tracemalloc.get_traced_memory()[0]
+    del datos
+    return len(respuesta.content), despues - antes
+
+
+async def picos_por_tool(llamadas: int) -> dict:
+    db = SupabaseLocal()
+    sembrar(db, casos=200)
+    server._TRANSPORTE = db.transporte()
+    rnd = random.Random(1)
+    expedientes = db.tabla("expedientes")
+    srt = db.tabla("casos_srt")
+    async with Client(server.mcp) as cliente:
+        for _ in range(llamadas):
+            e, s = rnd.choice(expedientes), rnd.choice(srt)
+            await cliente.call_tool("buscar_caso", {"nombre": e["caratula"].split(" C/")[0]})
+            await cliente.call_tool("consultar_movimientos", {"expediente_id": e["id"]})
+            await cliente.call_tool("buscar_caso_srt", {"nombre": s["nombre"].split()[0]})
+            await cliente.call_tool("consultar_movimientos_srt", {"caso_srt_id": s["id"]})
+    picos = {}
+    for (nombre, etiquetas), h in server.metricas.histogramas.items():
+        if nombre == "tool_memoria_pico_bytes":
+            picos[dict(etiquetas)["tool"]] = h
+    return picos
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, nargs="+", default=[50, 200, 1000, 5000])
+    parser.add_argument("--llamadas", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{'filas':>6} | {'movs KB':>8} {'heap KB':>8} {'x':>5} | {'segs KB':>8} {'heap KB':>8} {'x':>5}")
+    for n in args.filas:
+        cable_m, heap_m = expansion(filas_movimientos(n))
+        cable_s, heap_s = expansion(filas_seguimientos(n))
+        print(
+            f"{n:>6} | {cable_m / 1024:>8.1f} {heap_m / 1024:>8.1f} {heap_m / cable_m:>5.1f} | "
+            f"{cable_s / 1024:>8.1f} {heap_s / 1024:>8.1f} {heap_s / cable_s:>5.1f}"
+        )
+
+    picos = asyncio.run(picos_por_tool(args.llamadas))
+    print()
+    print(f"{'tool':<28} {'llamadas':>8} {'media KB':>9} {'máx KB':>8}")
+    for tool, h in sorted(picos.items()):
+        print(f"{tool:<28} {h['total']:>8} {h['suma'] / h['total'] / 1024:>9.1f} {server.memoria.picos[tool] / 1024:>8.1f}")
+    proceso = server.memoria_proceso()
+    if proceso:
+        print("\nproceso: " + "   ".join(f"{k} {v / 2 ** 20:.1f} MB" for k, v in proceso.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Benchmark: armado de la timeline (post-lectura) con la mezcla perezosa vs el camino anterior.
+
+    python bench/bench_merge.py [--movs 100] [--segs 300] [--nuevos 20] [--repeticiones 2000]
+
+El camino anterior traducía todos los movimientos, armaba dicts por etapa, concatenaba todo,
+lo ordenaba completo y recién después filtraba y cortaba en 20. El actual arma registros
+compactos, mezcla las fuentes ya ordenadas con heapq.merge y corta al llegar a 20. Mide tiempo
+por llamada y asignaciones (tracemalloc) y verifica que las dos salidas sean idénticas.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+import server  # noqa: E402
+from standin import MOVIMIENTOS  # noqa: E402
+
+
+def anterior(filas_movs, filas_segs, nuevos_generados, es_srt):
+    """El armado tal como estaba antes (sin la generación, que es igual en los dos)."""
+    movs_reales = []
+    for _, fecha, tipo, descripcion in filas_movs:
+        movs_reales.append({
+            "fecha": (fecha or "")[:10],
+            "descripcion": server.traducir_movimiento(tipo, descripcion, es_srt=es_srt),
+            "real": True,
+        })
+    segs_guardados = []
+    for fecha, tipo, descripcion in filas_segs:
+        segs_guardados.append({
+            "fecha": (fecha or "")[:10],
+            "tipo": tipo,
+            "descripcion": descripcion,
+            "real": False,
+        })
+    movs_reales = [m for m in movs_reales if m["fecha"] and len(m["fecha"]) >= 10]
+    segs_guardados = [s for s in segs_guardados if s["fecha"] and len(s["fecha"]) >= 10]
+    movs_reales.sort(key=lambda x: x["fecha"], reverse=True)
+    if movs_reales:
+        primer = datetime.strptime(movs_reales[-1]["fecha"], "%Y-%m-%d").strftime("%Y-%m-%d")
+        segs_guardados = [s for s in segs_guardados if s["fecha"] >= primer]
+
+    todos = []
+    for m in movs_reales:
+        todos.append({"fecha": m["fecha"], "descripcion": m["descripcion"], "tipo_entrada": "judicial"})
+    for s in segs_guardados:
+        todos.append({"fecha": s["fecha"], "descripcion": s["descripcion"], "tipo_entrada": "estudio"})
+    for s in nuevos_generados:
+        todos.append({"fecha": s["fecha"], "descripcion": s["descripcion"], "tipo_entrada": "estudio"})
+    todos.sort(key=lambda x: x["fecha"], reverse=True)
+    filtrados = []
+    for item in todos:
+        if item["tipo_entrada"] != "estudio":
+            filtrados.append(item)
+        elif not filtrados or filtrados[-1].get("descripcion") != item["descripcion"]:
+            filtrados.append(item)
+    return [{"fecha": i["fecha"], "descripcion": i["descripcion"]} for i in filtrados[:20]]
+
+
+def actual(filas_movs, filas_segs, nuevos_generados, es_srt):
+    movs, segs = server.preparar_fuentes(filas_movs, filas_segs)
+    nuevos = sorted(
+        (server.Registro(s["fecha"], s["tipo"], s["descripcion"], False) for s in nuevos_generados),
+        key=server._fecha_registro, reverse=True,
+    )
+    return server.fusionar_timeline(movs, segs, nuevos, es_srt)
+
+
+def armar(movs: int, segs: int, nuevos: int, seed: int = 1):
+    """Tuplas como las devuelve la lectura: cada tabla ordenada por fecha desc."""
+    rnd = random.Random(seed)
+    hoy = datetime(2026, 6, 1)
+    por_tabla = {"movimientos_pjn": [], "movimientos_judicial": []}
+    for _ in range(movs):
+        tabla = rnd.choice(list(por_tabla))
+        tipo, descripcion = rnd.choice(MOVIMIENTOS)
+        fecha = hoy - timedelta(days=rnd.randint(0, 900), minutes=rnd.randint(0, 600))
+        por_tabla[tabla].append((tabla, fecha.strftime("%Y-%m-%dT%H:%M:%S"), tipo, descripcion))
+    filas_movs = []
+    for filas in por_tabla.values():
+        filas_movs.extend(sorted(filas, key=lambda f: f[1], reverse=True))
+    textos = ["Control de plazos procesales", "Revisión del expediente", "Seguimiento con el cliente"]
+    filas_segs = sorted(
+        (((hoy - timedelta(days=rnd.randint(0, 900))).strftime("%Y-%m-%d"), "control", rnd.choice(textos))
+         for _ in range(segs)),
+        key=lambda f: f[0], reverse=True,
+    )
+    nuevos_generados = [
+        {"fecha": (hoy - timedelta(days=rnd.randint(0, 30))).strftime("%Y-%m-%d"), "tipo": "control", "descripcion": rnd.choice(textos)}
+        for _ in range(nuevos)
+    ]
+    return filas_movs, filas_segs, nuevos_generados
+
+
+def medir(funcion, datos, repeticiones: int):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(*datos, False)
+    us = (time.perf_counter() - inicio) / repeticiones * 1e6
+
+    tracemalloc.start()
+    resultado = funcion(*datos, False)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return us, pico, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--movs", type=int, default=100)
+    parser.add_argument("--segs", type=int, default=300)
+    parser.add_argument("--nuevos", type=int, default=20)
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    distintos = 0
+    print(f"{'semilla':>7} | {'anterior µs':>11} {'pico KB':>8} | {'actual µs':>9} {'pico KB':>8} | iguales")
+    for seed in range(1, 6):
+        datos = armar(args.movs, args.segs, args.nuevos, seed)
+        us_a, pico_a, r_a = medir(anterior, datos, args.repeticiones)
+        us_n, pico_n, r_n = medir(actual, datos, args.repeticiones)
+        distintos += r_a != r_n
+        print(
+            f"{seed:>7} | {us_a:>11.1f} {pico_a / 1024:>8.1f} | {us_n:>9.1f} {pico_n / 1024:>8.1f} | "
+            f"{'sí' if r_a == r_n else 'NO'}"
+        )
+    return 1 if distintos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
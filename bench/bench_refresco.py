@@ -0,0 +1,154 @@
+"""Benchmark: refresco anticipado de los casos más consultados, con tiempos comprimidos.
+
+    python bench/bench_refresco.py [--segundos 40] [--ttl 2] [--frecuentes 10] [--ocasionales 150] [--latencia 0.02] [--sin-rpc]
+
+La lectura completa de una timeline vence a los `ttl` segundos (TIMELINE_COMPLETA_SEG, 900 s en
+producción). Unos pocos clientes frecuentes preguntan por su caso cada ~1,5 ttl (como quien
+pregunta varias veces por día); muchos ocasionales preguntan una vez; cada ttl llega un
+movimiento nuevo a alguno de los casos frecuentes. Las mismas consultas, por el cliente MCP en
+memoria y contra copias idénticas del stand-in, corren sin y con el refresco anticipado. Se
+mide, para los frecuentes, qué fracción encontró la timeline viva (lectura delta) y la
+latencia; en total, los pedidos a Supabase y las relecturas de fondo; y se verifica que las
+respuestas sean las mismas (los huecos que abre un movimiento traído por la relectura también
+se rellenan).
+"""
+
+import argparse
+import asyncio
+import copy
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+os.environ.setdefault("RATE_LIMIT_POR_MINUTO", "0")
+os.environ.setdefault("BUCLE_MONITOR", "0")
+
+
+def parsear():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segundos", type=float, default=40)
+    parser.add_argument("--ttl", type=float, default=2, help="TIMELINE_COMPLETA_SEG comprimido")
+    parser.add_argument("--frecuentes", type=int, default=10)
+    parser.add_argument("--ocasionales", type=int, default=150)
+    parser.add_argument("--latencia", type=float, default=0.02, help="RTT simulado por pedido (s)")
+    parser.add_argument("--sin-rpc", action="store_true", help="timeline_caso no instalada: lectura completa por REST")
+    return parser.parse_args()
+
+
+ARGS = parsear()
+# Las escalas del refresco se comprimen igual que el ttl (900 s -> ttl)
+ESCALA = ARGS.ttl / 900
+os.environ["TIMELINE_COMPLETA_SEG"] = str(ARGS.ttl)
+os.environ["REFRESCO_INTERVALO_SEG"] = str(30 * ESCALA)
+os.environ["REFRESCO_ANTELACION_SEG"] = str(90 * ESCALA)
+os.environ["REFRESCO_VIDA_MEDIA_H"] = str(72 * ESCALA)
+os.environ["REFRESCO_MAX_POR_MINUTO"] = str(20 / ESCALA)
+# El ciclo de vida del server corre una sola vez: la tarea de refresco la lanza cada corrida
+os.environ["REFRESCO_CASOS"] = "0"
+
+import server  # noqa: E402
+from fastmcp import Client  # noqa: E402
+from standin import MOVIMIENTOS, SupabaseLocal, sembrar  # noqa: E402
+
+
+def agenda(casos: list) -> list:
+    """[(segundo, expediente_id, tipo)] ordenada por tiempo; tipo: frecuente, ocasional o movimiento."""
+    rnd = random.Random(7)
+    frecuentes, ocasionales = casos[:ARGS.frecuentes], casos[ARGS.frecuentes:ARGS.frecuentes + ARGS.ocasionales]
+    consultas = []
+    for caso in frecuentes:
+        t = rnd.uniform(0, ARGS.ttl)
+        while t < ARGS.segundos:
+            consultas.append((t, caso["id"], "frecuente"))
+            t += rnd.expovariate(1 / (1.5 * ARGS.ttl))
+    for caso in ocasionales:
+        consultas.append((rnd.uniform(0, ARGS.segundos), caso["id"], "ocasional"))
+    for i in range(1, int(ARGS.segundos / ARGS.ttl)):
+        consultas.append((i * ARGS.ttl, rnd.choice(frecuentes)["id"], "movimiento"))
+    return sorted(consultas)
+
+
+def agregar_movimiento(db: SupabaseLocal, expediente_id: int, n: int) -> None:
+    # Más nuevo que todo lo sembrado, con un hueco desde el movimiento anterior
+    tipo, descripcion = MOVIMIENTOS[n % len(MOVIMIENTOS)]
+    db.tabla("movimientos_pjn").append({
+        "expediente_id": expediente_id, "fecha": (datetime.now() + timedelta(minutes=n)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "tipo": tipo, "descripcion": descripcion,
+    })
+
+
+def contador(nombre: str, **etiquetas) -> float:
+    return server.metricas.contadores.get((nombre, tuple(sorted(etiquetas.items()))), 0)
+
+
+async def correr(db: SupabaseLocal, consultas: list, refresco: bool) -> dict:
+    server._TRANSPORTE = db.transporte()
+    server.timelines.limpiar()
+    server.popularidad._puntajes.clear()
+    server.metricas.contadores.clear()
+    tenant = server.tenant_actual()
+    tenant.rpc_timeline = False if ARGS.sin_rpc else None
+    tenant.rpc_probada_en = time.monotonic()
+    tiempos, respuestas, vivas, pedidos_antes = [], [], 0, len(db.pedidos)
+    server.REFRESCO_CASOS = 50 if refresco else 0
+    tarea = asyncio.create_task(server._refresco_anticipado())
+    async with Client(server.mcp) as cliente:
+        inicio = time.monotonic()
+        for n, (segundo, expediente_id, tipo) in enumerate(consultas):
+            await asyncio.sleep(max(0.0, inicio + segundo - time.monotonic()))
+            if tipo == "movimiento":
+                agregar_movimiento(db, expediente_id, n)
+                continue
+            deltas = contador("timeline_lecturas_total", tipo="delta")
+            t0 = time.perf_counter()
+            resultado = await cliente.call_tool("consultar_movimientos", {"expediente_id": expediente_id})
+            respuestas.append(resultado.content[0].text)
+            if tipo == "frecuente":
+                tiempos.append(time.perf_counter() - t0)
+                vivas += contador("timeline_lecturas_total", tipo="delta") > deltas
+    tarea.cancel()
+    await asyncio.gather(tarea, return_exceptions=True)
+    return {
+        "tiempos": tiempos,
+        "respuestas": respuestas,
+        "vivas": vivas,
+        "pedidos": len(db.pedidos) - pedidos_antes,
+        "relecturas": contador("refresco_lecturas_total", resultado="ok"),
+        "aciertos": contador("refresco_aciertos_total", tipo="exp"),
+    }
+
+
+async def main():
+    db = SupabaseLocal(latencia=ARGS.latencia, rpc=not ARGS.sin_rpc)
+    sembrar(db, casos=300)
+    con_movs = {m["expediente_id"] for t in ("movimientos_pjn", "movimientos_judicial") for m in db.tabla(t)}
+    casos = [c for c in db.tabla("expedientes") if c["id"] in con_movs and not server.es_caso_finalizado(c["estado"])]
+    consultas = agenda(casos)
+    n_frecuentes = sum(t == "frecuente" for _, _, t in consultas)
+    n_ocasionales = sum(t == "ocasional" for _, _, t in consultas)
+    print(f"{n_frecuentes + n_ocasionales} consultas en {ARGS.segundos:.0f} s (ttl {ARGS.ttl:g} s): {n_frecuentes} de "
+          f"{ARGS.frecuentes} clientes frecuentes, {n_ocasionales} ocasionales; "
+          f"{len(consultas) - n_frecuentes - n_ocasionales} movimientos nuevos")
+    print(f"{'refresco':<10} | {'frecuentes: viva':>16} {'p50 ms':>7} {'p90 ms':>7} | {'pedidos':>7} {'relecturas':>10} {'aciertos':>8}")
+    salidas = {}
+    for refresco in (False, True):
+        r = await correr(copy.deepcopy(db), consultas, refresco)
+        salidas[refresco] = r["respuestas"]
+        tiempos = sorted(r["tiempos"])
+        print(
+            f"{'sí' if refresco else 'no':<10} | {r['vivas'] / n_frecuentes:>16.0%} {statistics.median(tiempos) * 1000:>7.1f} "
+            f"{tiempos[int(len(tiempos) * 0.9)] * 1000:>7.1f} | {r['pedidos']:>7} {r['relecturas']:>10.0f} {r['aciertos']:>8.0f}"
+        )
+    iguales = salidas[False] == salidas[True]
+    print(f"respuestas idénticas: {'sí' if iguales else 'NO'}")
+    return 0 if iguales else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
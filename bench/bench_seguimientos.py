@@ -0,0 +1,96 @@
+"""Benchmark: costo por llamada a medida que crece la historia de seguimientos_auto de un caso.
+
+    python bench/bench_seguimientos.py [--historia 0 500 1000 2000 5000] [--llamadas 20]
+
+Arma un caso con 100 movimientos reales en los últimos dos años y agrega N seguimientos
+históricos anteriores a esa ventana. Compara la lectura acotada a la ventana (la actual) con
+la lectura completa de antes, midiendo el tiempo por llamada del lado del server (sin contar
+el trabajo del stand-in) y los bytes recibidos, y verifica que las dos den la misma timeline.
+"""
+
+import argparse
+import asyncio
+import copy
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+# Mide la lectura completa en cada llamada
+os.environ.setdefault("TIMELINE_DELTA", "0")
+
+import server  # noqa: E402
+from standin import MOVIMIENTOS, SupabaseLocal  # noqa: E402
+
+HEADERS = {"apikey": "bench", "Authorization": "Bearer bench"}
+CASO = 1
+_inicio_ventana = server._inicio_ventana
+
+
+def armar_caso(historia: int) -> SupabaseLocal:
+    db = SupabaseLocal()
+    hoy = datetime.now()
+    db.tabla("expedientes").append({"id": CASO, "caratula": "PEREZ JUAN C/ ART", "estado": "15", "tipo_caso": "accidente"})
+    for i in range(100):
+        tipo, descripcion = MOVIMIENTOS[i % len(MOVIMIENTOS)]
+        fecha = (hoy - timedelta(days=7 * i + 3)).strftime("%Y-%m-%dT10:00:00")
+        db.tabla("movimientos_pjn").append({"expediente_id": CASO, "fecha": fecha, "tipo": tipo, "descripcion": descripcion})
+    # Historia vieja: un seguimiento cada 3 días hacia atrás desde antes de la ventana
+    inicio_historia = hoy - timedelta(days=7 * 100 + 30)
+    for i in range(historia):
+        db.tabla("seguimientos_auto").append({
+            "id": i + 1, "expediente_id": CASO, "caso_srt_id": None,
+            "fecha": (inicio_historia - timedelta(days=3 * i)).strftime("%Y-%m-%d"),
+            "tipo": "control_plazos", "descripcion": "Control de plazos procesales",
+        })
+    return db
+
+
+async def medir(db: SupabaseLocal, llamadas: int, acotada: bool):
+    server._TRANSPORTE = db.transporte()
+    tenant = server.tenant_actual()
+    tenant.rpc_timeline = False
+    tenant.rpc_probada_en = time.monotonic()
+    # La lectura completa de antes: sin ventana ni límite
+    server._inicio_ventana = _inicio_ventana if acotada else (lambda movs: None)
+    server.SEGUIMIENTOS_SIN_MOVS_LIMITE = 200 if acotada else 10 ** 9
+
+    tiempos = []
+    resultado = None
+    for _ in range(llamadas):
+        inicio = time.perf_counter()
+        servidor = db.segundos_servidor
+        resultado = await server.obtener_y_generar_movimientos(CASO, "15", False, False, HEADERS, "expediente_id")
+        tiempos.append(time.perf_counter() - inicio - (db.segundos_servidor - servidor))
+    return statistics.median(tiempos) * 1000, db.bytes_enviados / llamadas, resultado
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--historia", type=int, nargs="+", default=[0, 500, 1000, 2000, 5000])
+    parser.add_argument("--llamadas", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'historia':>9} | {'completa ms':>11} {'KB/llamada':>10} | {'acotada ms':>10} {'KB/llamada':>10} | iguales")
+    distintos = 0
+    for historia in args.historia:
+        base = armar_caso(historia)
+        # Una llamada previa persiste los seguimientos de la ventana, como en producción
+        await medir(copy.deepcopy(base), 1, acotada=True)
+        ms_c, bytes_c, r_c = await medir(copy.deepcopy(base), args.llamadas, acotada=False)
+        ms_a, bytes_a, r_a = await medir(copy.deepcopy(base), args.llamadas, acotada=True)
+        distintos += r_c != r_a
+        print(
+            f"{historia:>9} | {ms_c:>11.2f} {bytes_c / 1024:>10.1f} | {ms_a:>10.2f} {bytes_a / 1024:>10.1f} | "
+            f"{'sí' if r_c == r_a else 'NO'}"
+        )
+    server._inicio_ventana = _inicio_ventana
+    return 1 if distintos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,86 @@
+"""Benchmark: timeline por RPC (timeline_caso) vs consultas separadas, contra el stand-in local.
+
+    python bench/bench_timeline.py [--casos 200] [--latencia 0.02]
+
+Corre obtener_y_generar_movimientos para los mismos casos por los dos caminos, sobre copias
+idénticas de los datos, verifica que el resultado sea el mismo y compara latencia y pedidos.
+"""
+
+import argparse
+import asyncio
+import copy
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+# Mide la lectura completa en cada llamada
+os.environ.setdefault("TIMELINE_DELTA", "0")
+
+import server  # noqa: E402
+from standin import SupabaseLocal, sembrar  # noqa: E402
+
+HEADERS = {"apikey": "bench", "Authorization": "Bearer bench"}
+
+
+async def correr(db: SupabaseLocal, casos: list, usar_rpc: bool):
+    server._TRANSPORTE = db.transporte()
+    tenant = server.tenant_actual()
+    tenant.rpc_timeline = None if usar_rpc else False
+    tenant.rpc_probada_en = time.monotonic()
+    db.rpc = usar_rpc
+
+    tiempos = []
+    resultados = {}
+    for caso in casos:
+        inicio = time.perf_counter()
+        resultados[caso["id"]] = await server.obtener_y_generar_movimientos(
+            caso_id=caso["id"],
+            estado_str=caso["estado"],
+            es_srt=False,
+            es_despido=caso["tipo_caso"] == "despido",
+            headers=HEADERS,
+            campo_id="expediente_id",
+        )
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos, resultados
+
+
+def resumen(nombre: str, tiempos: list, pedidos: int, casos: int) -> str:
+    ms = sorted(t * 1000 for t in tiempos)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    return (
+        f"{nombre:<14} media {statistics.mean(ms):7.2f} ms   p50 {statistics.median(ms):7.2f} ms   "
+        f"p95 {p95:7.2f} ms   pedidos/caso {pedidos / casos:.2f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--casos", type=int, default=200)
+    parser.add_argument("--latencia", type=float, default=0.02, help="RTT simulado por pedido (s)")
+    args = parser.parse_args()
+
+    base = SupabaseLocal(latencia=args.latencia)
+    sembrar(base, casos=args.casos)
+    casos = base.tabla("expedientes")
+
+    rest = copy.deepcopy(base)
+    rpc = copy.deepcopy(base)
+
+    t_rest, r_rest = await correr(rest, casos, usar_rpc=False)
+    t_rpc, r_rpc = await correr(rpc, casos, usar_rpc=True)
+
+    distintos = [c for c in r_rest if r_rest[c] != r_rpc[c]]
+    print(f"casos: {len(casos)}   latencia simulada: {args.latencia * 1000:.0f} ms")
+    print(resumen("consultas", t_rest, len(rest.pedidos), len(casos)))
+    print(resumen("rpc", t_rpc, len(rpc.pedidos), len(casos)))
+    print(f"resultados idénticos: {'sí' if not distintos else f'NO ({len(distintos)} casos difieren)'}")
+    return 1 if distintos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,179 @@
+"""Presupuestos de pedidos a Supabase por tool: falla si una llamada se pasa de lo declarado.
+
+    python bench/presupuestos.py [--presupuestos bench/presupuestos.json] [--latencia 0.2] [--escenario consultar] [--detalle]
+    python -m pytest tests/    (tests/test_presupuestos.py: los mismos escenarios, falla si alguno se pasa)
+
+Corre cada escenario de presupuestos.json como una llamada MCP real (cliente en memoria, con
+el middleware de admisión) contra el stand-in con una latencia fija por pedido, siempre sobre
+un caso que no se tocó antes. Por llamada mide:
+
+    pedidos       pedidos hechos por la llamada (prioridad de la tool)
+    concurrencia  máximo de esos pedidos en vuelo a la vez
+    rtt           duración de la llamada en latencias simuladas (idas y vueltas en serie)
+    fondo         pedidos que la llamada deja en segundo plano (prefetch, prioridad lote)
+
+y lo compara con el presupuesto del escenario. Sale con 1 si alguno se pasa: un refactor que
+vuelve a poner un pedido en serie o un N+1 en una tool aparece acá antes que en producción.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://supabase.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+os.environ.setdefault("RATE_LIMIT_POR_MINUTO", "0")
+
+import server  # noqa: E402
+from fastmcp import Client  # noqa: E402
+from standin import SupabaseLocal, sembrar  # noqa: E402
+
+PRESUPUESTOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "presupuestos.json")
+# Margen de rtt para el tiempo de CPU propio de la llamada
+TOLERANCIA_RTT = 0.5
+MEDIDAS = ("pedidos", "concurrencia", "rtt", "fondo")
+
+
+class SupabaseRegistrada(SupabaseLocal):
+    """Stand-in que anota inicio, fin y prioridad de cada pedido."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.intervalos = []  # (inicio, fin, prioridad, método, ruta)
+
+    async def manejar(self, request):
+        inicio = time.monotonic()
+        try:
+            return await super().manejar(request)
+        finally:
+            self.intervalos.append((inicio, time.monotonic(), server._prioridad.get(), request.method, request.url.path))
+
+
+def max_simultaneos(intervalos: list) -> int:
+    eventos = sorted([(i, 1) for i, _, *_ in intervalos] + [(f, -1) for _, f, *_ in intervalos])
+    en_vuelo = maximo = 0
+    for _, delta in eventos:
+        en_vuelo += delta
+        maximo = max(maximo, en_vuelo)
+    return maximo
+
+
+class Casos:
+    """Entrega casos sin usar (activos, con movimientos) para que cada escenario empiece en frío."""
+
+    def __init__(self, db: SupabaseLocal):
+        con_movs = {m["expediente_id"] for t in ("movimientos_pjn", "movimientos_judicial") for m in db.tabla(t)}
+        con_movs_srt = {m["caso_srt_id"] for m in db.tabla("movimientos_srt")}
+        nombres = [e["caratula"].split(" C/")[0] for e in db.tabla("expedientes")]
+        self._libres = {
+            "exp": iter([
+                e for e in db.tabla("expedientes")
+                if e["id"] in con_movs and not server.es_caso_finalizado(e["estado"])
+                and nombres.count(e["caratula"].split(" C/")[0]) == 1
+            ]),
+            "srt": iter([c for c in db.tabla("casos_srt") if c["activo"] and c["id"] in con_movs_srt]),
+        }
+
+    def siguiente(self, tipo: str) -> dict:
+        return next(self._libres[tipo])
+
+
+def argumentos(tool: str, caso: dict) -> dict:
+    if tool == "buscar_caso":
+        return {"nombre": caso["caratula"].split(" C/")[0]}
+    if tool == "buscar_caso_srt":
+        return {"nombre": caso["nombre"]}
+    if tool == "consultar_movimientos":
+        return {"expediente_id": caso["id"]}
+    return {"caso_srt_id": caso["id"]}
+
+
+async def esperar_fondo(db: SupabaseRegistrada, latencia: float) -> None:
+    """Hasta que no quede nada en vuelo ni aparezcan pedidos nuevos."""
+    while True:
+        antes = len(db.intervalos)
+        await asyncio.sleep(latencia * 3)
+        if db.en_vuelo == 0 and len(db.intervalos) == antes:
+            return
+
+
+async def medir(cliente: Client, db: SupabaseRegistrada, latencia: float, tool: str, args: dict) -> dict:
+    desde = len(db.intervalos)
+    inicio = time.monotonic()
+    await cliente.call_tool(tool, args)
+    segundos = time.monotonic() - inicio
+    await esperar_fondo(db, latencia)
+    propios = [i for i in db.intervalos[desde:] if i[2] != server.PRIORIDAD_LOTE]
+    return {
+        "pedidos": len(propios),
+        "concurrencia": max_simultaneos(propios),
+        "rtt": segundos / latencia,
+        "fondo": len(db.intervalos) - desde - len(propios),
+        "detalle": [f"{m} {r.removeprefix('/rest/v1/')}" for _, _, _, m, r in propios],
+    }
+
+
+async def correr(escenarios: dict, latencia: float, filtro: str, detalle: bool) -> int:
+    db = SupabaseRegistrada(latencia=latencia)
+    sembrar(db, casos=300)
+    server._TRANSPORTE = db.transporte()
+    casos = Casos(db)
+    excedidos = 0
+    async with Client(server.mcp) as cliente:
+        await server.indice_nombres.reconstruir()
+        print(f"latencia simulada {latencia * 1000:.0f} ms   (medido / presupuesto)")
+        print(f"{'escenario':<50} {'pedidos':>9} {'concurr.':>9} {'rtt':>11} {'fondo':>9}")
+        for nombre, escenario in escenarios.items():
+            if filtro and filtro not in nombre:
+                continue
+            tool = escenario["tool"]
+            # Sin RPC: la migración no está aplicada y el server ya lo sabe (no la vuelve a probar)
+            db.rpc = escenario.get("rpc", False)
+            tenant = server.tenant_actual()
+            tenant.rpc_timeline = None if db.rpc else False
+            tenant.rpc_probada_en = time.monotonic()
+            caso = casos.siguiente("srt" if tool.endswith("_srt") else "exp")
+            args = escenario.get("argumentos") or argumentos(tool, caso)
+            for previa in escenario.get("antes", []):
+                await cliente.call_tool(previa, escenario.get("argumentos") or argumentos(previa, caso))
+                await esperar_fondo(db, latencia)
+            medido = await medir(cliente, db, latencia, tool, args)
+
+            presupuesto = escenario["presupuesto"]
+            pasados = [
+                m for m in MEDIDAS
+                if m in presupuesto and medido[m] > presupuesto[m] + (TOLERANCIA_RTT if m == "rtt" else 0)
+            ]
+            celdas = [
+                f"{medido[m]:.1f}/{presupuesto.get(m, '-')}" if m == "rtt" else f"{medido[m]}/{presupuesto.get(m, '-')}"
+                for m in MEDIDAS
+            ]
+            print(f"{nombre:<50} {celdas[0]:>9} {celdas[1]:>9} {celdas[2]:>11} {celdas[3]:>9}"
+                  f"{'   EXCEDIDO: ' + ', '.join(pasados) if pasados else ''}")
+            excedidos += bool(pasados)
+            if pasados or detalle:
+                for linea in medido["detalle"]:
+                    print(f"    {linea}")
+    print(f"\nescenarios excedidos: {excedidos}")
+    return 1 if excedidos else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--presupuestos", default=PRESUPUESTOS)
+    parser.add_argument("--latencia", type=float, help="latencia simulada por pedido en s (por defecto, la del archivo)")
+    parser.add_argument("--escenario", default="", help="correr solo los escenarios cuyo nombre contenga esto")
+    parser.add_argument("--detalle", action="store_true", help="listar los pedidos de cada llamada")
+    args = parser.parse_args()
+
+    with open(args.presupuestos, encoding="utf-8") as f:
+        datos = json.load(f)
+    return asyncio.run(correr(datos["escenarios"], args.latencia or datos["latencia_seg"], args.escenario, args.detalle))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
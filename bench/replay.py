@@ -0,0 +1,281 @@
+"""Reproduce tráfico grabado en producción (GRABAR_PATH) contra el stand-in local.
+
+    python bench/replay.py grabacion.jsonl [grabacion.jsonl.1 ...] [--velocidad 1|10|0] [--salida build_a.json]
+    python bench/replay.py grabacion.jsonl --velocidad 0 --comparar build_a.json
+
+Siembra un SupabaseLocal con lo que se ve en la grabación: las filas capturadas si se grabó con
+GRABAR_RESPUESTAS=1, o filas sintéticas con la misma cantidad por tabla y caso si no. Después
+repite las llamadas a las tools respetando los tiempos entre llamadas (divididos por
+--velocidad; 0 = lo más rápido posible, con --concurrencia llamadas a la vez) y resume la
+latencia por tool. Con --salida guarda el resumen; con --comparar muestra la diferencia contra
+el resumen de otro build (correr el mismo archivo en cada build).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["SUPABASE_URL"] = "http://replay.local"
+os.environ["SUPABASE_KEY"] = "replay"
+os.environ["GRABAR_PATH"] = ""
+os.environ.setdefault("RATE_LIMIT_POR_MINUTO", "0")
+
+import server  # noqa: E402
+from fastmcp import Client  # noqa: E402
+from standin import MOVIMIENTOS, MOVIMIENTOS_SRT, SupabaseLocal  # noqa: E402
+
+# Columna de caso de cada tabla leída por caso
+_CASO_POR_TABLA = {
+    "movimientos_pjn": "expediente_id",
+    "movimientos_judicial": "expediente_id",
+    "movimientos_srt": "caso_srt_id",
+    "comunicaciones_srt": "caso_srt_id",
+    "comunicaciones_miventanilla": "srt_expediente_nro",
+}
+_TABLA_POR_ORIGEN = {"pjn": "movimientos_pjn", "judicial": "movimientos_judicial", "srt": "movimientos_srt"}
+
+
+def leer(rutas: list) -> list:
+    registros = []
+    for ruta in rutas:
+        with open(ruta, encoding="utf-8") as f:
+            registros.extend(json.loads(linea) for linea in f if linea.strip())
+    registros.sort(key=lambda r: r["ts"])
+    return registros
+
+
+class Sembrador:
+    """Arma las tablas del stand-in a partir de los pedidos grabados (cada tabla/caso una sola vez)."""
+
+    def __init__(self, db: SupabaseLocal, seed: int = 1):
+        self.db = db
+        self.rnd = random.Random(seed)
+        self.vistos = set()
+        self.proximo_id = 10 ** 7
+
+    def _fechas(self, n: int, hasta: datetime) -> list:
+        return sorted(
+            ((hasta - timedelta(days=self.rnd.randint(0, 900), minutes=self.rnd.randint(0, 600))).strftime("%Y-%m-%dT%H:%M:%S")
+             for _ in range(n)),
+            reverse=True,
+        )
+
+    def _upsert(self, tabla: str, fila: dict) -> None:
+        filas = self.db.tabla(tabla)
+        if fila.get("id") is not None:
+            for existente in filas:
+                if existente.get("id") == fila["id"]:
+                    existente.update({k: v for k, v in fila.items() if v is not None})
+                    return
+        filas.append(fila)
+
+    def _caso(self, tabla: str, caso_id, estado: str = "15") -> None:
+        if not any(f.get("id") == caso_id for f in self.db.tabla(tabla)):
+            fila = {"id": caso_id, "estado": estado}
+            if tabla == "expedientes":
+                fila.update({"caratula": f"caso {caso_id}", "tipo_caso": "accidente"})
+            else:
+                fila.update({"nombre": f"caso {caso_id}", "activo": True, "etapa": "Trámite inicial"})
+            self.db.tabla(tabla).append(fila)
+
+    def registro(self, registro: dict) -> None:
+        hasta = datetime.fromisoformat(registro["ts"]).replace(tzinfo=None)
+        args = registro.get("args", {})
+        if "expediente_id" in args:
+            self._caso("expedientes", args["expediente_id"])
+        if "caso_srt_id" in args:
+            self._caso("casos_srt", args["caso_srt_id"], "2")
+        for pedido in registro.get("upstream", []):
+            if pedido["m"] == "POST" and not pedido["t"].startswith("rpc/"):
+                continue
+            self.pedido(pedido, registro, hasta)
+
+    def pedido(self, pedido: dict, registro: dict, hasta: datetime) -> None:
+        tabla, caso, datos = pedido["t"], pedido.get("caso"), pedido.get("datos")
+        clave = (tabla, caso if caso is not None else json.dumps(registro.get("args"), sort_keys=True))
+        if clave in self.vistos or pedido.get("s", 200) >= 300:
+            return
+        self.vistos.add(clave)
+        n = pedido.get("filas", 0)
+
+        if tabla == "rpc/timeline_caso":
+            caso_id = int(caso)
+            for fila in datos or []:
+                origen = fila.get("origen")
+                if origen == "seguimiento":
+                    campo = "caso_srt_id" if registro["tool"].endswith("_srt") else "expediente_id"
+                    self.db.tabla("seguimientos_auto").append({campo: caso_id, "fecha": fila["fecha"], "tipo": fila["tipo"], "descripcion": fila["descripcion"]})
+                elif origen == "srt":
+                    self.db.tabla("movimientos_srt").append({"caso_srt_id": caso_id, "fecha": fila["fecha"], "tipo_descripcion": fila["descripcion"]})
+                elif origen in _TABLA_POR_ORIGEN:
+                    self.db.tabla(_TABLA_POR_ORIGEN[origen]).append({"expediente_id": caso_id, "fecha": fila["fecha"], "tipo": fila["tipo"], "descripcion": fila["descripcion"]})
+            if datos is None:
+                tabla_movs = "movimientos_srt" if registro["tool"].endswith("_srt") else "movimientos_pjn"
+                self._sinteticos(tabla_movs, caso_id, n, hasta)
+            return
+
+        if tabla in ("expedientes", "casos_srt"):
+            if datos is not None:
+                for fila in datos:
+                    # Las lecturas de metadatos (id=eq.X) no piden la columna id
+                    self._upsert(tabla, {"id": int(caso), **fila} if caso is not None else dict(fila))
+            elif caso is None:
+                # Búsqueda por nombre sin filas grabadas: n casos cuyo nombre contiene las palabras buscadas
+                nombre = registro.get("args", {}).get("nombre", "")
+                for _ in range(n):
+                    self.proximo_id += 1
+                    columna = "caratula" if tabla == "expedientes" else "nombre"
+                    fila = {"id": self.proximo_id, columna: f"{nombre} c art", "estado": "15" if tabla == "expedientes" else "2"}
+                    if tabla == "casos_srt":
+                        fila.update({"activo": True, "etapa": "Trámite inicial", "comision_medica": "CM 1"})
+                    self.db.tabla(tabla).append(fila)
+            return
+
+        if tabla == "seguimientos_auto":
+            columna = "caso_srt_id" if registro["tool"].endswith("_srt") else "expediente_id"
+        else:
+            columna = _CASO_POR_TABLA.get(tabla)
+        if columna is None or caso is None:
+            return
+        valor = caso if columna == "srt_expediente_nro" else int(caso)
+        if tabla == "seguimientos_auto":
+            # Sin filas grabadas no se inventan: el server los genera y los guarda como en producción
+            for fila in datos or []:
+                self.db.tabla(tabla).append({columna: valor, **fila})
+            return
+        if datos is not None:
+            for fila in datos:
+                self.db.tabla(tabla).append({columna: valor, **fila})
+        else:
+            self._sinteticos(tabla, valor, n, hasta, columna)
+
+    def _sinteticos(self, tabla: str, valor, n: int, hasta: datetime, columna: str = None) -> None:
+        columna = columna or _CASO_POR_TABLA[tabla]
+        for fecha in self._fechas(n, hasta):
+            if tabla == "movimientos_srt":
+                fila = {"fecha": fecha, "tipo_descripcion": self.rnd.choice(MOVIMIENTOS_SRT)}
+            elif tabla.startswith("comunicaciones"):
+                fila = {"fecha_notificacion": fecha, "tipo_comunicacion": "Notificación", "detalle": self.rnd.choice(MOVIMIENTOS_SRT), "estado": "leida"}
+            else:
+                tipo, descripcion = self.rnd.choice(MOVIMIENTOS)
+                fila = {"fecha": fecha, "tipo": tipo, "descripcion": descripcion}
+            self.db.tabla(tabla).append({columna: valor, **fila})
+
+
+def percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def reproducir(registros: list, velocidad: float, concurrencia: int) -> dict:
+    latencias = {}
+    errores = 0
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async with Client(server.mcp) as cliente:
+        async def llamar(registro):
+            nonlocal errores
+            async with semaforo:
+                inicio = time.perf_counter()
+                try:
+                    await cliente.call_tool(registro["tool"], registro.get("args", {}))
+                except Exception:
+                    errores += 1
+                latencias.setdefault(registro["tool"], []).append((time.perf_counter() - inicio) * 1000)
+
+        t0 = datetime.fromisoformat(registros[0]["ts"])
+        inicio = time.monotonic()
+        tareas = []
+        for registro in registros:
+            if velocidad:
+                objetivo = (datetime.fromisoformat(registro["ts"]) - t0).total_seconds() / velocidad
+                espera = objetivo - (time.monotonic() - inicio)
+                if espera > 0:
+                    await asyncio.sleep(espera)
+            tareas.append(asyncio.create_task(llamar(registro)))
+        await asyncio.gather(*tareas)
+        duracion = time.monotonic() - inicio
+
+    return {"duracion_seg": round(duracion, 2), "errores": errores, "latencias": latencias}
+
+
+def resumir(latencias: dict) -> dict:
+    return {
+        tool: {
+            "llamadas": len(ms),
+            "media_ms": round(statistics.mean(ms), 2),
+            "p50_ms": round(percentil(ms, 0.50), 2),
+            "p95_ms": round(percentil(ms, 0.95), 2),
+            "p99_ms": round(percentil(ms, 0.99), 2),
+        }
+        for tool, ms in sorted(latencias.items())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("grabaciones", nargs="+")
+    parser.add_argument("--velocidad", type=float, default=0, help="1 = tiempo real, 10 = diez veces más rápido, 0 = sin esperas")
+    parser.add_argument("--concurrencia", type=int, default=8, help="llamadas simultáneas como máximo")
+    parser.add_argument("--latencia", type=float, default=None, help="RTT simulado (s); por defecto la mediana grabada")
+    parser.add_argument("--salida", help="guardar el resumen en este JSON")
+    parser.add_argument("--comparar", help="resumen JSON de otro build para comparar")
+    args = parser.parse_args()
+
+    registros = leer(args.grabaciones)
+    if not registros:
+        print("grabación vacía")
+        return 1
+    grabado_ms = [p["ms"] for r in registros for p in r.get("upstream", [])]
+    latencia = args.latencia if args.latencia is not None else (statistics.median(grabado_ms) / 1000 if grabado_ms else 0)
+
+    db = SupabaseLocal(latencia=latencia)
+    sembrador = Sembrador(db)
+    for registro in registros:
+        sembrador.registro(registro)
+    server._TRANSPORTE = db.transporte()
+
+    medicion = asyncio.run(reproducir(registros, args.velocidad, max(1, args.concurrencia)))
+    resumen = {
+        "llamadas": len(registros),
+        "velocidad": args.velocidad,
+        "latencia_simulada_ms": round(latencia * 1000, 2),
+        "duracion_seg": medicion["duracion_seg"],
+        "errores": medicion["errores"],
+        "pedidos_upstream": len(db.pedidos),
+        "pedidos_upstream_grabados": len(grabado_ms),
+        "tools": resumir(medicion["latencias"]),
+    }
+
+    print(f"llamadas {resumen['llamadas']}   velocidad {args.velocidad or 'máx'}   latencia simulada {resumen['latencia_simulada_ms']} ms   "
+          f"duración {resumen['duracion_seg']} s   errores {resumen['errores']}")
+    print(f"pedidos a Supabase: {resumen['pedidos_upstream']} (grabados: {resumen['pedidos_upstream_grabados']})")
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)["tools"]
+    for tool, r in resumen["tools"].items():
+        linea = f"{tool:<28} n {r['llamadas']:>5}   media {r['media_ms']:8.2f}   p50 {r['p50_ms']:8.2f}   p95 {r['p95_ms']:8.2f}   p99 {r['p99_ms']:8.2f}"
+        if base and tool in base:
+            b = base[tool]
+            linea += "   Δp50 {:+.2f} ({:+.0%})   Δp95 {:+.2f} ({:+.0%})".format(
+                r["p50_ms"] - b["p50_ms"], (r["p50_ms"] - b["p50_ms"]) / b["p50_ms"] if b["p50_ms"] else 0,
+                r["p95_ms"] - b["p95_ms"], (r["p95_ms"] - b["p95_ms"]) / b["p95_ms"] if b["p95_ms"] else 0,
+            )
+        print(linea)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2)
+    return 1 if resumen["errores"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
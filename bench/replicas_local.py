@@ -0,0 +1,149 @@
+"""Prueba local de coherencia entre réplicas: varios procesos del server en la misma máquina.
+
+    python bench/replicas_local.py [--replicas 3] [--puerto 8700] [--sin-canal]
+
+Levanta un stand-in de Supabase por HTTP (un proceso) y N réplicas de server.py apuntando a él,
+con REPLICAS_PEERS entre ellas. En cada réplica se busca el mismo caso (el prefetch deja su
+timeline en memoria), se inserta un movimiento nuevo y el webhook de Supabase llega solo a la
+primera réplica. Después se consulta el caso en todas: con el canal, todas responden lo mismo
+que la primera; con --sin-canal las demás responden con la timeline vieja.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+WEBHOOK_TOKEN = "hook-local"
+ACEPTA = {"accept": "application/json, text/event-stream"}
+
+
+def servir_standin(puerto: int) -> None:
+    """Proceso hijo: SupabaseLocal sembrado, servido por HTTP."""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Route
+    from standin import SupabaseLocal, sembrar
+
+    db = SupabaseLocal()
+    sembrar(db, casos=30, movs_por_caso=(5, 20))
+
+    async def rest(request):
+        respuesta = await db.manejar(httpx.Request(
+            request.method, str(request.url), headers=request.headers.raw, content=await request.body(),
+        ))
+        return Response(respuesta.content, status_code=respuesta.status_code, media_type=respuesta.headers.get("content-type", "application/json"))
+
+    app = Starlette(routes=[Route("/rest/v1/{ruta:path}", rest, methods=["GET", "POST", "PATCH", "DELETE"])])
+    uvicorn.run(app, host="127.0.0.1", port=puerto, log_level="warning")
+
+
+async def esperar(cliente: httpx.AsyncClient, url: str) -> None:
+    for _ in range(100):
+        try:
+            await cliente.get(url)
+            return
+        except httpx.HTTPError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} no levantó")
+
+
+async def tool(cliente: httpx.AsyncClient, replica: str, nombre: str, argumentos: dict) -> dict:
+    resp = await cliente.post(f"{replica}/mcp", headers=ACEPTA, json={
+        "jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": nombre, "arguments": argumentos},
+    })
+    return json.loads(resp.json()["result"]["content"][0]["text"])
+
+
+async def escenario(standin: str, replicas: list) -> int:
+    async with httpx.AsyncClient(timeout=10.0) as cliente:
+        await esperar(cliente, f"{standin}/rest/v1/expedientes?limit=1")
+        for replica in replicas:
+            await esperar(cliente, f"{replica}/metrics")
+
+        expedientes = (await cliente.get(f"{standin}/rest/v1/expedientes", params={"select": "id,caratula,estado"})).json()
+        caso = next(e for e in expedientes if not e["estado"].startswith("8"))
+        nombre = caso["caratula"].split(" C/")[0]
+
+        # Cada réplica busca el caso: el prefetch guarda su timeline en memoria
+        for replica in replicas:
+            await tool(cliente, replica, "buscar_caso", {"nombre": nombre})
+        await asyncio.sleep(1.0)
+
+        hoy = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        nuevo = {"expediente_id": caso["id"], "fecha": hoy, "tipo": "SENTENCIA", "descripcion": "SENTENCIA DEFINITIVA"}
+        await cliente.post(f"{standin}/rest/v1/movimientos_pjn", json=[nuevo])
+        await cliente.post(
+            f"{replicas[0]}/hooks/invalidate", headers={"Authorization": f"Bearer {WEBHOOK_TOKEN}"},
+            json={"type": "INSERT", "table": "movimientos_pjn", "record": nuevo},
+        )
+        await asyncio.sleep(0.5)
+
+        # La primera réplica invalidó por el webhook: su respuesta es la actual
+        inicio = time.perf_counter()
+        actual = await tool(cliente, replicas[0], "consultar_movimientos", {"expediente_id": caso["id"]})
+        desactualizadas = 0
+        for i, replica in enumerate(replicas[1:], start=2):
+            respuesta = await tool(cliente, replica, "consultar_movimientos", {"expediente_id": caso["id"]})
+            al_dia = respuesta == actual
+            desactualizadas += not al_dia
+            print(f"réplica {i} ({replica}): {'al día' if al_dia else 'DESACTUALIZADA'}")
+        print(f"consultas en {(time.perf_counter() - inicio) * 1000:.0f} ms; réplicas desactualizadas: {desactualizadas}")
+        return desactualizadas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--puerto", type=int, default=8700)
+    parser.add_argument("--sin-canal", action="store_true", help="réplicas sin REPLICAS_PEERS (para comparar)")
+    parser.add_argument("--standin", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.standin:
+        servir_standin(args.standin)
+        return 0
+
+    standin = f"http://127.0.0.1:{args.puerto}"
+    replicas = [f"http://127.0.0.1:{args.puerto + 1 + i}" for i in range(args.replicas)]
+    procesos = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--standin", str(args.puerto)])]
+    try:
+        for i, replica in enumerate(replicas):
+            entorno = {
+                **os.environ,
+                "PORT": str(args.puerto + 1 + i),
+                "SUPABASE_URL": standin,
+                "SUPABASE_KEY": "local",
+                "MCP_AUTH_TOKEN": "",
+                "WEBHOOK_TOKEN": WEBHOOK_TOKEN,
+                "RATE_LIMIT_POR_MINUTO": "0",
+                "PREFETCH_MAX_CASOS": "2",
+                "REPLICA_URL": replica,
+                "REPLICAS_PEERS": "" if args.sin_canal else ",".join(replicas),
+                "REPLICAS_SECRETO": "secreto-local",
+            }
+            procesos.append(subprocess.Popen(
+                [sys.executable, os.path.join(RAIZ, "server.py")], env=entorno,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+        desactualizadas = asyncio.run(escenario(standin, replicas))
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            proceso.wait()
+    return 1 if desactualizadas and not args.sin_canal else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
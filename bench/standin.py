@@ -0,0 +1,388 @@
+"""Stand-in local de Supabase/PostgREST para benchmarks.
+
+Implementa en memoria el subconjunto de PostgREST que usa server.py, con latencia
+simulada por pedido, y se enchufa como transporte httpx:
+
+    import server
+    from standin import SupabaseLocal, sembrar
+
+    db = SupabaseLocal(latencia=0.02)
+    sembrar(db)
+    server._TRANSPORTE = db.transporte()
+"""
+
+import asyncio
+import csv
+import io
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+
+import httpx
+
+# Claves únicas por tabla (migrations/004) para on_conflict + Prefer: resolution=ignore-duplicates
+UNICOS = {
+    "seguimientos_auto": ("expediente_id", "caso_srt_id", "fecha"),
+}
+
+_PARAMS_RESERVADOS = {"select", "order", "limit", "offset", "and", "or", "on_conflict"}
+
+
+def _sin_comillas(valor: str) -> str:
+    if len(valor) >= 2 and valor[0] == '"' and valor[-1] == '"':
+        return valor[1:-1].replace('\\"', '"')
+    return valor
+
+
+def _dividir(texto: str) -> list:
+    """Divide por comas de primer nivel (respetando paréntesis y comillas)."""
+    partes, actual, nivel, en_comillas = [], [], 0, False
+    for ch in texto:
+        if ch == '"':
+            en_comillas = not en_comillas
+        elif not en_comillas and ch == "(":
+            nivel += 1
+        elif not en_comillas and ch == ")":
+            nivel -= 1
+        if ch == "," and nivel == 0 and not en_comillas:
+            partes.append("".join(actual))
+            actual = []
+        else:
+            actual.append(ch)
+    if actual:
+        partes.append("".join(actual))
+    return partes
+
+
+def _patron_like(patron: str, ignorar_mayus: bool):
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in patron)
+    return re.compile(f"^{regex}$", re.IGNORECASE | re.DOTALL if ignorar_mayus else re.DOTALL)
+
+
+def texto_postgres(valor):
+    """Como `valor::text` en Postgres (RPC, CSV): los timestamp salen con espacio
+    ('2024-05-01 10:00:00'), no con la 'T' del JSON de PostgREST."""
+    if isinstance(valor, str) and len(valor) > 10 and valor[10] == "T" and valor[4] == "-":
+        return f"{valor[:10]} {valor[11:]}"
+    return valor
+
+
+def _comparable(valor):
+    # Los filtros comparan el valor, no su texto: '2024-05-01T10:00' y '2024-05-01 10:00' son iguales
+    return "" if valor is None else texto_postgres(str(valor))
+
+
+def _cumple(fila: dict, columna: str, expresion: str) -> bool:
+    negar = False
+    if expresion.startswith("not."):
+        negar = True
+        expresion = expresion[4:]
+    op, _, arg = expresion.partition(".")
+    arg = texto_postgres(_sin_comillas(arg))
+    valor = fila.get(columna)
+
+    if op == "is":
+        ok = valor is None if arg == "null" else valor is (arg == "true")
+    elif valor is None:
+        # Como en SQL: comparar contra NULL nunca es verdadero (ni negado)
+        return False
+    elif op == "eq":
+        ok = _comparable(valor).lower() == arg.lower() if isinstance(valor, bool) else _comparable(valor) == arg
+    elif op == "neq":
+        ok = _comparable(valor) != arg
+    elif op in ("gt", "gte", "lt", "lte"):
+        a, b = valor, arg
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            b = type(valor)(arg)
+        else:
+            a = _comparable(valor)
+        ok = {"gt": a > b, "gte": a >= b, "lt": a < b, "lte": a <= b}[op]
+    elif op in ("like", "ilike"):
+        ok = bool(_patron_like(arg, op == "ilike").match(_comparable(valor)))
+    elif op in ("match", "imatch"):
+        ok = bool(re.search(arg, _comparable(valor), re.IGNORECASE if op == "imatch" else 0))
+    elif op == "in":
+        opciones = [_sin_comillas(x) for x in _dividir(arg.strip("()"))]
+        ok = _comparable(valor) in opciones
+    else:
+        raise ValueError(f"operador no soportado: {op}")
+    return ok != negar
+
+
+def _cumple_arbol(fila: dict, operador: str, contenido: str) -> bool:
+    """Evalúa and=(...)/or=(...) con anidamiento."""
+    resultados = []
+    for cond in _dividir(contenido.strip()[1:-1]):
+        cond = cond.strip()
+        m = re.match(r"^(not\.)?(and|or)(\(.*\))$", cond)
+        if m:
+            r = _cumple_arbol(fila, m.group(2), m.group(3))
+            resultados.append(not r if m.group(1) else r)
+        else:
+            columna, _, expresion = cond.partition(".")
+            resultados.append(_cumple(fila, columna, expresion))
+    return all(resultados) if operador == "and" else any(resultados)
+
+
+def _clave_orden(valor):
+    # NULL es el mayor valor, como en Postgres: primero en desc, último en asc
+    return (valor is None, _comparable(valor) if not isinstance(valor, (int, float)) else valor)
+
+
+class SupabaseLocal:
+    """Subconjunto de PostgREST en memoria, con latencia simulada y registro de pedidos."""
+
+    def __init__(self, latencia: float = 0.0, rpc: bool = False, unicos: bool = True):
+        self.tablas = {}
+        self.latencia = latencia
+        self.rpc = rpc
+        # False = base sin los índices únicos de UNICOS (migración 004 sin aplicar)
+        self.unicos = unicos
+        self.pedidos = []
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self.bytes_enviados = 0
+        self.segundos_servidor = 0.0  # tiempo de CPU del propio stand-in (para descontarlo)
+
+    def transporte(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.manejar)
+
+    def tabla(self, nombre: str) -> list:
+        return self.tablas.setdefault(nombre, [])
+
+    async def manejar(self, request: httpx.Request) -> httpx.Response:
+        self.pedidos.append((request.method, request.url.path))
+        self.en_vuelo += 1
+        self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        try:
+            if self.latencia:
+                await asyncio.sleep(self.latencia)
+            inicio = time.perf_counter()
+            respuesta = self._responder(request)
+            self.segundos_servidor += time.perf_counter() - inicio
+            self.bytes_enviados += len(respuesta.content)
+            return respuesta
+        finally:
+            self.en_vuelo -= 1
+
+    def _responder(self, request: httpx.Request) -> httpx.Response:
+        ruta = request.url.path
+        if not ruta.startswith("/rest/v1/"):
+            return httpx.Response(404)
+        nombre = ruta[len("/rest/v1/"):]
+
+        if nombre.startswith("rpc/"):
+            funcion = getattr(self, f"rpc_{nombre[4:]}", None)
+            if not self.rpc or funcion is None:
+                return httpx.Response(404, json={"code": "PGRST202", "message": "function not found"})
+            return self._filas(request, funcion(**json.loads(request.content or b"{}")))
+
+        if request.method == "POST":
+            return self._insertar(nombre, request)
+        if request.method == "GET":
+            params = parse_qsl(request.url.query.decode(), keep_blank_values=True)
+            return self._filas(request, self.consultar(nombre, params))
+        return httpx.Response(405)
+
+    @staticmethod
+    def _filas(request: httpx.Request, filas: list) -> httpx.Response:
+        """JSON, o CSV si se pide Accept: text/csv (encabezado + filas, NULL como campo vacío)."""
+        if not request.headers.get("accept", "").startswith("text/csv"):
+            return httpx.Response(200, json=filas)
+        salida = io.StringIO()
+        escritor = csv.writer(salida, lineterminator="\n")
+        if filas:
+            escritor.writerow(filas[0].keys())
+            escritor.writerows(["" if v is None else texto_postgres(v) for v in f.values()] for f in filas)
+        return httpx.Response(200, content=salida.getvalue().encode(), headers={"content-type": "text/csv; charset=utf-8"})
+
+    def consultar(self, nombre: str, params: list) -> list:
+        filas = self.tabla(nombre)
+        select, orden, limite, offset = "*", None, None, 0
+        filtros = []
+        for clave, valor in params:
+            if clave == "select":
+                select = valor
+            elif clave == "order":
+                orden = valor
+            elif clave == "limit":
+                limite = int(valor)
+            elif clave == "offset":
+                offset = int(valor)
+            elif clave in ("and", "or"):
+                filtros.append(lambda f, c=clave, v=valor: _cumple_arbol(f, c, v))
+            elif clave not in _PARAMS_RESERVADOS:
+                filtros.append(lambda f, c=clave, v=valor: _cumple(f, c, v))
+
+        resultado = [f for f in filas if all(filtro(f) for filtro in filtros)]
+
+        if orden:
+            for parte in reversed(orden.split(",")):
+                columna, _, direccion = parte.partition(".")
+                desc = direccion.startswith("desc")
+                resultado.sort(key=lambda f: _clave_orden(f.get(columna)), reverse=desc)
+
+        resultado = resultado[offset:]
+        if limite is not None:
+            resultado = resultado[:limite]
+
+        if select != "*":
+            columnas = [c.strip() for c in select.split(",")]
+            resultado = [{c: f.get(c) for c in columnas} for f in resultado]
+        return resultado
+
+    def _insertar(self, nombre: str, request: httpx.Request) -> httpx.Response:
+        datos = json.loads(request.content or b"[]")
+        if isinstance(datos, dict):
+            datos = [datos]
+        filas = self.tabla(nombre)
+        ignorar = "ignore-duplicates" in request.headers.get("Prefer", "")
+        unico = UNICOS.get(nombre) if self.unicos else None
+        on_conflict = request.url.params.get("on_conflict")
+        if on_conflict and tuple(on_conflict.split(",")) != unico:
+            return httpx.Response(400, json={
+                "code": "42P10",
+                "message": "there is no unique or exclusion constraint matching the ON CONFLICT specification",
+            })
+        existentes = {tuple(f.get(c) for c in unico) for f in filas} if unico else set()
+        insertadas = []
+        for d in datos:
+            clave = tuple(d.get(c) for c in unico) if unico else None
+            if clave is not None and clave in existentes:
+                # Como PostgREST: sin on_conflict, ignore-duplicates solo resuelve por la clave primaria
+                if ignorar and on_conflict:
+                    continue
+                return httpx.Response(409, json={"code": "23505", "message": "duplicate key"})
+            fila = {"id": len(filas) + 1, **d}
+            filas.append(fila)
+            insertadas.append(fila)
+            if clave is not None:
+                existentes.add(clave)
+        # return=representation devuelve solo lo insertado (los duplicados ignorados no)
+        if "return=representation" in request.headers.get("Prefer", ""):
+            select = request.url.params.get("select")
+            if select:
+                columnas = [c.strip() for c in select.split(",")]
+                insertadas = [{c: f.get(c) for c in columnas} for f in insertadas]
+            return httpx.Response(201, json=insertadas)
+        return httpx.Response(201)
+
+    # --- RPCs (mismo contrato que migrations/) ---
+
+    def rpc_timeline_caso(self, p_caso_id, p_es_srt=False, p_limite=50):
+        def ultimos(tabla, columna):
+            return self.consultar(tabla, [(columna, f"eq.{p_caso_id}"), ("order", "fecha.desc"), ("limit", str(p_limite))])
+
+        filas = []
+        if p_es_srt:
+            for m in ultimos("movimientos_srt", "caso_srt_id"):
+                filas.append({"origen": "srt", "fecha": texto_postgres(m.get("fecha")), "tipo": "", "descripcion": m.get("tipo_descripcion")})
+        else:
+            for tabla, origen in (("movimientos_pjn", "pjn"), ("movimientos_judicial", "judicial")):
+                for m in ultimos(tabla, "expediente_id"):
+                    filas.append({"origen": origen, "fecha": texto_postgres(m.get("fecha")), "tipo": m.get("tipo"), "descripcion": m.get("descripcion")})
+
+        # Seguimientos dentro de la ventana de los movimientos (migrations/002)
+        fechas = [f["fecha"][:10] for f in filas if len(f["fecha"] or "") >= 10]
+        campo = "caso_srt_id" if p_es_srt else "expediente_id"
+        params = [(campo, f"eq.{p_caso_id}"), ("order", "fecha.desc")]
+        params.append(("fecha", f"gte.{min(fechas)}") if fechas else ("limit", "200"))
+        for s in self.consultar("seguimientos_auto", params):
+            filas.append({"origen": "seguimiento", "fecha": texto_postgres(s.get("fecha")), "tipo": s.get("tipo"), "descripcion": s.get("descripcion")})
+        filas.sort(key=lambda f: f["origen"])
+        filas.sort(key=lambda f: _clave_orden(f["fecha"]), reverse=True)
+        return filas
+
+
+# ============================================================
+# DATOS SINTÉTICOS
+# ============================================================
+
+APELLIDOS = [
+    "PEREZ", "GONZALEZ", "RODRIGUEZ", "FERNANDEZ", "LOPEZ", "MARTINEZ", "GARCIA", "SANCHEZ",
+    "ROMERO", "SOSA", "TORRES", "ALVAREZ", "RUIZ", "RAMIREZ", "FLORES", "BENITEZ", "ACOSTA",
+    "MEDINA", "HERRERA", "SUAREZ", "AGUIRRE", "GIMENEZ", "GUTIERREZ", "PEREYRA", "ROJAS",
+    "MOLINA", "CASTRO", "ORTIZ", "SILVA", "NUÑEZ", "LUNA", "JUAREZ", "CABRERA", "RIOS",
+]
+NOMBRES = [
+    "JUAN", "CARLOS", "JOSE", "LUIS", "JORGE", "MIGUEL", "DANIEL", "MARIA", "ANA", "LAURA",
+    "SILVIA", "MARTA", "CLAUDIA", "GRACIELA", "PABLO", "DIEGO", "SERGIO", "ALEJANDRO", "MARCELA",
+]
+DEMANDADAS = [
+    "PROVINCIA ART S.A.", "GALENO ART S.A.", "PREVENCION ART S.A.", "EXPERTA ART S.A.",
+    "FEDERACION PATRONAL SEGUROS S.A.", "LA SEGUNDA ART S.A.", "ASOCIART S.A. ART",
+]
+MOVIMIENTOS = [
+    ("ESCRITO", "SE PRESENTA Y ACOMPAÑA DOCUMENTACION"),
+    ("DESPACHO", "TRASLADO A LA CONTRARIA"),
+    ("DESPACHO", "SE ABRE A PRUEBA"),
+    ("CEDULA", "CEDULA ELECTRONICA NOTIFICADA"),
+    ("MOVIMIENTO", "PASE A DESPACHO"),
+    ("ESCRITO", "SOLICITA SE DESIGNE PERITO MEDICO"),
+    ("DESPACHO", "PERITO ACEPTA CARGO"),
+    ("EVENTO", "AUDIENCIA ART. 80 LO"),
+    ("DESPACHO", "AUTOS PARA ALEGAR"),
+    ("DESPACHO", "REGULACION DE HONORARIOS"),
+    ("OFICIO", "SE LIBRA OFICIO"),
+    ("ESCRITO", "CONTESTACION DE DEMANDA"),
+]
+MOVIMIENTOS_SRT = [
+    "Citación a audiencia médica", "Dictamen médico emitido", "Solicitud de historia clínica",
+    "Audiencia virtual", "Homologación de acuerdo", "Determinación de ITM",
+]
+
+
+def sembrar(db: SupabaseLocal, casos: int = 200, movs_por_caso: tuple = (0, 80), seed: int = 1, hoy: datetime = None) -> None:
+    """Carga datos sintéticos con la forma de las tablas reales."""
+    rnd = random.Random(seed)
+    hoy = hoy or datetime.now()
+
+    def fechas(n):
+        inicio = hoy - timedelta(days=rnd.randint(60, 1500))
+        total = (hoy - inicio).days
+        return sorted(
+            (inicio + timedelta(days=rnd.randint(0, total))).strftime("%Y-%m-%dT%H:%M:%S") for _ in range(n)
+        )
+
+    for i in range(1, casos + 1):
+        nombre = f"{rnd.choice(APELLIDOS)} {rnd.choice(NOMBRES)} {rnd.choice(NOMBRES)}"
+        estado = f"{rnd.choice(['02', '10', '15', '20', '31', '41', '52', '71', '81'])} - En trámite"
+        db.tabla("expedientes").append({
+            "id": i,
+            "caratula": f"{nombre} C/ {rnd.choice(DEMANDADAS)} S/ ACCIDENTE - LEY ESPECIAL - {rnd.randint(10000, 99999)}/{rnd.randint(2015, 2025)}",
+            "estado": estado,
+            "tipo_caso": "despido" if rnd.random() < 0.2 else "accidente",
+        })
+        tabla = "movimientos_pjn" if rnd.random() < 0.6 else "movimientos_judicial"
+        for fecha in fechas(rnd.randint(*movs_por_caso)):
+            tipo, descripcion = rnd.choice(MOVIMIENTOS)
+            db.tabla(tabla).append({"id": len(db.tabla(tabla)) + 1, "expediente_id": i, "fecha": fecha, "tipo": tipo, "descripcion": descripcion})
+
+        if rnd.random() < 0.5:
+            numero_srt = f"{rnd.randint(100000, 999999)}/{rnd.randint(20, 25)}"
+            db.tabla("casos_srt").append({
+                "id": i,
+                "nombre": nombre,
+                "etapa": rnd.choice(["Trámite inicial", "Audiencia médica", "Dictamen"]),
+                "estado": str(rnd.randint(1, 4)),
+                "numero_srt": numero_srt,
+                "comision_medica": f"CM {rnd.randint(1, 40)}",
+                "activo": rnd.random() < 0.9,
+            })
+            for fecha in fechas(rnd.randint(0, movs_por_caso[1] // 4)):
+                db.tabla("movimientos_srt").append({
+                    "id": len(db.tabla("movimientos_srt")) + 1, "caso_srt_id": i, "fecha": fecha,
+                    "tipo_descripcion": rnd.choice(MOVIMIENTOS_SRT),
+                })
+            for fecha in fechas(rnd.randint(0, 6)):
+                db.tabla("comunicaciones_srt").append({
+                    "caso_srt_id": i, "fecha_notificacion": fecha, "tipo_comunicacion": "Notificación",
+                    "detalle": rnd.choice(MOVIMIENTOS_SRT), "estado": "leida",
+                })
+                db.tabla("comunicaciones_miventanilla").append({
+                    "srt_expediente_nro": numero_srt, "fecha_notificacion": fecha, "tipo_comunicacion": "Comunicación",
+                    "detalle": rnd.choice(MOVIMIENTOS_SRT), "estado": "leida",
+                })
@@ -0,0 +1,62 @@
+-- Timeline de un caso en una sola llamada (RPC de PostgREST: POST /rest/v1/rpc/timeline_caso).
+--
+-- Devuelve exactamente las filas que server.py obtenía con consultas separadas:
+--   * hasta p_limite movimientos reales por tabla (movimientos_pjn + movimientos_judicial,
+--     o movimientos_srt si p_es_srt), cada tabla ordenada por fecha desc como en PostgREST
+--   * los seguimientos_auto del caso
+-- todo unido y ordenado por fecha desc. La traducción, la generación de seguimientos
+-- y el filtrado siguen en Python, así el resultado es idéntico por cualquiera de los dos caminos.
+--
+-- Si esta función no existe, server.py vuelve solo a las consultas separadas.
+
+create or replace function public.timeline_caso(
+    p_caso_id bigint,
+    p_es_srt boolean default false,
+    p_limite integer default 50
+)
+returns table (origen text, fecha text, tipo text, descripcion text)
+language sql
+stable
+as $$
+    (
+        select 'srt'::text, m.fecha::text, ''::text, m.tipo_descripcion::text
+        from public.movimientos_srt m
+        where p_es_srt and m.caso_srt_id = p_caso_id
+        order by m.fecha desc
+        limit p_limite
+    )
+    union all
+    (
+        select 'pjn'::text, m.fecha::text, m.tipo::text, m.descripcion::text
+        from public.movimientos_pjn m
+        where not p_es_srt and m.expediente_id = p_caso_id
+        order by m.fecha desc
+        limit p_limite
+    )
+    union all
+    (
+        select 'judicial'::text, m.fecha::text, m.tipo::text, m.descripcion::text
+        from public.movimientos_judicial m
+        where not p_es_srt and m.expediente_id = p_caso_id
+        order by m.fecha desc
+        limit p_limite
+    )
+    union all
+    (
+        select 'seguimiento'::text, s.fecha::text, s.tipo::text, s.descripcion::text
+        from public.seguimientos_auto s
+        where not p_es_srt and s.expediente_id = p_caso_id
+    )
+    union all
+    (
+        select 'seguimiento'::text, s.fecha::text, s.tipo::text, s.descripcion::text
+        from public.seguimientos_auto s
+        where p_es_srt and s.caso_srt_id = p_caso_id
+    )
+    order by 2 desc nulls first, 1
+$$;
+
+grant execute on function public.timeline_caso(bigint, boolean, integer) to anon, authenticated, service_role;
+
+-- Que PostgREST vea la función nueva sin reiniciar
+notify pgrst, 'reload schema';
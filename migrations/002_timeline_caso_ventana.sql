@@ -0,0 +1,70 @@
+-- timeline_caso con los seguimientos acotados a la ventana que la timeline puede mostrar.
+--
+-- server.py descarta los seguimientos_auto anteriores al movimiento real más antiguo leído,
+-- y sin movimientos reales solo muestra los seguimientos más recientes. Leer toda la historia
+-- del caso hacía crecer sin límite el payload de cada llamada; ahora:
+--   * con movimientos: solo seguimientos con fecha >= el movimiento más antiguo devuelto
+--   * sin movimientos: los 200 seguimientos más recientes
+-- Mismo contrato que 001_timeline_caso.sql (mismas columnas y parámetros).
+
+create or replace function public.timeline_caso(
+    p_caso_id bigint,
+    p_es_srt boolean default false,
+    p_limite integer default 50
+)
+returns table (origen text, fecha text, tipo text, descripcion text)
+language sql
+stable
+as $$
+    with movs as (
+        (
+            select 'srt'::text as origen, m.fecha as fecha_orig, m.fecha::text as fecha, ''::text as tipo, m.tipo_descripcion::text as descripcion
+            from public.movimientos_srt m
+            where p_es_srt and m.caso_srt_id = p_caso_id
+            order by m.fecha desc
+            limit p_limite
+        )
+        union all
+        (
+            select 'pjn'::text, m.fecha, m.fecha::text, m.tipo::text, m.descripcion::text
+            from public.movimientos_pjn m
+            where not p_es_srt and m.expediente_id = p_caso_id
+            order by m.fecha desc
+            limit p_limite
+        )
+        union all
+        (
+            select 'judicial'::text, m.fecha, m.fecha::text, m.tipo::text, m.descripcion::text
+            from public.movimientos_judicial m
+            where not p_es_srt and m.expediente_id = p_caso_id
+            order by m.fecha desc
+            limit p_limite
+        )
+    ),
+    ventana as (
+        select min(left(fecha, 10))::date as desde from movs where length(fecha) >= 10
+    ),
+    segs as (
+        select s.fecha, s.tipo, s.descripcion
+        from (
+            select s.fecha, s.tipo, s.descripcion
+            from public.seguimientos_auto s
+            where not p_es_srt and s.expediente_id = p_caso_id
+            union all
+            select s.fecha, s.tipo, s.descripcion
+            from public.seguimientos_auto s
+            where p_es_srt and s.caso_srt_id = p_caso_id
+        ) s, ventana v
+        where v.desde is null or s.fecha >= v.desde
+        order by s.fecha desc
+        limit (select case when desde is null then 200 end from ventana)
+    )
+    select origen, fecha, tipo, descripcion from movs
+    union all
+    select 'seguimiento'::text, s.fecha::text, s.tipo::text, s.descripcion::text from segs s
+    order by 2 desc nulls first, 1
+$$;
+
+grant execute on function public.timeline_caso(bigint, boolean, integer) to anon, authenticated, service_role;
+
+notify pgrst, 'reload schema';
@@ -0,0 +1,45 @@
+-- Índices para las consultas que hace server.py (ver ASESOR_INDICES para verificarlo en producción).
+--
+--   * buscar_caso:      expedientes  caratula ~* 'p[eé]rez' (AND de varias palabras, sin finalizados)
+--   * buscar_caso_srt:  casos_srt    nombre ~* 'p[eé]rez' and activo = true
+--   * timeline:         movimientos_* / seguimientos_auto  <caso> = X order by fecha desc limit N
+--   * comunicaciones:   comunicaciones_srt / comunicaciones_miventanilla  <caso> = X order by fecha_notificacion desc limit 3
+--   * webhooks:         casos_srt  numero_srt = X
+--
+-- ilike con comodín adelante y las regex (~*) no usan btree: hace falta un GIN de trigramas (pg_trgm).
+-- Con tablas grandes conviene crear cada índice con "create index concurrently" fuera de una transacción.
+
+create extension if not exists pg_trgm;
+
+create index if not exists expedientes_caratula_trgm
+    on public.expedientes using gin (caratula gin_trgm_ops);
+
+create index if not exists casos_srt_nombre_trgm
+    on public.casos_srt using gin (nombre gin_trgm_ops)
+    where activo;
+
+create index if not exists casos_srt_numero_srt
+    on public.casos_srt (numero_srt);
+
+create index if not exists movimientos_pjn_caso_fecha
+    on public.movimientos_pjn (expediente_id, fecha desc);
+
+create index if not exists movimientos_judicial_caso_fecha
+    on public.movimientos_judicial (expediente_id, fecha desc);
+
+create index if not exists movimientos_srt_caso_fecha
+    on public.movimientos_srt (caso_srt_id, fecha desc);
+
+create index if not exists comunicaciones_srt_caso_fecha
+    on public.comunicaciones_srt (caso_srt_id, fecha_notificacion desc);
+
+create index if not exists comunicaciones_miventanilla_nro_fecha
+    on public.comunicaciones_miventanilla (srt_expediente_nro, fecha_notificacion desc);
+
+create index if not exists seguimientos_auto_expediente_fecha
+    on public.seguimientos_auto (expediente_id, fecha desc)
+    where expediente_id is not null;
+
+create index if not exists seguimientos_auto_caso_srt_fecha
+    on public.seguimientos_auto (caso_srt_id, fecha desc)
+    where caso_srt_id is not null;
@@ -0,0 +1,20 @@
+-- Clave única de seguimientos_auto: un seguimiento por caso y fecha.
+--
+-- server.py inserta con "Prefer: resolution=ignore-duplicates", pero sin una clave única
+-- PostgREST solo puede resolver conflictos por la clave primaria (id), así que los
+-- duplicados entraban igual. Con este índice y on_conflict=expediente_id,caso_srt_id,fecha
+-- los repetidos se descartan en la base. Si el índice no existe, server.py recibe 42P10 y
+-- vuelve a insertar sin on_conflict.
+--
+-- nulls not distinct (Postgres 15+): expediente_id o caso_srt_id siempre es NULL.
+
+-- Quitar los duplicados que ya existen (se queda el de menor id)
+delete from public.seguimientos_auto s
+using public.seguimientos_auto d
+where s.id > d.id
+  and s.expediente_id is not distinct from d.expediente_id
+  and s.caso_srt_id is not distinct from d.caso_srt_id
+  and s.fecha = d.fecha;
+
+create unique index if not exists seguimientos_auto_caso_fecha_unico
+    on public.seguimientos_auto (expediente_id, caso_srt_id, fecha) nulls not distinct;
@@ -2,17 +2,486 @@ import os
 import json
 import math
 import re
-from datetime import datetime, timedelta, timezone
+import time
+import unicodedata
+import asyncio
+import contextvars
+import csv
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
+import itertools
+import sys
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from operator import itemgetter
+from typing import NamedTuple
 import httpx
 from fastmcp import FastMCP
+from fastmcp.server.dependencies import get_http_headers
+from fastmcp.server.middleware import Middleware
+from fastmcp.tools.tool import ToolResult
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
 
 # --- Config ---
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "").strip().rstrip("/")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "").strip()
+MCP_AUTH_TOKEN = os.environ.get("MCP_AUTH_TOKEN", "").strip()
+# Token de los webhooks de Supabase (si no se define, se usa MCP_AUTH_TOKEN)
+WEBHOOK_TOKEN = os.environ.get("WEBHOOK_TOKEN", "").strip() or MCP_AUTH_TOKEN
 PORT = int(os.environ.get("PORT", 8000))
+# Varios bots/estudios en el mismo server: JSON {nombre: {token, supabase_url, supabase_key, concurrencia,
+# conexiones, webhook_token}} en TENANTS o en el archivo TENANTS_PATH. Vacío = un solo tenant con las variables de arriba
+TENANTS_CONFIG = os.environ.get("TENANTS", "").strip()
+TENANTS_PATH = os.environ.get("TENANTS_PATH", "").strip()
+
+# Admisión: token bucket por cliente (0 = sin límite) y concurrencia global hacia Supabase.
+# Apagado por defecto: sin MCP_SESIONES todas las conversaciones de un bot comparten su token
+RATE_LIMIT_POR_MINUTO = float(os.environ.get("RATE_LIMIT_POR_MINUTO", 0))
+RATE_LIMIT_RAFAGA = int(os.environ.get("RATE_LIMIT_RAFAGA", 10))
+UPSTREAM_CONCURRENCIA = int(os.environ.get("UPSTREAM_CONCURRENCIA", 8))
+UPSTREAM_ESPERA_MAX = float(os.environ.get("UPSTREAM_ESPERA_MAX", 10))
+# Respuestas por SSE con resultados parciales como notificaciones de progreso (1 = activo)
+MCP_STREAMING = os.environ.get("MCP_STREAMING", "0") == "1"
+# Sesiones MCP con contexto de casos entre llamadas (1 = activo; por defecto stateless)
+MCP_SESIONES = os.environ.get("MCP_SESIONES", "0") == "1"
+
+# Transporte httpx alternativo (None = red real). Los benchmarks lo apuntan al stand-in local de bench/.
+_TRANSPORTE = None
+
+
+def _cliente(timeout: float) -> httpx.AsyncClient:
+    """Cliente httpx para el Supabase del tenant actual: usa su pool de conexiones y todo pedido
+    pasa por su limitador upstream."""
+    return httpx.AsyncClient(timeout=timeout, transport=_TransporteAdmitido(_TRANSPORTE or tenant_actual().transporte()))
+
+
+def _autorizado(request: Request) -> bool:
+    """Valida el Bearer MCP_AUTH_TOKEN en las rutas HTTP propias. Sin token quedan abiertas solo
+    con un único tenant (modo desarrollo); con TENANTS cada bot tiene su token y /metrics exige
+    MCP_AUTH_TOKEN: sin él se rechaza. Las rutas /debug/* sin token ni se registran."""
+    if not MCP_AUTH_TOKEN:
+        return not _MULTI_TENANT
+    recibido = request.headers.get("authorization", "")
+    return hmac.compare_digest(recibido, f"Bearer {MCP_AUTH_TOKEN}")
+
+
+# --- Tareas de fondo (corren mientras el server está levantado) ---
+_TAREAS_DE_FONDO = []
+
+
+def tarea_de_fondo(funcion):
+    """Registra una corrutina sin argumentos que se lanza al arrancar el server."""
+    _TAREAS_DE_FONDO.append(funcion)
+    return funcion
+
+
+@asynccontextmanager
+async def _ciclo_de_vida(server):
+    tareas = [asyncio.create_task(funcion()) for funcion in _TAREAS_DE_FONDO]
+    try:
+        yield {}
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        await asyncio.gather(*(tenant.cerrar() for tenant in TENANTS.values()), return_exceptions=True)
+
 
 # --- MCP Server ---
-mcp = FastMCP("Expedientes Legales", stateless_http=True, json_response=True)
+mcp = FastMCP("Expedientes Legales", stateless_http=not MCP_SESIONES, json_response=not MCP_STREAMING, lifespan=_ciclo_de_vida)
+
+
+# ============================================================
+# MÉTRICAS (texto Prometheus en /metrics)
+# ============================================================
+
+_BUCKETS_SEG = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metricas:
+    """Contadores, gauges e histogramas en memoria del proceso."""
+
+    def __init__(self):
+        self.contadores = defaultdict(float)
+        self.gauges = {}
+        self.histogramas = {}
+
+    @staticmethod
+    def _clave(nombre: str, etiquetas: dict):
+        # Con varios tenants, toda serie se separa por el tenant de la tarea actual
+        if _MULTI_TENANT and not (etiquetas and "tenant" in etiquetas):
+            etiquetas = {**(etiquetas or {}), "tenant": tenant_actual().nombre}
+        return nombre, tuple(sorted((etiquetas or {}).items()))
+
+    def sumar(self, nombre: str, etiquetas: dict = None, valor: float = 1.0):
+        self.contadores[self._clave(nombre, etiquetas)] += valor
+
+    def fijar(self, nombre: str, valor: float, etiquetas: dict = None):
+        self.gauges[self._clave(nombre, etiquetas)] = valor
+
+    def observar(self, nombre: str, valor: float, etiquetas: dict = None, buckets: tuple = _BUCKETS_SEG):
+        clave = self._clave(nombre, etiquetas)
+        h = self.histogramas.get(clave)
+        if h is None:
+            h = self.histogramas[clave] = {"buckets": buckets, "cuentas": [0] * len(buckets), "suma": 0.0, "total": 0}
+        for i, limite in enumerate(h["buckets"]):
+            if valor <= limite:
+                h["cuentas"][i] += 1
+        h["suma"] += valor
+        h["total"] += 1
+
+    def exportar(self) -> str:
+        def etiquetar(etiquetas, extra=()):
+            pares = list(etiquetas) + list(extra)
+            if not pares:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+        lineas = []
+        for tipo, series in (("counter", self.contadores), ("gauge", self.gauges)):
+            vistos = set()
+            for (nombre, etiquetas), valor in sorted(series.items()):
+                if nombre not in vistos:
+                    lineas.append(f"# TYPE {nombre} {tipo}")
+                    vistos.add(nombre)
+                lineas.append(f"{nombre}{etiquetar(etiquetas)} {valor:g}")
+        vistos = set()
+        for (nombre, etiquetas), h in sorted(self.histogramas.items(), key=lambda x: x[0]):
+            if nombre not in vistos:
+                lineas.append(f"# TYPE {nombre} histogram")
+                vistos.add(nombre)
+            for limite, cuenta in zip(h["buckets"], h["cuentas"]):
+                lineas.append(f"{nombre}_bucket{etiquetar(etiquetas, [('le', f'{limite:g}')])} {cuenta}")
+            lineas.append(f"{nombre}_bucket{etiquetar(etiquetas, [('le', '+Inf')])} {h['total']}")
+            lineas.append(f"{nombre}_sum{etiquetar(etiquetas)} {h['suma']:g}")
+            lineas.append(f"{nombre}_count{etiquetar(etiquetas)} {h['total']}")
+        return "\n".join(lineas) + "\n"
+
+
+metricas = Metricas()
+
+
+# ============================================================
+# ADMISIÓN Y PRIORIDADES
+# ============================================================
+
+PRIORIDAD_INTERACTIVA = 0  # herramientas de un solo caso
+PRIORIDAD_BUSQUEDA = 1  # búsquedas por nombre (scans en Supabase)
+PRIORIDAD_LOTE = 2  # trabajos en segundo plano
+
+PRIORIDAD_POR_TOOL = {
+    "consultar_movimientos": PRIORIDAD_INTERACTIVA,
+    "consultar_movimientos_srt": PRIORIDAD_INTERACTIVA,
+    "buscar_caso": PRIORIDAD_BUSQUEDA,
+    "buscar_caso_srt": PRIORIDAD_BUSQUEDA,
+}
+_NOMBRE_PRIORIDAD = {PRIORIDAD_INTERACTIVA: "interactiva", PRIORIDAD_BUSQUEDA: "busqueda", PRIORIDAD_LOTE: "lote"}
+
+# Prioridad de los pedidos a Supabase hechos desde la tarea actual (fuera de una tool = lote)
+_prioridad = contextvars.ContextVar("prioridad_upstream", default=PRIORIDAD_LOTE)
+
+
+class TokenBuckets:
+    """Rate limiting por cliente: RATE_LIMIT_RAFAGA llamadas seguidas, recargando RATE_LIMIT_POR_MINUTO."""
+
+    def __init__(self, por_minuto: float, rafaga: int, max_clientes: int = 10000):
+        self.tasa = por_minuto / 60.0
+        self.rafaga = rafaga
+        self.max_clientes = max_clientes
+        self._buckets = OrderedDict()  # cliente -> (tokens, último acceso)
+
+    def tomar(self, cliente: str) -> bool:
+        if self.tasa <= 0:
+            return True
+        ahora = time.monotonic()
+        tokens, ultimo = self._buckets.pop(cliente, (self.rafaga, ahora))
+        tokens = min(self.rafaga, tokens + (ahora - ultimo) * self.tasa)
+        permitido = tokens >= 1
+        if permitido:
+            tokens -= 1
+        self._buckets[cliente] = (tokens, ahora)
+        if len(self._buckets) > self.max_clientes:
+            self._buckets.popitem(last=False)
+        return permitido
+
+
+class LimitadorUpstream:
+    """Semáforo con cola de prioridad delante de Supabase: con todos los cupos ocupados,
+    las herramientas interactivas pasan antes que las búsquedas y los trabajos en lote."""
+
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self.en_uso = 0
+        self._cola = []
+        self._orden = itertools.count()
+
+    def en_espera(self) -> int:
+        return sum(1 for _, _, fut in self._cola if not fut.done())
+
+    async def adquirir(self, prioridad: int, espera_max: float) -> None:
+        inicio = time.monotonic()
+        if self.en_uso < self.capacidad and not self.en_espera():
+            self.en_uso += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._cola, (prioridad, next(self._orden), fut))
+            try:
+                await asyncio.wait_for(fut, espera_max)
+            except asyncio.TimeoutError:
+                metricas.sumar("upstream_rechazos_total", {"prioridad": _NOMBRE_PRIORIDAD.get(prioridad, prioridad)})
+                raise httpx.PoolTimeout("Supabase saturado: se agotó la espera en la cola")
+            except asyncio.CancelledError:
+                # Si el turno llegó justo antes de la cancelación, devolverlo
+                if fut.done() and not fut.cancelled():
+                    self.liberar()
+                raise
+        metricas.observar(
+            "upstream_espera_cola_segundos", time.monotonic() - inicio,
+            {"prioridad": _NOMBRE_PRIORIDAD.get(prioridad, prioridad)},
+        )
+
+    def liberar(self) -> None:
+        while self._cola:
+            _, _, fut = heapq.heappop(self._cola)
+            if not fut.done():
+                fut.set_result(None)  # el cupo pasa directo al siguiente
+                return
+        self.en_uso -= 1
+
+
+buckets_clientes = TokenBuckets(RATE_LIMIT_POR_MINUTO, RATE_LIMIT_RAFAGA)
+
+
+class _TransporteAdmitido(httpx.AsyncBaseTransport):
+    """Transporte httpx que toma un cupo del limitador del tenant por cada pedido a Supabase."""
+
+    def __init__(self, interno: httpx.AsyncBaseTransport):
+        self._interno = interno
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limitador = tenant_actual().limitador
+        await limitador.adquirir(_prioridad.get(), UPSTREAM_ESPERA_MAX)
+        inicio = time.perf_counter()
+        try:
+            respuesta = await self._interno.handle_async_request(request)
+            # Leer el cuerpo acá para que el cupo cubra la transferencia completa
+            await respuesta.aread()
+        finally:
+            limitador.liberar()
+        duracion = time.perf_counter() - inicio
+        tabla = request.url.path.rsplit("/", 1)[-1]
+        metricas.observar("upstream_latencia_segundos", duracion, {"tabla": tabla})
+        if ASESOR_INDICES:
+            asesor_indices.registrar(request, duracion)
+        grabacion = _grabacion.get()
+        if grabacion is not None:
+            grabacion.append(grabador.pedido(request, respuesta, duracion))
+        return respuesta
+
+    async def aclose(self) -> None:
+        # El pool es del tenant y se reutiliza entre clientes: se cierra al apagar el server
+        pass
+
+
+def identidad_cliente() -> str:
+    """Identifica al llamador solo con lo que el server puede verificar: hash del Bearer token y,
+    con MCP_SESIONES, la sesión MCP que emitió el server. Un encabezado elegido por el cliente
+    (X-Cliente-Id) no sirve: rotándolo en cada pedido se saldría de su bucket."""
+    headers = get_http_headers(include_all=True)
+    token = headers.get("authorization", "")
+    base = f"token:{hashlib.sha256(token.encode()).hexdigest()[:12]}" if token else "anonimo"
+    # En modo stateless el server no emite sesiones: un Mcp-Session-Id recibido no está verificado
+    conversacion = headers.get("mcp-session-id") if MCP_SESIONES else None
+    return f"{base}/{conversacion}" if conversacion else base
+
+
+# Contexto MCP de la llamada en curso, para mandar resultados parciales (None = no se informa avance)
+_progreso = contextvars.ContextVar("progreso", default=None)
+
+
+async def informar_avance(paso: int, total: int, parcial: dict) -> None:
+    """Manda un resultado parcial como notificación de progreso. El cliente la recibe solo si
+    pidió progreso (progressToken); la respuesta final es la misma de siempre."""
+    ctx = _progreso.get()
+    if ctx is None:
+        return
+    try:
+        await ctx.report_progress(paso, total, json.dumps(parcial, ensure_ascii=False))
+    except Exception:
+        pass
+
+
+def _resultado_tool(payload: dict) -> ToolResult:
+    texto = json.dumps(payload, ensure_ascii=False)
+    return ToolResult(content=texto, structured_content={"result": texto})
+
+
+class Admision(Middleware):
+    """Rate limiting por cliente, prioridad upstream según la tool y métricas por tool."""
+
+    async def on_call_tool(self, context, call_next):
+        tool = context.message.name
+        tenant = tenant_por_token(get_http_headers(include_all=True).get("authorization", ""))
+        if tenant is None:
+            metricas.sumar("admision_no_autorizados_total", {"tool": tool})
+            return _resultado_tool({"error": "No autorizado."})
+
+        token_tenant = _tenant.set(tenant)
+        try:
+            if not buckets_clientes.tomar(identidad_cliente()):
+                metricas.sumar("admision_rechazos_total", {"tool": tool})
+                return _resultado_tool({"error": "Demasiadas consultas seguidas. Esperar unos segundos y volver a intentar."})
+
+            token = _prioridad.set(PRIORIDAD_POR_TOOL.get(tool, PRIORIDAD_BUSQUEDA))
+            token_progreso = _progreso.set(context.fastmcp_context if MCP_STREAMING else None)
+            sesion_perfil = perfilador.seguir(tool) if PROFILER_ACTIVO else None
+            medicion_memoria = memoria.empezar(tool) if MEMORIA_ACTIVA else None
+            token_grabacion = _grabacion.set([]) if GRABAR_PATH else None
+            token_sesion = _sesion.set(
+                context.fastmcp_context.session_id if MCP_SESIONES and context.fastmcp_context is not None else None
+            )
+            inicio = time.perf_counter()
+            resultado = None
+            try:
+                resultado = await call_next(context)
+                return resultado
+            finally:
+                if sesion_perfil is not None:
+                    perfilador.terminar_llamada(sesion_perfil)
+                if MEMORIA_ACTIVA:
+                    memoria.terminar(tool, medicion_memoria)
+                if token_grabacion is not None:
+                    grabador.llamada(tool, context.message.arguments, time.perf_counter() - inicio, _grabacion.get(), resultado)
+                    _grabacion.reset(token_grabacion)
+                _prioridad.reset(token)
+                _progreso.reset(token_progreso)
+                _sesion.reset(token_sesion)
+                metricas.sumar("tool_llamadas_total", {"tool": tool})
+                metricas.observar("tool_duracion_segundos", time.perf_counter() - inicio, {"tool": tool})
+        finally:
+            _tenant.reset(token_tenant)
+
+
+mcp.add_middleware(Admision())
+
+
+# ============================================================
+# TENANTS (UNO POR BEARER TOKEN)
+# ============================================================
+
+class Tenant:
+    """Un bot/estudio: su Supabase, su pool de conexiones, su cupo de concurrencia y su
+    espacio de cachés. Se elige por el Bearer token de cada llamada."""
+
+    def __init__(self, nombre: str, token: str, url: str, key: str, concurrencia: int,
+                 conexiones: int = None, webhook_token: str = ""):
+        self.nombre = nombre
+        self.token = token
+        self.url = url.strip().rstrip("/")
+        self.key = key.strip()
+        self.conexiones = conexiones or concurrencia
+        self.webhook_token = webhook_token or token
+        self.limitador = LimitadorUpstream(concurrencia)
+        # Disponibilidad de la RPC timeline_caso en su Supabase (ver _leer_timeline_rpc)
+        self.rpc_timeline = None
+        self.rpc_probada_en = 0.0
+        # Clave única de seguimientos_auto (ver guardar_seguimientos), mismo esquema
+        self.clave_unica_seguimientos = None
+        self.clave_unica_probada_en = 0.0
+        self._transporte = None
+
+    @property
+    def configurado(self) -> bool:
+        return bool(self.url and self.key)
+
+    def transporte(self) -> httpx.AsyncHTTPTransport:
+        if self._transporte is None:
+            self._transporte = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=self.conexiones, max_keepalive_connections=self.conexiones),
+            )
+        return self._transporte
+
+    async def cerrar(self) -> None:
+        if self._transporte is not None:
+            await self._transporte.aclose()
+            self._transporte = None
+
+
+def _leer_tenants() -> dict:
+    crudo = TENANTS_CONFIG
+    if not crudo and TENANTS_PATH:
+        with open(TENANTS_PATH, encoding="utf-8") as f:
+            crudo = f.read()
+    if not crudo:
+        return {"default": Tenant("default", MCP_AUTH_TOKEN, SUPABASE_URL, SUPABASE_KEY, UPSTREAM_CONCURRENCIA,
+                                  webhook_token=WEBHOOK_TOKEN)}
+    tenants = {}
+    for nombre, conf in json.loads(crudo).items():
+        if not conf.get("token"):
+            raise ValueError(f"TENANTS: falta el token de '{nombre}'")
+        tenants[nombre] = Tenant(
+            nombre,
+            conf["token"],
+            conf.get("supabase_url", SUPABASE_URL),
+            conf.get("supabase_key", SUPABASE_KEY),
+            int(conf.get("concurrencia", UPSTREAM_CONCURRENCIA)),
+            int(conf["conexiones"]) if conf.get("conexiones") else None,
+            conf.get("webhook_token", ""),
+        )
+    return tenants
+
+
+TENANTS = _leer_tenants()
+_MULTI_TENANT = len(TENANTS) > 1 or bool(TENANTS_CONFIG or TENANTS_PATH)
+if _MULTI_TENANT and not MCP_AUTH_TOKEN:
+    print("[admin] TENANTS sin MCP_AUTH_TOKEN: /metrics va a responder 401", file=sys.stderr)
+# Tenant de la tarea actual; fuera de una tool (tareas de fondo sin tenant propio) es el primero
+_TENANT_POR_DEFECTO = next(iter(TENANTS.values()))
+_tenant = contextvars.ContextVar("tenant")
+
+
+def tenant_actual() -> Tenant:
+    return _tenant.get(_TENANT_POR_DEFECTO)
+
+
+def tenant_por_token(authorization: str):
+    """Tenant del Bearer recibido. Con un solo tenant sin TENANTS configurado, cualquiera."""
+    if not _MULTI_TENANT:
+        return _TENANT_POR_DEFECTO
+    for tenant in TENANTS.values():
+        if hmac.compare_digest(authorization, f"Bearer {tenant.token}"):
+            return tenant
+    return None
+
+
+class PorTenant:
+    """Una instancia por tenant (creada al primer uso); atributos y métodos se resuelven
+    contra la del tenant actual, así las cachés no se mezclan ni compiten por lugar."""
+
+    def __init__(self, fabrica):
+        self._fabrica = fabrica
+        self._instancias = {}
+
+    def actual(self):
+        tenant = tenant_actual()
+        instancia = self._instancias.get(tenant.nombre)
+        if instancia is None:
+            instancia = self._instancias[tenant.nombre] = self._fabrica(tenant)
+        return instancia
+
+    def __getattr__(self, nombre):
+        return getattr(self.actual(), nombre)
+
+    def __len__(self) -> int:
+        return len(self.actual())
 
 
 # ============================================================
@@ -515,14 +984,127 @@ SEGUIMIENTOS_SRT = {
 # GENERACIÓN DE SEGUIMIENTOS (misma lógica que portal-clientes)
 # ============================================================
 
-def es_feria_judicial(fecha: datetime) -> bool:
-    mes = fecha.month
-    dia = fecha.day
-    if mes == 1:
-        return True
-    if mes == 7 and dia >= 16:
-        return True
-    return False
+CALENDARIO_PATH = os.environ.get(
+    "CALENDARIO_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "calendario_judicial.json")
+)
+# Un seguimiento que cae en día inhábil se corre al siguiente hábil si está a lo sumo a estos días
+# (fin de semana largo); más lejos (feria) se saltea, como antes
+_MAX_CORRIMIENTO_DIAS = 4
+
+
+def _pascua(anio: int) -> date:
+    """Domingo de Pascua (algoritmo anónimo gregoriano)."""
+    a, b, c = anio % 19, anio // 100, anio % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(anio, mes, dia + 1)
+
+
+def _trasladar(fecha: date) -> date:
+    """Ley 27.399: martes y miércoles pasan al lunes anterior; jueves y viernes al lunes siguiente."""
+    return fecha + timedelta(days={1: -1, 2: -2, 3: 4, 4: 3}.get(fecha.weekday(), 0))
+
+
+class _Anio(NamedTuple):
+    habiles: int        # bitmap: bit d = el día d del año (0 = 1 de enero) es hábil
+    siguiente: list     # siguiente[d] = primer día hábil >= d; dias si no queda ninguno en el año
+    acumulado: list     # acumulado[d] = días hábiles en [0, d)
+    dias: int
+
+
+class Calendario:
+    """Días hábiles (sin fines de semana, feriados y, si con_ferias, ferias judiciales).
+    Cada año se arma una sola vez, la primera vez que se lo consulta."""
+
+    def __init__(self, datos: dict, con_ferias: bool):
+        self.datos = datos
+        self.con_ferias = con_ferias
+        self._anios = {}
+
+    def _inhabiles(self, anio: int) -> set:
+        def fecha(texto):
+            return date.fromisoformat(texto if len(texto) == 10 else f"{anio}-{texto}")
+
+        dias = {fecha(f) for f in self.datos.get("inamovibles", [])}
+        del_anio = self.datos.get("por_anio", {}).get(str(anio), {})
+        if "feriados" in del_anio:
+            dias.update(fecha(f) for f in del_anio["feriados"])
+        else:
+            pascua = _pascua(anio)
+            dias.update(pascua + timedelta(days=d) for d in self.datos.get("pascua", {}).values())
+            dias.update(_trasladar(fecha(f)) for f in self.datos.get("trasladables", []))
+        if self.con_ferias:
+            for desde, hasta in del_anio.get("ferias", self.datos.get("ferias_por_defecto", [])):
+                dia, fin = fecha(desde), fecha(hasta)
+                while dia <= fin:
+                    dias.add(dia)
+                    dia += timedelta(days=1)
+        return dias
+
+    def _anio(self, anio: int) -> _Anio:
+        armado = self._anios.get(anio)
+        if armado is None:
+            inhabiles = self._inhabiles(anio)
+            primero = date(anio, 1, 1)
+            dias = (date(anio + 1, 1, 1) - primero).days
+            habiles = 0
+            acumulado = [0] * (dias + 1)
+            for d in range(dias):
+                dia = primero + timedelta(days=d)
+                es_habil = dia.weekday() < 5 and dia not in inhabiles
+                habiles |= es_habil << d
+                acumulado[d + 1] = acumulado[d] + es_habil
+            siguiente = [dias] * (dias + 1)
+            for d in range(dias - 1, -1, -1):
+                siguiente[d] = d if habiles >> d & 1 else siguiente[d + 1]
+            armado = self._anios[anio] = _Anio(habiles, siguiente, acumulado, dias)
+        return armado
+
+    def es_habil(self, fecha) -> bool:
+        return bool(self._anio(fecha.year).habiles >> (fecha.timetuple().tm_yday - 1) & 1)
+
+    def siguiente_habil(self, fecha):
+        """Primer día hábil >= fecha (del mismo tipo: date o datetime)."""
+        corrimiento = 0
+        anio, d = fecha.year, fecha.timetuple().tm_yday - 1
+        while True:
+            armado = self._anio(anio)
+            if armado.siguiente[d] < armado.dias:
+                return fecha + timedelta(days=corrimiento + armado.siguiente[d] - d)
+            corrimiento += armado.dias - d
+            anio, d = anio + 1, 0
+
+    def dias_habiles(self, desde, hasta) -> int:
+        """Días hábiles en (desde, hasta]."""
+        if hasta <= desde:
+            return 0
+        total = 0
+        anio, d = desde.year, desde.timetuple().tm_yday  # el día siguiente a desde
+        while anio < hasta.year:
+            armado = self._anio(anio)
+            total += armado.acumulado[armado.dias] - armado.acumulado[min(d, armado.dias)]
+            anio, d = anio + 1, 0
+        return total + self._anio(anio).acumulado[hasta.timetuple().tm_yday] - self._anio(anio).acumulado[d]
+
+
+def _leer_calendario() -> dict:
+    try:
+        with open(CALENDARIO_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[calendario] no se pudo leer {CALENDARIO_PATH}: {e}; se usan las reglas por defecto", file=sys.stderr)
+        return {"inamovibles": [], "ferias_por_defecto": [["01-01", "01-31"], ["07-16", "07-31"]]}
+
+
+_DATOS_CALENDARIO = _leer_calendario()
+calendario_judicial = Calendario(_DATOS_CALENDARIO, con_ferias=True)
+# La SRT y las comisiones médicas no tienen feria: solo fines de semana y feriados
+calendario_srt = Calendario(_DATOS_CALENDARIO, con_ferias=False)
 
 
 def seeded_random(seed: int, min_val: int, max_val: int, offset: int) -> int:
@@ -580,6 +1162,7 @@ def generar_seguimientos_para_rango(
     # Filtrar unaVez ya usados
     una_vez_disponibles = [s for s in una_vez if s["tipo"] not in tipos_usados]
 
+    calendario = calendario_srt if es_srt else calendario_judicial
     seed = caso_id or 1
     dias_inicio = seeded_random(seed, 8, 14, 0)
     fecha_actual = fecha_desde + timedelta(days=dias_inicio)
@@ -587,12 +1170,12 @@ def generar_seguimientos_para_rango(
     una_vez_idx = 0
 
     while fecha_actual < fecha_hasta and idx < 50:
-        fecha_str = fecha_actual.strftime("%Y-%m-%d")
-
-        # En SRT no aplica feria judicial
-        saltar_feria = not es_srt and es_feria_judicial(fecha_actual)
+        # Fin de semana o feriado: al siguiente día hábil. Feria: se saltea
+        fecha_habil = calendario.siguiente_habil(fecha_actual)
+        saltar = (fecha_habil - fecha_actual).days > _MAX_CORRIMIENTO_DIAS or fecha_habil >= fecha_hasta
+        fecha_str = fecha_habil.strftime("%Y-%m-%d")
 
-        if not saltar_feria and fecha_str not in fechas_existentes:
+        if not saltar and fecha_str not in fechas_existentes:
             seg = None
 
             # Primero unaVez
@@ -628,155 +1211,414 @@ def generar_seguimientos_para_rango(
     return seguimientos
 
 
-async def obtener_y_generar_movimientos(
-    caso_id: int,
-    estado_str: str,
-    es_srt: bool,
-    es_despido: bool,
-    headers: dict,
-    campo_id: str,
-) -> list:
-    """Obtiene movimientos reales + seguimientos guardados + genera nuevos para huecos."""
-    movs_reales = []
-    segs_guardados = []
-
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        # --- Movimientos reales ---
-        if es_srt:
-            # movimientos_srt
-            try:
-                resp = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/movimientos_srt",
-                    headers=headers,
-                    params={
-                        "select": "fecha,tipo_descripcion",
-                        "caso_srt_id": f"eq.{caso_id}",
-                        "order": "fecha.desc",
-                        "limit": "50",
-                    },
-                )
-                if resp.status_code == 200:
-                    for m in resp.json():
-                        movs_reales.append({
-                            "fecha": (m.get("fecha") or "")[:10],
-                            "descripcion": traducir_movimiento("", m.get("tipo_descripcion", ""), es_srt=True),
-                            "real": True,
-                        })
-            except Exception:
-                pass
+# Formato de las lecturas de filas a PostgREST (leer_tuplas): "json" o "csv". En CSV los nombres
+# de columna viajan una sola vez (encabezado) y la decodificación da tuplas sin armar dicts; NULL
+# llega como cadena vacía. Con una sola columna (prefiltro) se sigue pidiendo JSON: casi no repite
+# nada y json.loads la decodifica más rápido que csv. La compresión (gzip/deflate) la negocia httpx.
+POSTGREST_FORMATO = os.environ.get("POSTGREST_FORMATO", "json").strip().lower()
+
+
+def _tuplas_csv(texto: str, columnas: tuple) -> list:
+    """Cuerpo text/csv de PostgREST → tuplas en el orden de `columnas`."""
+    lector = csv.reader(io.StringIO(texto))
+    encabezado = next(lector, None)
+    if encabezado is None:
+        return []
+    if tuple(encabezado) == columnas:
+        return [tuple(fila) for fila in lector]
+    posiciones = [encabezado.index(c) for c in columnas]
+    return [tuple(fila[i] for i in posiciones) for fila in lector]
+
+
+_RE_HUSO_EN_HORAS = re.compile(r"([+-]\d\d)$")
+
+
+def _fecha_canonica(fecha):
+    """El mismo timestamp escrito siempre igual, como lo da el JSON de PostgREST
+    ('2024-05-01T10:00:00+00:00'). `fecha::text` (la RPC, el CSV) da '2024-05-01 10:00:00+00'."""
+    if not fecha or len(fecha) <= 10:
+        return fecha
+    if fecha[10] == " ":
+        fecha = f"{fecha[:10]}T{fecha[11:]}"
+    return _RE_HUSO_EN_HORAS.sub(r"\1:00", fecha)
+
+
+def _tuplas_json(filas: list, columnas: tuple) -> list:
+    """Filas JSON de PostgREST (traen todas las columnas pedidas) → tuplas en el orden de `columnas`."""
+    if len(columnas) == 1:
+        return [(f[columnas[0]],) for f in filas]
+    return list(map(itemgetter(*columnas), filas))
+
+
+async def leer_tuplas(client: httpx.AsyncClient, ruta: str, columnas: tuple, headers: dict,
+                      params: dict = None, cuerpo: dict = None) -> tuple:
+    """GET a una tabla pidiendo solo `columnas` (o POST a una RPC si se pasa `cuerpo`).
+    Devuelve (status, filas como tuplas en el orden de `columnas`); sin filas si status != 200."""
+    if POSTGREST_FORMATO == "csv" and len(columnas) > 1:
+        headers = {**headers, "Accept": "text/csv"}
+    url = f"{tenant_actual().url}/rest/v1/{ruta}"
+    if cuerpo is None:
+        resp = await client.get(url, headers=headers, params={"select": ",".join(columnas), **(params or {})})
+    else:
+        resp = await client.post(url, headers={**headers, "Content-Type": "application/json"}, content=json.dumps(cuerpo))
+    if resp.status_code != 200:
+        return resp.status_code, []
+    if resp.headers.get("content-type", "").startswith("text/csv"):
+        return 200, _tuplas_csv(resp.text, columnas)
+    return 200, _tuplas_json(resp.json(), columnas)
+
+
+# Filas de la timeline: movimientos (origen, fecha, tipo, descripcion) y seguimientos guardados
+# (fecha, tipo, descripcion)
+_COLUMNAS_RPC_TIMELINE = ("origen", "fecha", "tipo", "descripcion")
+_COLUMNAS_SEGUIMIENTOS = ("fecha", "tipo", "descripcion")
+
+
+# Disponibilidad de la RPC timeline_caso (migrations/001_timeline_caso.sql), por tenant.
+# None = no se probó todavía; False = no existe, se vuelve a probar pasado _RPC_REINTENTO_SEG.
+_RPC_REINTENTO_SEG = 600
+
+
+async def _leer_timeline_rpc(client: httpx.AsyncClient, caso_id: int, es_srt: bool, headers: dict):
+    """Lee movimientos reales y seguimientos guardados con una sola llamada a la RPC timeline_caso.
+    Devuelve (movs, segs) como tuplas crudas, o None si hay que usar las consultas separadas."""
+    tenant = tenant_actual()
+    if tenant.rpc_timeline is False and time.monotonic() - tenant.rpc_probada_en < _RPC_REINTENTO_SEG:
+        return None
+
+    try:
+        status, filas = await leer_tuplas(
+            client, "rpc/timeline_caso", _COLUMNAS_RPC_TIMELINE, headers,
+            cuerpo={"p_caso_id": caso_id, "p_es_srt": es_srt, "p_limite": 50},
+        )
+    except Exception:
+        return None
+
+    if status != 200:
+        # 404 = la función no existe (migración no aplicada): no insistir en cada llamada
+        if status == 404:
+            tenant.rpc_timeline = False
+            tenant.rpc_probada_en = time.monotonic()
+        return None
+
+    tenant.rpc_timeline = True
+    movs = []
+    segs = []
+    for fila in filas:
+        if fila[0] == "seguimiento":
+            segs.append(fila[1:])
         else:
-            # movimientos_pjn (CABA)
-            try:
-                resp = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/movimientos_pjn",
-                    headers=headers,
-                    params={
-                        "select": "fecha,tipo,descripcion",
-                        "expediente_id": f"eq.{caso_id}",
-                        "order": "fecha.desc",
-                        "limit": "50",
-                    },
-                )
-                if resp.status_code == 200:
-                    for m in resp.json():
-                        movs_reales.append({
-                            "fecha": (m.get("fecha") or "")[:10],
-                            "descripcion": traducir_movimiento(m.get("tipo", ""), m.get("descripcion", "")),
-                            "real": True,
-                        })
-            except Exception:
-                pass
+            movs.append(fila)
+    return movs, segs
 
-            # movimientos_judicial (Provincia/MEV)
-            try:
-                resp = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/movimientos_judicial",
-                    headers=headers,
-                    params={
-                        "select": "fecha,tipo,descripcion",
-                        "expediente_id": f"eq.{caso_id}",
-                        "order": "fecha.desc",
-                        "limit": "50",
+
+# Sin movimientos reales solo se muestran seguimientos guardados: alcanza con los más recientes
+SEGUIMIENTOS_SIN_MOVS_LIMITE = 200
+
+
+def _inicio_ventana(filas_movs: list):
+    """Fecha (YYYY-MM-DD) del movimiento real más antiguo leído. Los seguimientos anteriores
+    se descartan al armar la timeline, así que no hace falta leerlos."""
+    fechas = [f[:10] for f in ((m[1] or "") for m in filas_movs) if len(f) >= 10]
+    return min(fechas) if fechas else None
+
+
+_TABLAS_SRT = [("movimientos_srt", ("fecha", "tipo_descripcion"), "caso_srt_id")]
+_TABLAS_JUDICIALES = [
+    ("movimientos_pjn", ("fecha", "tipo", "descripcion"), "expediente_id"),  # CABA
+    ("movimientos_judicial", ("fecha", "tipo", "descripcion"), "expediente_id"),  # Provincia/MEV
+]
+# Movimientos leídos por tabla (el p_limite de la RPC)
+_MOVIMIENTOS_POR_TABLA = 50
+
+
+async def _leer_movimientos(client: httpx.AsyncClient, tabla: str, columnas: tuple, columna: str,
+                            caso_id: int, es_srt: bool, headers: dict, desde: str = None) -> list:
+    """Últimos movimientos de una tabla (solo los de fecha >= desde, si se pasa)."""
+    params = {
+        columna: f"eq.{caso_id}",
+        "order": "fecha.desc",
+        "limit": str(_MOVIMIENTOS_POR_TABLA),
+    }
+    if desde:
+        params["fecha"] = f"gte.{desde}"
+    try:
+        _, filas = await leer_tuplas(client, tabla, columnas, headers, params)
+    except Exception:
+        return []
+    if es_srt:
+        return [(tabla, fecha, "", descripcion) for fecha, descripcion in filas]
+    return [(tabla, *m) for m in filas]
+
+
+async def _leer_timeline_rest(client: httpx.AsyncClient, caso_id: int, es_srt: bool, headers: dict, campo_id: str):
+    """Camino clásico: una consulta por tabla de movimientos + una a seguimientos_auto.
+    Devuelve (movs, segs) con las mismas tuplas que _leer_timeline_rpc."""
+    tablas = _TABLAS_SRT if es_srt else _TABLAS_JUDICIALES
+    movs = []
+    for filas in await asyncio.gather(*(_leer_movimientos(client, *t, caso_id, es_srt, headers) for t in tablas)):
+        movs.extend(filas)
+
+    # Seguimientos acotados a la ventana de los movimientos reales (antes no se limitaba y
+    # la lectura crecía con toda la historia del caso)
+    params = {
+        campo_id: f"eq.{caso_id}",
+        "order": "fecha.desc",
+    }
+    desde = _inicio_ventana(movs)
+    if desde:
+        params["fecha"] = f"gte.{desde}"
+    else:
+        params["limit"] = str(SEGUIMIENTOS_SIN_MOVS_LIMITE)
+
+    segs = []
+    try:
+        _, segs = await leer_tuplas(client, "seguimientos_auto", _COLUMNAS_SEGUIMIENTOS, headers, params)
+    except Exception:
+        pass
+
+    return movs, segs
+
+
+async def leer_timeline_completa(client: httpx.AsyncClient, caso_id: int, es_srt: bool, headers: dict, campo_id: str) -> tuple:
+    """(movs, segs) del caso: una sola llamada si la RPC está instalada; si no, las consultas separadas."""
+    leido = await _leer_timeline_rpc(client, caso_id, es_srt, headers)
+    if leido is None:
+        leido = await _leer_timeline_rest(client, caso_id, es_srt, headers, campo_id)
+    return leido
+
+
+# Clave única de migrations/004_seguimientos_auto_unico.sql
+_CONFLICTO_SEGUIMIENTOS = "expediente_id,caso_srt_id,fecha"
+
+
+async def guardar_seguimientos(datos: list, headers: dict) -> None:
+    """Inserta seguimientos_auto ignorando duplicados (fire & forget). Con la clave única
+    instalada los duplicados se resuelven por (caso, fecha); si no, solo por id."""
+    tenant = tenant_actual()
+    usar_clave = (
+        tenant.clave_unica_seguimientos is not False
+        or time.monotonic() - tenant.clave_unica_probada_en >= _RPC_REINTENTO_SEG
+    )
+    try:
+        async with _cliente(10.0) as client:
+            # Con el canal entre réplicas pide de vuelta las filas insertadas (solo las claves del
+            # caso): los duplicados ignorados no cambian ninguna timeline y no se anuncian
+            preferir = "return=representation,resolution=ignore-duplicates" if replicas.activa else "resolution=ignore-duplicates"
+            seleccion = {"select": "expediente_id,caso_srt_id"} if replicas.activa else {}
+
+            async def insertar(params: dict) -> httpx.Response:
+                return await client.post(
+                    f"{tenant.url}/rest/v1/seguimientos_auto",
+                    params={**params, **seleccion},
+                    headers={
+                        **headers,
+                        "Content-Type": "application/json",
+                        "Prefer": preferir,
                     },
+                    content=json.dumps(datos),
                 )
-                if resp.status_code == 200:
-                    for m in resp.json():
-                        movs_reales.append({
-                            "fecha": (m.get("fecha") or "")[:10],
-                            "descripcion": traducir_movimiento(m.get("tipo", ""), m.get("descripcion", "")),
-                            "real": True,
-                        })
-            except Exception:
-                pass
 
-        # --- Seguimientos ya guardados ---
-        try:
-            resp = await client.get(
-                f"{SUPABASE_URL}/rest/v1/seguimientos_auto",
-                headers=headers,
-                params={
-                    "select": "fecha,tipo,descripcion",
-                    campo_id: f"eq.{caso_id}",
-                    "order": "fecha.desc",
-                },
-            )
-            if resp.status_code == 200:
-                for s in resp.json():
-                    segs_guardados.append({
-                        "fecha": (s.get("fecha") or "")[:10],
-                        "tipo": s.get("tipo", ""),
-                        "descripcion": s.get("descripcion", ""),
-                        "real": False,
-                    })
-        except Exception:
-            pass
+            if not usar_clave:
+                resp = await insertar({})
+            else:
+                resp = await insertar({"on_conflict": _CONFLICTO_SEGUIMIENTOS})
+                # 42P10 = no hay índice único para ese on_conflict (migración no aplicada)
+                if resp.status_code == 400 and "42P10" in resp.text:
+                    tenant.clave_unica_seguimientos = False
+                    tenant.clave_unica_probada_en = time.monotonic()
+                    resp = await insertar({})
+                elif resp.status_code < 300:
+                    tenant.clave_unica_seguimientos = True
+        # Las otras réplicas pueden tener la timeline de estos casos sin los seguimientos nuevos
+        if resp.status_code < 300 and replicas.activa:
+            replicas.anunciar({
+                ("exp", d["expediente_id"]) if d.get("expediente_id") is not None else ("srt", d["caso_srt_id"])
+                for d in resp.json()
+            })
+    except Exception:
+        pass
 
-    # --- Filtrar movimientos sin fecha válida ---
-    movs_reales = [m for m in movs_reales if m["fecha"] and len(m["fecha"]) >= 10]
-    segs_guardados = [s for s in segs_guardados if s["fecha"] and len(s["fecha"]) >= 10]
 
-    # --- Ordenar movimientos reales por fecha desc ---
-    movs_reales.sort(key=lambda x: x["fecha"], reverse=True)
+# Timelines leídas por caso: mientras no venza la lectura completa, la siguiente consulta pide a
+# cada tabla de movimientos solo las filas más nuevas que la última que se tiene
+TIMELINE_DELTA = os.environ.get("TIMELINE_DELTA", "1") == "1"
+TIMELINE_COMPLETA_SEG = float(os.environ.get("TIMELINE_COMPLETA_SEG", 900))
+TIMELINE_MAX_CASOS = int(os.environ.get("TIMELINE_MAX_CASOS", 500))
+
+# Origen de la RPC -> tabla (las filas guardadas usan siempre el nombre de la tabla)
+_TABLA_POR_ORIGEN = {"pjn": "movimientos_pjn", "judicial": "movimientos_judicial", "srt": "movimientos_srt"}
+
+
+class TimelineLeida:
+    """Tuplas crudas de la última lectura de un caso: movimientos por tabla (fecha desc, como
+    mucho _MOVIMIENTOS_POR_TABLA, fechas en _fecha_canonica) y seguimientos guardados."""
+
+    __slots__ = ("movs", "segs", "ultima", "refrescada")
+
+    def __init__(self, filas_movs: list, filas_segs: list, es_srt: bool):
+        tablas = _TABLAS_SRT if es_srt else _TABLAS_JUDICIALES
+        self.movs = {tabla: [] for tabla, _, _ in tablas}
+        for m in filas_movs:
+            tabla = _TABLA_POR_ORIGEN.get(m[0], m[0])
+            self.movs.setdefault(tabla, []).append((tabla, _fecha_canonica(m[1]), *m[2:]))
+        self.segs = filas_segs
+        self.ultima = None  # fecha (YYYY-MM-DD) del movimiento más nuevo antes del último delta
+        # Si la releyó el refresco anticipado y ninguna consulta la usó todavía: fecha hasta la que
+        # sus huecos ya se rellenaron (los movimientos que trajo la relectura pueden abrir huecos nuevos)
+        self.refrescada = None
+
+    def mas_nuevo(self, tabla: str):
+        filas = self.movs.get(tabla)
+        return filas[0][1] if filas else None
+
+    def rellenada_hasta(self) -> str:
+        """Fecha (YYYY-MM-DD) del movimiento más nuevo, o "" sin movimientos."""
+        return max((self.mas_nuevo(tabla) or "" for tabla in self.movs), default="")[:10]
+
+    def agregar_movimientos(self, tabla: str, nuevas: list, desde: str) -> int:
+        """Suma las filas de una lectura con fecha >= `desde` que no se tenían (fecha desc, se
+        conservan las mismas que traería una lectura completa). Devuelve cuántas sumó.
+
+        Las filas no tienen id: las ya tenidas se descuentan como multiconjunto, así entra un
+        movimiento nuevo con la misma fecha que el más nuevo tenido y no se repiten los de esa fecha."""
+        actuales = self.movs.get(tabla, [])
+        tenidas = Counter(m for m in actuales if (m[1] or "") >= desde)
+        sumadas = []
+        for fila in ((m[0], _fecha_canonica(m[1]), *m[2:]) for m in nuevas):
+            if tenidas[fila] > 0:
+                tenidas[fila] -= 1
+            else:
+                sumadas.append(fila)
+        if sumadas:
+            filas = sorted(sumadas + actuales, key=lambda m: m[1] or "", reverse=True)
+            self.movs[tabla] = filas[:_MOVIMIENTOS_POR_TABLA]
+        return len(sumadas)
+
+    def agregar_seguimientos(self, nuevos: list) -> None:
+        """`nuevos` son los dicts que se guardan en seguimientos_auto."""
+        filas = [tuple(s.get(c) for c in _COLUMNAS_SEGUIMIENTOS) for s in nuevos]
+        self.segs = sorted(self.segs + filas, key=lambda s: s[0] or "", reverse=True)
+
+    def filas(self) -> tuple:
+        movs = [m for filas in self.movs.values() for m in filas]
+        desde = _inicio_ventana(movs)
+        if desde:
+            segs = [s for s in self.segs if (s[0] or "")[:10] >= desde]
+        else:
+            segs = self.segs[:SEGUIMIENTOS_SIN_MOVS_LIMITE]
+        return movs, segs
+
+
+async def _leer_timeline_delta(client: httpx.AsyncClient, leida: TimelineLeida, caso_id: int, es_srt: bool, headers: dict) -> None:
+    """Pide a cada tabla de movimientos solo las filas desde la fecha de la más nueva que se tiene.
+    Los seguimientos no se releen: los genera este server (se agregan al guardarlos) y los que
+    guarda otra réplica llegan como invalidación; la lectura completa periódica corrige el resto."""
+    tablas = _TABLAS_SRT if es_srt else _TABLAS_JUDICIALES
+    desdes = [leida.mas_nuevo(tabla) or None for tabla, _, _ in tablas]
+    nuevas = await asyncio.gather(*(
+        _leer_movimientos(client, tabla, columnas, columna, caso_id, es_srt, headers, desde)
+        for (tabla, columnas, columna), desde in zip(tablas, desdes)
+    ))
+    leida.ultima = leida.rellenada_hasta() or None
+    for (tabla, _, _), desde, filas in zip(tablas, desdes, nuevas):
+        sumadas = leida.agregar_movimientos(tabla, filas, desde or "") if filas else 0
+        if sumadas:
+            metricas.sumar("timeline_delta_filas_total", valor=sumadas)
+
+
+class Registro(NamedTuple):
+    """Entrada mínima de la timeline. En movimientos reales `tipo`/`texto` son los crudos
+    (se traducen recién al emitirse); en seguimientos son el tipo y la descripción."""
+    fecha: str
+    tipo: str
+    texto: str
+    real: bool
+
+
+_fecha_registro = itemgetter(0)
+
+# Orden entre fuentes para fechas iguales (el mismo que tenía la concatenación original)
+_ORDEN_ORIGEN = {"movimientos_pjn": 0, "pjn": 0, "movimientos_judicial": 1, "judicial": 1, "movimientos_srt": 2, "srt": 2}
+
+
+def _ordenada_desc(registros: list) -> list:
+    """Las fuentes ya vienen ordenadas por fecha desc; por las dudas, verificarlo (O(n))."""
+    if any(a.fecha < b.fecha for a, b in zip(registros, registros[1:])):
+        registros.sort(key=_fecha_registro, reverse=True)
+    return registros
+
+
+def preparar_fuentes(filas_movs: list, filas_segs: list) -> tuple:
+    """Tuplas crudas → (movimientos reales, seguimientos guardados) como registros ordenados
+    por fecha desc, descartando fechas inválidas y seguimientos anteriores al primer movimiento."""
+    por_origen = {}
+    for origen, fecha, tipo, descripcion in filas_movs:
+        fecha = (fecha or "")[:10]
+        if len(fecha) >= 10:
+            por_origen.setdefault(origen, []).append(Registro(fecha, tipo, descripcion, True))
+    fuentes = [_ordenada_desc(por_origen[o]) for o in sorted(por_origen, key=lambda o: _ORDEN_ORIGEN.get(o, 9))]
+    movs = list(heapq.merge(*fuentes, key=_fecha_registro, reverse=True))
+
+    # Seguimientos guardados desde el primer mov real (el más antiguo)
+    desde = movs[-1].fecha if movs else ""
+    segs = []
+    for fecha, tipo, descripcion in filas_segs:
+        fecha = (fecha or "")[:10]
+        if len(fecha) >= 10 and fecha >= desde:
+            segs.append(Registro(fecha, tipo, descripcion, False))
+    return movs, _ordenada_desc(segs)
+
+
+def fusionar_timeline(movs: list, segs: list, nuevos: list, es_srt: bool, limite: int = 20) -> list:
+    """Mezcla perezosa (k-way) de las tres fuentes ordenadas por fecha desc: traduce los
+    movimientos reales, saltea seguimientos repetidos consecutivos y corta al llegar a `limite`.
+    Para fechas iguales respeta el orden movs → segs → nuevos, como el sort estable de antes."""
+    resultado = []
+    anterior = None
+    for fecha, tipo, texto, real in heapq.merge(movs, segs, nuevos, key=_fecha_registro, reverse=True):
+        if real:
+            descripcion = traducir_movimiento(tipo, texto, es_srt=es_srt)
+        elif texto == anterior and resultado:
+            # Repetido consecutivo del estudio
+            continue
+        else:
+            descripcion = texto
+        resultado.append({"fecha": fecha, "descripcion": descripcion})
+        anterior = descripcion
+        if len(resultado) >= limite:
+            break
+    return resultado
 
-    # Fecha del primer movimiento (el más antiguo)
-    fecha_primer_mov = None
-    if movs_reales:
-        try:
-            fecha_primer_mov = datetime.strptime(movs_reales[-1]["fecha"], "%Y-%m-%d")
-        except ValueError:
-            pass
 
-    # Filtrar seguimientos guardados anteriores al primer mov real
-    if fecha_primer_mov:
-        segs_guardados = [s for s in segs_guardados if s["fecha"] >= fecha_primer_mov.strftime("%Y-%m-%d")]
+# Huecos que se rellenan con seguimientos, en días hábiles del calendario del caso (equivalen a
+# los 12 y 30 días corridos de antes; la feria y los feriados no cuentan como inactividad)
+HUECO_HASTA_HOY_HABILES = 8
+HUECO_ENTRE_MOVS_HABILES = 21
 
-    # --- Preparar para generación ---
-    fechas_existentes = set()
-    for m in movs_reales:
-        fechas_existentes.add(m["fecha"])
-    for s in segs_guardados:
-        fechas_existentes.add(s["fecha"])
 
-    tipos_usados = set()
-    for s in segs_guardados:
-        if s.get("tipo"):
-            tipos_usados.add(s["tipo"])
+def generar_para_huecos(movs_reales: list, segs_guardados: list, caso_id: int, estado_str: str,
+                        es_srt: bool, es_despido: bool, ultima: str = None) -> list:
+    """Seguimientos nuevos para los huecos de la timeline (hasta hoy y entre movimientos reales).
+    Es la fase de CPU de obtener_y_generar_movimientos: no toca el loop ni Supabase."""
+    fechas_existentes = {m.fecha for m in movs_reales}
+    fechas_existentes.update(s.fecha for s in segs_guardados)
+    tipos_usados = {s.tipo for s in segs_guardados if s.tipo}
 
     etapa = extraer_etapa(estado_str)
 
     # Estado compartido entre llamadas
-    segs_ord = sorted(segs_guardados, key=lambda x: x["fecha"], reverse=True)
-    estado_compartido = {"ultimo_tipo": segs_ord[0]["tipo"] if segs_ord else None}
+    estado_compartido = {"ultimo_tipo": segs_guardados[0].tipo if segs_guardados else None}
 
     nuevos_generados = []
     hoy = datetime.now()
+    calendario = calendario_srt if es_srt else calendario_judicial
 
     if movs_reales:
-        # Hueco desde último movimiento hasta hoy (>12 días)
+        # Hueco desde último movimiento hasta hoy
         try:
-            ultima_fecha = datetime.strptime(movs_reales[0]["fecha"], "%Y-%m-%d")
-            dias_desde_ultimo = (hoy - ultima_fecha).days
-            if dias_desde_ultimo > 12:
+            ultima_fecha = datetime.strptime(movs_reales[0].fecha, "%Y-%m-%d")
+            if calendario.dias_habiles(ultima_fecha, hoy) > HUECO_HASTA_HOY_HABILES:
                 nuevos = generar_seguimientos_para_rango(
                     ultima_fecha, hoy, caso_id, fechas_existentes, tipos_usados,
                     estado_compartido, etapa, es_srt, es_despido, estado_str,
@@ -785,13 +1627,14 @@ async def obtener_y_generar_movimientos(
         except ValueError:
             pass
 
-        # Huecos entre movimientos reales (>30 días)
+        # Huecos entre movimientos reales (solo los que tocan movimientos nuevos, si se sabe cuáles)
         for i in range(len(movs_reales) - 1):
+            if ultima and movs_reales[i].fecha <= ultima:
+                break
             try:
-                fecha_actual = datetime.strptime(movs_reales[i]["fecha"], "%Y-%m-%d")
-                fecha_anterior = datetime.strptime(movs_reales[i + 1]["fecha"], "%Y-%m-%d")
-                dias_entre = (fecha_actual - fecha_anterior).days
-                if dias_entre > 30:
+                fecha_actual = datetime.strptime(movs_reales[i].fecha, "%Y-%m-%d")
+                fecha_anterior = datetime.strptime(movs_reales[i + 1].fecha, "%Y-%m-%d")
+                if calendario.dias_habiles(fecha_anterior, fecha_actual) > HUECO_ENTRE_MOVS_HABILES:
                     nuevos = generar_seguimientos_para_rango(
                         fecha_anterior, fecha_actual, caso_id, fechas_existentes, tipos_usados,
                         estado_compartido, etapa, es_srt, es_despido, estado_str,
@@ -808,57 +1651,111 @@ async def obtener_y_generar_movimientos(
         )
         nuevos_generados.extend(nuevos)
 
+    return nuevos_generados
+
+
+def dias_a_rellenar(movs_reales: list, segs_guardados: list, ultima: str = None) -> int:
+    """Días corridos que recorre generar_para_huecos: su costo crece con el tramo a rellenar, no
+    con las filas (una timeline tiene como mucho 2 × _MOVIMIENTOS_POR_TABLA movimientos)."""
+    if not movs_reales:
+        return 0 if segs_guardados else 90
+    desde = movs_reales[-1].fecha
+    if ultima:
+        # El hueco más viejo que se mira termina en el primer movimiento ya rellenado
+        desde = next((m.fecha for m in movs_reales if m.fecha <= ultima), desde)
+    try:
+        return (datetime.now() - datetime.strptime(desde, "%Y-%m-%d")).days
+    except ValueError:
+        return 0
+
+
+async def obtener_y_generar_movimientos(
+    caso_id: int,
+    estado_str: str,
+    es_srt: bool,
+    es_despido: bool,
+    headers: dict,
+    campo_id: str,
+    pendientes: list = None,
+) -> list:
+    """Obtiene movimientos reales + seguimientos guardados + genera nuevos para huecos.
+    Si se pasa `pendientes`, los seguimientos nuevos se agregan ahí en vez de guardarse."""
+    argumentos = (caso_id, estado_str, es_srt, es_despido, headers, campo_id, pendientes)
+    if not TIMELINE_DELTA:
+        return await _obtener_y_generar_movimientos(*argumentos)
+    async with bloqueos_timeline.tomar(("srt" if es_srt else "exp", caso_id)):
+        return await _obtener_y_generar_movimientos(*argumentos)
+
+
+async def _obtener_y_generar_movimientos(
+    caso_id: int, estado_str: str, es_srt: bool, es_despido: bool, headers: dict, campo_id: str, pendientes: list,
+) -> list:
+    clave = ("srt" if es_srt else "exp", caso_id)
+    leida = timelines.obtener(clave) if TIMELINE_DELTA else None
+    async with _cliente(15.0) as client:
+        if leida is not None:
+            rellenada = leida.refrescada
+            await _leer_timeline_delta(client, leida, caso_id, es_srt, headers)
+            if rellenada is not None:
+                # Sin el refresco anticipado la entrada habría vencido y esta sería una lectura completa
+                leida.refrescada = None
+                leida.ultima = min(leida.ultima or "", rellenada) or None
+                metricas.sumar("refresco_aciertos_total", {"tipo": clave[0]})
+            metricas.sumar("timeline_lecturas_total", {"tipo": "delta"})
+        else:
+            leido = await leer_timeline_completa(client, caso_id, es_srt, headers, campo_id)
+            metricas.sumar("timeline_lecturas_total", {"tipo": "completa"})
+            if TIMELINE_DELTA:
+                leida = TimelineLeida(*leido, es_srt)
+                timelines.guardar(clave, leida)
+    filas_movs, filas_segs = leida.filas() if leida is not None else leido
+    # Los huecos entre movimientos anteriores a `ultima` ya se rellenaron en una lectura previa
+    ultima = leida.ultima if leida is not None else None
+
+    movs_reales, segs_guardados = await en_trabajador(len(filas_movs) + len(filas_segs), preparar_fuentes, filas_movs, filas_segs)
+    if _progreso.get() is not None:
+        await informar_avance(2, 3, {
+            campo_id: caso_id, "parcial": "movimientos_reales",
+            "movimientos": fusionar_timeline(movs_reales, [], [], es_srt),
+        })
+
+    nuevos_generados = await en_trabajador(
+        dias_a_rellenar(movs_reales, segs_guardados, ultima), generar_para_huecos,
+        movs_reales, segs_guardados, caso_id, estado_str, es_srt, es_despido, ultima,
+        umbral=BUCLE_DESCARGAR_DIAS,
+    )
+
+    nuevos = sorted(
+        (Registro(s["fecha"], s["tipo"], s["descripcion"], False) for s in nuevos_generados),
+        key=_fecha_registro, reverse=True,
+    )
+    if nuevos and _progreso.get() is not None:
+        await informar_avance(3, 3, {
+            campo_id: caso_id, "parcial": "seguimientos", "movimientos": fusionar_timeline([], [], nuevos, es_srt),
+        })
+
     # --- Guardar nuevos en Supabase (fire & forget) ---
+    if nuevos_generados and leida is not None:
+        leida.agregar_seguimientos(nuevos_generados)
     if nuevos_generados:
-        try:
-            datos = []
-            for s in nuevos_generados:
-                registro = {
-                    campo_id: caso_id,
-                    "fecha": s["fecha"],
-                    "tipo": s["tipo"],
-                    "descripcion": s["descripcion"],
-                }
-                datos.append(registro)
+        datos = []
+        for s in nuevos_generados:
+            registro = {
+                campo_id: caso_id,
+                "fecha": s["fecha"],
+                "tipo": s["tipo"],
+                "descripcion": s["descripcion"],
+            }
+            datos.append(registro)
 
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                await client.post(
-                    f"{SUPABASE_URL}/rest/v1/seguimientos_auto",
-                    headers={
-                        **headers,
-                        "Content-Type": "application/json",
-                        "Prefer": "resolution=ignore-duplicates",
-                    },
-                    content=json.dumps(datos),
-                )
-        except Exception:
-            pass
+        if pendientes is not None:
+            # El llamador los guarda en lote (ver generar_snapshot)
+            pendientes.extend(datos)
+        else:
+            await guardar_seguimientos(datos, headers)
 
     # --- Combinar todo ---
-    todos = []
-    for m in movs_reales:
-        todos.append({"fecha": m["fecha"], "descripcion": m["descripcion"], "tipo_entrada": "judicial" if not es_srt else "srt"})
-    for s in segs_guardados:
-        todos.append({"fecha": s["fecha"], "descripcion": s["descripcion"], "tipo_entrada": "estudio"})
-    for s in nuevos_generados:
-        todos.append({"fecha": s["fecha"], "descripcion": s["descripcion"], "tipo_entrada": "estudio"})
-
-    # Ordenar por fecha desc
-    todos.sort(key=lambda x: x["fecha"], reverse=True)
-
-    # Filtrar repetidos consecutivos del estudio
-    filtrados = []
-    for item in todos:
-        if item["tipo_entrada"] != "estudio":
-            filtrados.append(item)
-        elif not filtrados or filtrados[-1].get("descripcion") != item["descripcion"]:
-            filtrados.append(item)
-
-    # Quitar tipo_entrada del output (es interno, el cliente no debe verlo)
-    resultado = []
-    for item in filtrados[:20]:
-        resultado.append({"fecha": item["fecha"], "descripcion": item["descripcion"]})
-    return resultado
+    return fusionar_timeline(movs_reales, segs_guardados, nuevos, es_srt)
 
 
 def limpiar_caratula(caratula: str) -> str:
@@ -876,45 +1773,1689 @@ def limpiar_caratula(caratula: str) -> str:
 
 
 # ============================================================
-# TOOLS MCP
+# CACHÉS Y PREFILTRO DE NOMBRES
 # ============================================================
 
-@mcp.tool()
-async def buscar_caso(nombre: str) -> str:
-    """Busca el caso de un cliente por su nombre completo en la base de expedientes legales.
-    Devuelve la caratula, el estado actual y un ID de referencia.
-    IMPORTANTE: Solo compartir con el cliente la caratula y el estado del caso.
-    Explicarle al cliente en que consiste ese estado en terminos simples.
-    No revelar numero de expediente, juzgado ni datos internos.
-
-    Args:
-        nombre: Nombre completo o parcial del cliente (ej: "Perez Juan")
-    """
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        return json.dumps({"error": "Variables de entorno SUPABASE_URL o SUPABASE_KEY no configuradas."})
+NEGATIVOS_TTL = float(os.environ.get("NEGATIVOS_TTL", 120))
+# El prefiltro descarta búsquedas solo con un índice de hasta NEGATIVOS_TTL: más viejo se
+# reconstruye en la próxima búsqueda aunque PREFILTRO_INTERVALO sea mayor
+PREFILTRO_INTERVALO = float(os.environ.get("PREFILTRO_INTERVALO", NEGATIVOS_TTL))
 
-    palabras = nombre.strip().split()
-    if not palabras:
-        return json.dumps({"error": "Debe proporcionar un nombre para buscar."})
 
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
+def _headers_supabase() -> dict:
+    key = tenant_actual().key
+    return {
+        "apikey": key,
+        "Authorization": f"Bearer {key}",
     }
 
-    url = f"{SUPABASE_URL}/rest/v1/expedientes"
-    select = "id,caratula,estado"
 
-    params = {"select": select, "limit": "5"}
-    if len(palabras) == 1:
-        params["caratula"] = f"ilike.%{palabras[0]}%"
-    else:
-        conditions = ",".join([f"caratula.ilike.%{p}%" for p in palabras])
-        params["and"] = f"({conditions})"
+class CacheTTL:
+    """Diccionario acotado con vencimiento por entrada; al llenarse descarta la menos usada."""
 
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, headers=headers, params=params)
+    def __init__(self, nombre: str, ttl: float, max_entradas: int = 5000):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()  # clave -> (vence, valor)
+
+    def obtener(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada is None or entrada[0] < time.monotonic():
+            if entrada is not None:
+                del self._datos[clave]
+            metricas.sumar("cache_fallos_total", {"cache": self.nombre})
+            return None
+        self._datos.move_to_end(clave)
+        metricas.sumar("cache_aciertos_total", {"cache": self.nombre})
+        return entrada[1]
+
+    def guardar(self, clave, valor, ttl: float = None) -> None:
+        self._datos[clave] = (time.monotonic() + (self.ttl if ttl is None else ttl), valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+
+    def entrada(self, clave):
+        """(vence, valor) sin contar como uso (vence en time.monotonic), o None si no está."""
+        return self._datos.get(clave)
+
+    def invalidar(self, clave) -> None:
+        self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        self._datos.clear()
+
+    def claves(self) -> list:
+        return list(self._datos)
+
+    def valores(self) -> list:
+        return [valor for _, valor in self._datos.values()]
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+# Cachés indexadas por caso (("exp" | "srt", id)); invalidar_caso las recorre todas
+_CACHES_POR_CASO = []
+
+
+def invalidar_caso(clave) -> None:
+    for cache in _CACHES_POR_CASO:
+        cache.invalidar(clave)
+    metricas.sumar("casos_invalidados_total", {"tipo": clave[0]})
+
+
+# Última lectura de la timeline de cada caso (ver TimelineLeida): vence a los TIMELINE_COMPLETA_SEG
+timelines = PorTenant(lambda tenant: CacheTTL("timelines", TIMELINE_COMPLETA_SEG, TIMELINE_MAX_CASOS))
+_CACHES_POR_CASO.append(timelines)
+
+
+class BloqueosPorCaso:
+    """Un asyncio.Lock por caso, vivo solo mientras alguien lo tiene o lo espera."""
+
+    def __init__(self):
+        self._bloqueos = {}  # clave -> [Lock, usuarios]
+
+    @asynccontextmanager
+    async def tomar(self, clave):
+        entrada = self._bloqueos.get(clave)
+        if entrada is None:
+            entrada = self._bloqueos[clave] = [asyncio.Lock(), 0]
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                yield
+        finally:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del self._bloqueos[clave]
+
+
+# La TimelineLeida en memoria es una sola por caso: las consultas simultáneas al mismo caso y el
+# refresco anticipado la leen y la completan de a una (si no, dos lecturas delta suman las mismas filas)
+bloqueos_timeline = PorTenant(lambda tenant: BloqueosPorCaso())
+
+
+def plegar(texto: str) -> str:
+    """Minúsculas y sin acentos (Pérez → perez, Muñoz → munoz)."""
+    descompuesto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+# Conectores de nombres y carátulas: no acotan la búsqueda
+_CONECTORES = {"de", "del", "la", "las", "los", "el", "y", "e", "c", "s", "vs"}
+
+
+def palabras_busqueda(nombre: str) -> list:
+    """Palabras útiles de una búsqueda por nombre: plegadas, solo letras y dígitos, sin conectores
+    ni letras sueltas (salvo que no quede otra cosa), sin repetidos y sin las contenidas en otra
+    (si la fila tiene "perez" también tiene "pere")."""
+    palabras = list(dict.fromkeys(re.findall(r"[0-9a-z]+", plegar(nombre))))
+    utiles = [p for p in palabras if p not in _CONECTORES and len(p) > 1] or palabras
+    return [p for p in utiles if not any(p != otra and p in otra for otra in utiles)]
+
+
+def normalizar_busqueda(nombre: str) -> tuple:
+    """Clave canónica de una búsqueda: el AND de palabras no depende del orden ni de repetidos."""
+    return tuple(sorted(palabras_busqueda(nombre)))
+
+
+def _trigramas(palabra: str) -> set:
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+class IndiceNombres:
+    """Trigramas de todas las palabras (plegadas) de expedientes.caratula y casos_srt.nombre,
+    con la cantidad de filas que contienen cada uno.
+
+    Una palabra buscada como subcadena solo puede aparecer si todos sus trigramas existen
+    en alguna fila, así que si falta alguno la búsqueda no tenía resultados cuando se armó el
+    índice. Las filas nuevas solo entran por webhook (agregar), que puede no estar configurado:
+    por eso una búsqueda se descarta solo con un índice de a lo sumo `vigencia_descarte`
+    segundos (NEGATIVOS_TTL, lo mismo que puede estar desactualizada la caché de negativos);
+    más viejo, la búsqueda va a Supabase y el índice se reconstruye. El trigrama menos
+    frecuente acota cuántas filas pueden coincidir: sirve para ordenar las palabras por
+    selectividad. Se reconstruye cada PREFILTRO_INTERVALO (o antes, al dejar de poder descartar)
+    y solo cuando hay búsquedas."""
+
+    FUENTES = {
+        "expedientes": ("caratula", {}),
+        "casos_srt": ("nombre", {"activo": "eq.true"}),
+    }
+
+    def __init__(self, intervalo: float, vigencia_descarte: float):
+        self.intervalo = intervalo
+        self.vigencia_descarte = vigencia_descarte
+        self._trigramas = {}  # tabla -> {trigrama: filas que lo contienen}
+        self._filas = {}
+        self._construido_en = {}
+        self._tarea = None
+
+    def asegurar_fresco(self) -> None:
+        """Lanza la reconstrucción en segundo plano si el índice está vencido."""
+        if self._tarea is not None and not self._tarea.done():
+            return
+        ahora = time.monotonic()
+        vigencia = min(self.intervalo, self.vigencia_descarte)
+        if all(ahora - self._construido_en.get(t, -math.inf) < vigencia for t in self.FUENTES):
+            return
+        self._tarea = asyncio.create_task(self.reconstruir())
+
+    async def reconstruir(self) -> None:
+        _prioridad.set(PRIORIDAD_LOTE)
+        _grabacion.set(None)
+        for tabla, (columna, filtros) in self.FUENTES.items():
+            try:
+                trigramas = Counter()
+                filas_leidas = 0
+                async with _cliente(30.0) as client:
+                    offset = 0
+                    while True:
+                        status, filas = await leer_tuplas(
+                            client, tabla, (columna,), _headers_supabase(),
+                            {**filtros, "order": "id", "limit": "1000", "offset": str(offset)},
+                        )
+                        if status != 200:
+                            raise RuntimeError(f"{tabla}: {status}")
+                        trigramas.update(await en_trabajador(len(filas), self._contar_trigramas, filas))
+                        filas_leidas += len(filas)
+                        if len(filas) < 1000:
+                            break
+                        offset += 1000
+                self._trigramas[tabla] = trigramas
+                self._filas[tabla] = filas_leidas
+                self._construido_en[tabla] = time.monotonic()
+                metricas.fijar("prefiltro_trigramas", len(trigramas), {"tabla": tabla})
+            except Exception:
+                # Sin índice (o con el anterior) la búsqueda va igual a Supabase
+                metricas.sumar("prefiltro_errores_total", {"tabla": tabla})
+
+    @classmethod
+    def _contar_trigramas(cls, filas: list) -> Counter:
+        """Filas (texto,) → en cuántas aparece cada trigrama."""
+        cuenta = Counter()
+        for (texto,) in filas:
+            cuenta.update(cls._trigramas_texto(texto))
+        return cuenta
+
+    @staticmethod
+    def _trigramas_texto(texto: str) -> set:
+        trigramas = set()
+        for palabra in re.findall(r"[0-9a-z]+", plegar(texto)):
+            trigramas |= _trigramas(palabra)
+        return trigramas
+
+    def agregar(self, tabla: str, texto: str) -> None:
+        """Suma las palabras de una fila nueva sin esperar a la próxima reconstrucción."""
+        if tabla in self._trigramas:
+            self._trigramas[tabla].update(self._trigramas_texto(texto))
+            self._filas[tabla] += 1
+
+    def _vigente(self, tabla: str):
+        trigramas = self._trigramas.get(tabla)
+        # Índice ausente o muy viejo: no usarlo
+        if trigramas is None or time.monotonic() - self._construido_en[tabla] > 2 * self.intervalo:
+            return None
+        return trigramas
+
+    def puede_coincidir(self, tabla: str, palabras: tuple) -> bool:
+        trigramas = self._vigente(tabla)
+        if trigramas is None or time.monotonic() - self._construido_en[tabla] > self.vigencia_descarte:
+            return True
+        for palabra in palabras:
+            # Palabras cortas no se pueden descartar por trigramas
+            if len(palabra) < 3:
+                continue
+            if not all(t in trigramas for t in _trigramas(palabra)):
+                return False
+        return True
+
+    def filas_estimadas(self, tabla: str, palabra: str) -> float:
+        """Cota de las filas que contienen la palabra (0 si no hay índice: no se sabe)."""
+        trigramas = self._vigente(tabla)
+        if trigramas is None:
+            return 0
+        if len(palabra) < 3:
+            return self._filas[tabla]
+        return min(trigramas.get(t, 0) for t in _trigramas(palabra))
+
+
+cache_negativos = PorTenant(lambda tenant: CacheTTL("busquedas_sin_resultado", NEGATIVOS_TTL))
+indice_nombres = PorTenant(lambda tenant: IndiceNombres(PREFILTRO_INTERVALO, NEGATIVOS_TTL))
+
+
+# Variantes con acento de cada letra, para buscar "perez" y encontrar "PÉREZ"
+_VARIANTES = {"a": "aáàäâ", "e": "eéèëê", "i": "iíìïî", "o": "oóòöô", "u": "uúùüû", "n": "nñ", "c": "cç"}
+
+# Excluye los estados finalizados (80-84) como es_caso_finalizado: dos dígitos 80-84 al principio
+_FILTRO_NO_FINALIZADO = '(estado.is.null,estado.not.match."^8[0-4]([^0-9]|$)")'
+
+
+def _patron_palabra(palabra: str) -> str:
+    """Regex (para imatch) que encuentra la palabra con o sin acentos."""
+    partes = []
+    for c in palabra:
+        variantes = _VARIANTES.get(c)
+        partes.append(f"[{variantes}{variantes.upper()}]" if variantes else c)
+    return "".join(partes)
+
+
+def planificar_busqueda(tabla: str, columna: str, nombre: str, excluir_finalizados: bool = False) -> dict:
+    """Filtros de PostgREST para buscar un nombre: una condición imatch por palabra útil, de la
+    más selectiva a la menos según el índice de nombres, y (si se pide) sin casos finalizados."""
+    palabras = sorted(palabras_busqueda(nombre), key=lambda p: indice_nombres.filas_estimadas(tabla, p))
+    filtros = {}
+    if len(palabras) == 1:
+        filtros[columna] = f"imatch.{_patron_palabra(palabras[0])}"
+    elif palabras:
+        filtros["and"] = "(" + ",".join(f"{columna}.imatch.{_patron_palabra(p)}" for p in palabras) + ")"
+    if excluir_finalizados:
+        filtros["or"] = _FILTRO_NO_FINALIZADO
+    return filtros
+
+
+def busqueda_sin_resultados(tabla: str, palabras: list) -> bool:
+    """True si se sabe sin ir a Supabase que la búsqueda no tiene resultados."""
+    indice_nombres.asegurar_fresco()
+    clave = normalizar_busqueda(" ".join(palabras))
+    if cache_negativos.obtener((tabla, clave)):
+        metricas.sumar("busquedas_resueltas_local_total", {"tabla": tabla, "motivo": "cache_negativo"})
+        return True
+    if not indice_nombres.puede_coincidir(tabla, clave):
+        metricas.sumar("busquedas_resueltas_local_total", {"tabla": tabla, "motivo": "prefiltro"})
+        return True
+    return False
+
+
+# ============================================================
+# SNAPSHOTS NOCTURNOS DE CASOS ACTIVOS
+# ============================================================
+
+SNAPSHOT_ACTIVO = os.environ.get("SNAPSHOT_ACTIVO", "0") == "1"
+SNAPSHOT_HORA = int(os.environ.get("SNAPSHOT_HORA", 4))
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "snapshot_casos.json.gz")
+SNAPSHOT_CONCURRENCIA = int(os.environ.get("SNAPSHOT_CONCURRENCIA", 4))
+
+
+class Snapshots:
+    """Salida precalculada de consultar_movimientos(_srt) por caso, válida solo el día en que se armó
+    (los seguimientos generados dependen de la fecha de hoy)."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.dia = None
+        self._respuestas = {}  # ("exp" | "srt", id) -> JSON de la tool
+
+    def obtener(self, clave):
+        if not self._respuestas:
+            return None
+        if self.dia != date.today().isoformat():
+            self._respuestas = {}
+            return None
+        respuesta = self._respuestas.get(clave)
+        metricas.sumar("snapshot_aciertos_total" if respuesta is not None else "snapshot_fallos_total")
+        return respuesta
+
+    def tiene(self, clave) -> bool:
+        return self.dia == date.today().isoformat() and clave in self._respuestas
+
+    def invalidar(self, clave) -> None:
+        self._respuestas.pop(clave, None)
+
+    def reemplazar(self, dia: str, respuestas: dict) -> None:
+        self.dia = dia
+        self._respuestas = respuestas
+        metricas.fijar("snapshot_casos", len(respuestas))
+
+    def escribir(self) -> None:
+        datos = {"dia": self.dia, "casos": {f"{t}:{i}": r for (t, i), r in self._respuestas.items()}}
+        temporal = f"{self.ruta}.tmp"
+        with gzip.open(temporal, "wt", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporal, self.ruta)
+
+    def cargar(self) -> None:
+        """Levanta el snapshot del disco si es de hoy (por ejemplo, después de un redeploy)."""
+        try:
+            with gzip.open(self.ruta, "rt", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            return
+        if datos.get("dia") != date.today().isoformat():
+            return
+        respuestas = {}
+        for clave, respuesta in datos.get("casos", {}).items():
+            tipo, _, caso_id = clave.partition(":")
+            respuestas[(tipo, int(caso_id))] = respuesta
+        self.reemplazar(datos["dia"], respuestas)
+
+
+def _ruta_snapshot(tenant: Tenant) -> str:
+    """Un archivo por tenant: snapshot_casos.json.gz → snapshot_casos.<tenant>.json.gz."""
+    if not _MULTI_TENANT:
+        return SNAPSHOT_PATH
+    directorio, archivo = os.path.split(SNAPSHOT_PATH)
+    base, punto, extension = archivo.partition(".")
+    return os.path.join(directorio, f"{base}.{tenant.nombre}{punto}{extension}")
+
+
+snapshots = PorTenant(lambda tenant: Snapshots(_ruta_snapshot(tenant)))
+_CACHES_POR_CASO.append(snapshots)
+
+
+async def _listar_filas(tabla: str, select: str, filtros: dict, headers: dict):
+    """Lee una tabla completa paginando de a 1000. Devuelve None si la consulta falla."""
+    filas = []
+    async with _cliente(30.0) as client:
+        while True:
+            resp = await client.get(
+                f"{tenant_actual().url}/rest/v1/{tabla}",
+                headers=headers,
+                params={"select": select, **filtros, "order": "id", "limit": "1000", "offset": str(len(filas))},
+            )
+            if resp.status_code != 200:
+                return None
+            pagina = resp.json()
+            filas.extend(pagina)
+            if len(pagina) < 1000:
+                return filas
+
+
+async def generar_snapshot() -> int:
+    """Precalcula la respuesta de todos los casos activos, guarda en lote los seguimientos
+    nuevos y reemplaza el snapshot. Devuelve la cantidad de casos precalculados."""
+    _prioridad.set(PRIORIDAD_LOTE)
+    inicio = time.monotonic()
+    dia = date.today().isoformat()
+    headers = _headers_supabase()
+
+    expedientes = await _listar_filas("expedientes", "id,estado,tipo_caso", {}, headers)
+    if expedientes is None:
+        # Si tipo_caso no existe, solo estado
+        expedientes = await _listar_filas("expedientes", "id,estado", {}, headers) or []
+    casos_srt = await _listar_filas("casos_srt", "id,estado", {"activo": "eq.true"}, headers) or []
+
+    respuestas = {}
+    pendientes = []
+    semaforo = asyncio.Semaphore(SNAPSHOT_CONCURRENCIA)
+
+    async def precalcular(clave, corrutina):
+        async with semaforo:
+            respuesta = await corrutina
+        if not respuesta.startswith('{"error"'):
+            respuestas[clave] = respuesta
+
+    trabajos = []
+    for e in expedientes:
+        estado = e.get("estado", "")
+        if es_caso_finalizado(estado):
+            continue
+        es_despido = (e.get("tipo_caso") or "").lower() == "despido"
+        trabajos.append(precalcular(
+            ("exp", e["id"]), armar_respuesta_movimientos(e["id"], estado, es_despido, headers, pendientes),
+        ))
+    for c in casos_srt:
+        estado = c.get("estado", "")
+        if es_caso_finalizado(estado):
+            continue
+        trabajos.append(precalcular(
+            ("srt", c["id"]), armar_respuesta_movimientos_srt(c["id"], estado, headers, pendientes),
+        ))
+    await asyncio.gather(*trabajos)
+
+    # Seguimientos nuevos en lotes, separando por tipo de caso (mismas columnas en cada lote)
+    for campo in ("expediente_id", "caso_srt_id"):
+        lote = [p for p in pendientes if campo in p]
+        for i in range(0, len(lote), 500):
+            await guardar_seguimientos(lote[i:i + 500], headers)
+
+    snapshots.reemplazar(dia, respuestas)
+    await asyncio.to_thread(snapshots.escribir)
+    metricas.observar("snapshot_duracion_segundos", time.monotonic() - inicio, buckets=(10, 30, 60, 300, 900, 1800, 3600))
+    return len(respuestas)
+
+
+@tarea_de_fondo
+async def _snapshots_nocturnos():
+    if not SNAPSHOT_ACTIVO:
+        return
+    for tenant in TENANTS.values():
+        _tenant.set(tenant)
+        await asyncio.to_thread(snapshots.cargar)
+    while True:
+        ahora = datetime.now()
+        hoy = ahora.date().isoformat()
+        al_dia = True
+        for tenant in TENANTS.values():
+            _tenant.set(tenant)
+            al_dia = al_dia and snapshots.dia == hoy
+        if al_dia:
+            proxima = ahora.replace(hour=SNAPSHOT_HORA, minute=0, second=0, microsecond=0)
+            if proxima <= ahora:
+                proxima += timedelta(days=1)
+            await asyncio.sleep((proxima - ahora).total_seconds())
+        fallo = False
+        for tenant in TENANTS.values():
+            _tenant.set(tenant)
+            if snapshots.dia == date.today().isoformat():
+                continue
+            try:
+                await generar_snapshot()
+            except Exception:
+                metricas.sumar("snapshot_errores_total")
+                fallo = True
+        if fallo:
+            await asyncio.sleep(600)
+
+
+# ============================================================
+# PREFETCH ESPECULATIVO DESPUÉS DE LAS BÚSQUEDAS
+# ============================================================
+
+# Los prompts de los bots piden consultar_movimientos(_srt) apenas una búsqueda encuentra el caso:
+# se empieza a calcular en segundo plano mientras el modelo arma su siguiente turno.
+PREFETCH_MAX_CASOS = int(os.environ.get("PREFETCH_MAX_CASOS", 2))
+PREFETCH_TTL = float(os.environ.get("PREFETCH_TTL", 90))
+PREFETCH_MAX_EN_VUELO = int(os.environ.get("PREFETCH_MAX_EN_VUELO", 8))
+
+
+class Prefetch:
+    """Respuestas precalculadas de un solo uso, con vencimiento corto."""
+
+    def __init__(self, max_casos: int, ttl: float, max_en_vuelo: int):
+        self.max_casos = max_casos
+        self.ttl = ttl
+        self.max_en_vuelo = max_en_vuelo
+        self._entradas = {}  # clave -> (vence, tarea)
+
+    def lanzar(self, claves: list) -> None:
+        self._purgar()
+        for clave in claves[:self.max_casos]:
+            if clave in self._entradas or snapshots.tiene(clave):
+                continue
+            if sum(1 for _, t in self._entradas.values() if not t.done()) >= self.max_en_vuelo:
+                metricas.sumar("prefetch_descartados_total")
+                break
+            self._entradas[clave] = (time.monotonic() + self.ttl, asyncio.create_task(self._calcular(clave)))
+            metricas.sumar("prefetch_lanzados_total")
+
+    async def _calcular(self, clave) -> str:
+        # Trabajo especulativo: no debe demorar a las llamadas reales ni informar avance en su nombre
+        _prioridad.set(PRIORIDAD_LOTE)
+        _progreso.set(None)
+        _grabacion.set(None)
+        tipo, caso_id = clave
+        headers = _headers_supabase()
+        if tipo == "exp":
+            metadatos = await leer_metadatos_expediente(caso_id, headers)
+            if metadatos is None:
+                # Respuesta especulativa: sin el estado no se sabe si el caso está finalizado
+                return json.dumps({"error": "No se pudo leer el expediente."})
+            estado_str, es_despido = metadatos
+            return await armar_respuesta_movimientos(caso_id, estado_str, es_despido, headers)
+        estado_str = await leer_metadatos_srt(caso_id, headers)
+        if estado_str is None:
+            return json.dumps({"error": "No se pudo leer el caso SRT."})
+        return await armar_respuesta_movimientos_srt(caso_id, estado_str, headers)
+
+    async def tomar(self, clave):
+        """Devuelve la respuesta precalculada (esperándola si sigue en curso) o None."""
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return None
+        vence, tarea = entrada
+        if vence < time.monotonic():
+            metricas.sumar("prefetch_desperdiciados_total", {"motivo": "vencido"})
+            return None
+        listo = tarea.done()
+        try:
+            respuesta = await tarea
+        except Exception:
+            return None
+        if respuesta.startswith('{"error"'):
+            return None
+        metricas.sumar("prefetch_aciertos_total", {"estado": "listo" if listo else "en_curso"})
+        return respuesta
+
+    def invalidar(self, clave) -> None:
+        if self._entradas.pop(clave, None) is not None:
+            metricas.sumar("prefetch_desperdiciados_total", {"motivo": "invalidado"})
+
+    def _purgar(self) -> None:
+        ahora = time.monotonic()
+        for clave in [c for c, (vence, _) in self._entradas.items() if vence < ahora]:
+            del self._entradas[clave]
+            metricas.sumar("prefetch_desperdiciados_total", {"motivo": "vencido"})
+
+
+prefetch = PorTenant(lambda tenant: Prefetch(PREFETCH_MAX_CASOS, PREFETCH_TTL, PREFETCH_MAX_EN_VUELO))
+_CACHES_POR_CASO.append(prefetch)
+
+
+# ============================================================
+# REFRESCO ANTICIPADO DE LOS CASOS MÁS CONSULTADOS
+# ============================================================
+
+# Hay clientes que preguntan por su caso todos los días o varias veces por día: las REFRESCO_CASOS
+# timelines más consultadas se releen completas un poco antes de que venza su lectura (ver
+# TimelineLeida), así la consulta siguiente encuentra la entrada viva y solo pide el delta.
+# Cada caso caliente cuesta una lectura completa por TIMELINE_COMPLETA_SEG (0 casos = apagado).
+REFRESCO_CASOS = int(os.environ.get("REFRESCO_CASOS", 50))
+# Se relee lo que vence dentro de REFRESCO_ANTELACION_SEG; conviene que supere a REFRESCO_INTERVALO_SEG
+REFRESCO_ANTELACION_SEG = float(os.environ.get("REFRESCO_ANTELACION_SEG", 90))
+REFRESCO_INTERVALO_SEG = float(os.environ.get("REFRESCO_INTERVALO_SEG", 30))
+# Consultas con decaimiento exponencial: un caso es caliente con al menos REFRESCO_MIN_CONSULTAS
+# (con vida media de 72 h, quien pregunta a diario queda arriba de 3 después de una semana; quien
+# pregunta una o dos veces, nunca)
+REFRESCO_VIDA_MEDIA_H = float(os.environ.get("REFRESCO_VIDA_MEDIA_H", 72))
+REFRESCO_MIN_CONSULTAS = float(os.environ.get("REFRESCO_MIN_CONSULTAS", 3))
+REFRESCO_SEGUIDOS = int(os.environ.get("REFRESCO_SEGUIDOS", 5000))
+# Presupuesto global (todos los tenants) de relecturas por minuto; 0 = sin tope
+REFRESCO_MAX_POR_MINUTO = float(os.environ.get("REFRESCO_MAX_POR_MINUTO", 20))
+
+
+class Popularidad:
+    """Consultas por caso con decaimiento exponencial: cada consulta suma 1 y el puntaje se
+    reduce a la mitad cada `vida_media` segundos. Los casos distintos son unos miles, así que
+    un contador exacto por caso alcanza (sin sketch); al pasar `max_casos` se olvidan los más fríos."""
+
+    def __init__(self, vida_media: float, max_casos: int):
+        self.decaimiento = math.log(2) / vida_media
+        self.max_casos = max_casos
+        self._puntajes = {}  # clave -> (puntaje, momento en que se calculó)
+
+    def _puntaje(self, clave, ahora: float) -> float:
+        puntaje, momento = self._puntajes.get(clave, (0.0, ahora))
+        return puntaje * math.exp(-self.decaimiento * (ahora - momento))
+
+    def registrar(self, clave) -> None:
+        ahora = time.monotonic()
+        self._puntajes[clave] = (self._puntaje(clave, ahora) + 1, ahora)
+        if len(self._puntajes) > self.max_casos:
+            # Se podan de a un décimo para no ordenar en cada consulta nueva
+            conservar = heapq.nlargest(self.max_casos * 9 // 10, self._puntajes, key=lambda c: self._puntaje(c, ahora))
+            self._puntajes = {c: self._puntajes[c] for c in conservar}
+
+    def calientes(self, cantidad: int, minimo: float) -> list:
+        """[(clave, puntaje)] de las `cantidad` más consultadas con al menos `minimo`, de mayor a menor."""
+        ahora = time.monotonic()
+        puntajes = ((clave, self._puntaje(clave, ahora)) for clave in self._puntajes)
+        return [(c, p) for c, p in heapq.nlargest(cantidad, puntajes, key=lambda x: x[1]) if p >= minimo]
+
+    def __len__(self) -> int:
+        return len(self._puntajes)
+
+
+popularidad = PorTenant(lambda tenant: Popularidad(REFRESCO_VIDA_MEDIA_H * 3600, REFRESCO_SEGUIDOS))
+# Ráfaga de una pasada: con muchos casos por vencer juntos, el tope se reparte entre pasadas
+presupuesto_refresco = TokenBuckets(
+    REFRESCO_MAX_POR_MINUTO, max(1, int(REFRESCO_MAX_POR_MINUTO * REFRESCO_INTERVALO_SEG / 60)),
+)
+
+
+async def refrescar_timeline(clave, anterior: TimelineLeida) -> bool:
+    """Lectura completa de la timeline del caso, guardada en lugar de `anterior` (la que vence)."""
+    tipo, caso_id = clave
+    es_srt = tipo == "srt"
+    async with bloqueos_timeline.tomar(clave):
+        try:
+            async with _cliente(15.0) as client:
+                leido = await leer_timeline_completa(
+                    client, caso_id, es_srt, _headers_supabase(), "caso_srt_id" if es_srt else "expediente_id",
+                )
+        except Exception:
+            metricas.sumar("refresco_lecturas_total", {"resultado": "error"})
+            return False
+        # Si mientras se leía el caso se invalidó (webhook, otra réplica) la lectura puede ser
+        # vieja: se descarta y la próxima consulta lee de cero
+        entrada = timelines.entrada(clave)
+        if entrada is None or entrada[1] is not anterior:
+            metricas.sumar("refresco_lecturas_total", {"resultado": "descartada"})
+            return False
+        leida = TimelineLeida(*leido, es_srt)
+        leida.refrescada = anterior.rellenada_hasta() if anterior.refrescada is None else anterior.refrescada
+        timelines.guardar(clave, leida)
+    metricas.sumar("refresco_lecturas_total", {"resultado": "ok"})
+    return True
+
+
+async def refrescar_calientes() -> int:
+    """Una pasada sobre el tenant actual: relee las timelines calientes que vencen pronto.
+    Solo las que siguen en la caché (una invalidada o un caso finalizado no se leen de más).
+    Devuelve cuántas se releyeron."""
+    _prioridad.set(PRIORIDAD_LOTE)
+    _grabacion.set(None)
+    calientes = popularidad.calientes(REFRESCO_CASOS, REFRESCO_MIN_CONSULTAS)
+    metricas.fijar("refresco_casos_calientes", len(calientes))
+    limite = time.monotonic() + REFRESCO_ANTELACION_SEG
+    releidas = 0
+    for clave, _ in calientes:
+        entrada = timelines.entrada(clave)
+        # El snapshot del día responde antes de llegar a la timeline
+        if entrada is None or entrada[0] > limite or snapshots.tiene(clave):
+            continue
+        # Con consultas esperando cupo hacia Supabase no se suma trabajo especulativo
+        if tenant_actual().limitador.en_espera():
+            metricas.sumar("refresco_salteados_total", {"motivo": "upstream_ocupado"})
+            break
+        if not presupuesto_refresco.tomar("refresco"):
+            metricas.sumar("refresco_salteados_total", {"motivo": "presupuesto"})
+            break
+        releidas += await refrescar_timeline(clave, entrada[1])
+    return releidas
+
+
+@tarea_de_fondo
+async def _refresco_anticipado():
+    if REFRESCO_CASOS <= 0 or not TIMELINE_DELTA:
+        return
+    while True:
+        await asyncio.sleep(REFRESCO_INTERVALO_SEG)
+        for tenant in TENANTS.values():
+            _tenant.set(tenant)
+            try:
+                await refrescar_calientes()
+            except Exception:
+                # Sin refresco las timelines vencen y se leen completas, como antes
+                metricas.sumar("refresco_errores_total")
+
+
+# ============================================================
+# CONTEXTO DE SESIÓN (MCP_SESIONES=1)
+# ============================================================
+
+# Sesiones que se recuerdan, vencimiento por inactividad (s) y casos por sesión
+SESION_TTL = float(os.environ.get("SESION_TTL", 1800))
+SESION_MAX = int(os.environ.get("SESION_MAX", 2000))
+SESION_MAX_CASOS = int(os.environ.get("SESION_MAX_CASOS", 20))
+
+# Id de la sesión MCP de la llamada en curso (None = modo stateless)
+_sesion = contextvars.ContextVar("sesion", default=None)
+
+
+class ContextoSesiones:
+    """Casos que las búsquedas devolvieron en cada sesión MCP, con los metadatos que
+    consultar_movimientos(_srt) necesita (estado, tipo). Así la consulta siguiente de la misma
+    conversación no vuelve a leer expedientes/casos_srt. Una sesión vence tras `ttl` sin uso;
+    por encima de `max_sesiones` se descartan las menos usadas."""
+
+    def __init__(self, ttl: float, max_sesiones: int, max_casos: int):
+        self._sesiones = CacheTTL("sesiones", ttl, max_sesiones)
+        self.max_casos = max_casos
+
+    def recordar(self, clave, **metadatos) -> None:
+        sesion = _sesion.get()
+        if sesion is None:
+            return
+        casos = self._sesiones.obtener(sesion)
+        if casos is None:
+            casos = OrderedDict()
+        casos[clave] = metadatos
+        casos.move_to_end(clave)
+        while len(casos) > self.max_casos:
+            casos.popitem(last=False)
+        self._sesiones.guardar(sesion, casos)
+
+    def metadatos(self, clave):
+        """Metadatos del caso si esta sesión ya los vio (None en modo stateless o si no)."""
+        sesion = _sesion.get()
+        if sesion is None:
+            return None
+        casos = self._sesiones.obtener(sesion)
+        metadatos = casos.get(clave) if casos is not None else None
+        metricas.sumar("sesion_metadatos_total", {"resultado": "acierto" if metadatos is not None else "fallo"})
+        if casos is not None:
+            self._sesiones.guardar(sesion, casos)  # renueva el vencimiento
+        return metadatos
+
+    def invalidar(self, clave) -> None:
+        for casos in self._sesiones.valores():
+            casos.pop(clave, None)
+
+    def __len__(self) -> int:
+        return len(self._sesiones)
+
+
+sesiones = PorTenant(lambda tenant: ContextoSesiones(SESION_TTL, SESION_MAX, SESION_MAX_CASOS))
+_CACHES_POR_CASO.append(sesiones)
+
+
+# ============================================================
+# INVALIDACIÓN POR WEBHOOKS DE SUPABASE
+# ============================================================
+
+# Tabla -> (tipo de caso, columna con el id del caso)
+_CASO_POR_TABLA = {
+    "movimientos_pjn": ("exp", "expediente_id"),
+    "movimientos_judicial": ("exp", "expediente_id"),
+    "expedientes": ("exp", "id"),
+    "movimientos_srt": ("srt", "caso_srt_id"),
+    "comunicaciones_srt": ("srt", "caso_srt_id"),
+    "casos_srt": ("srt", "id"),
+}
+
+# Tablas cuyo texto alimenta buscar_caso / buscar_caso_srt
+_NOMBRE_POR_TABLA = {"expedientes": "caratula", "casos_srt": "nombre"}
+
+
+async def _caso_srt_por_numero(numero_srt: str):
+    """comunicaciones_miventanilla solo trae el número SRT: buscar el id del caso."""
+    try:
+        async with _cliente(10.0) as client:
+            resp = await client.get(
+                f"{tenant_actual().url}/rest/v1/casos_srt",
+                headers=_headers_supabase(),
+                params={"select": "id", "numero_srt": f"eq.{numero_srt}"},
+            )
+        if resp.status_code == 200:
+            return [("srt", fila["id"]) for fila in resp.json() if fila.get("id") is not None]
+    except Exception:
+        pass
+    return []
+
+
+def _id_caso(valor, columna: str) -> int:
+    """Id de caso de una fila del webhook (número o texto numérico); ValueError si falta o no lo es."""
+    if valor is None:
+        raise ValueError(f"falta {columna}")
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)) or not str(valor).strip().isdigit():
+        raise ValueError(f"{columna} inválido: {valor!r}")
+    return int(valor)
+
+
+async def procesar_webhook(payload: dict) -> list:
+    """Invalida las entradas de caché afectadas por un evento de Database Webhooks.
+    Devuelve las claves de caso invalidadas. ValueError si el evento no tiene la forma esperada."""
+    tabla = payload.get("table") or ""
+    if not isinstance(tabla, str):
+        raise ValueError("table debe ser texto")
+    filas = [payload.get("record"), payload.get("old_record")]
+    if not all(f is None or isinstance(f, dict) for f in filas):
+        raise ValueError("record y old_record deben ser objetos")
+    filas = [f for f in filas if f is not None]
+    # Se valida todo antes de invalidar: un evento malformado no deja cambios a medias
+    claves = set()
+    if tabla in _CASO_POR_TABLA:
+        tipo, columna = _CASO_POR_TABLA[tabla]
+        for fila in filas:
+            claves.add((tipo, _id_caso(fila.get(columna), columna)))
+    columna_nombre = _NOMBRE_POR_TABLA.get(tabla)
+    if columna_nombre and payload.get("record") and not isinstance(payload["record"].get(columna_nombre) or "", str):
+        raise ValueError(f"{columna_nombre} debe ser texto")
+    metricas.sumar("webhook_eventos_total", {"tabla": tabla, "tipo": str(payload.get("type") or "")})
+
+    if tabla == "comunicaciones_miventanilla":
+        for numero in {str(f["srt_expediente_nro"]) for f in filas if f.get("srt_expediente_nro")}:
+            claves.update(await _caso_srt_por_numero(numero))
+
+    for clave in claves:
+        invalidar_caso(clave)
+
+    # Filas nuevas o renombradas pueden convertir en acierto una búsqueda que antes no tenía resultados
+    if columna_nombre and payload.get("record"):
+        texto = plegar(payload["record"].get(columna_nombre))
+        indice_nombres.agregar(tabla, texto)
+        for clave in cache_negativos.claves():
+            if clave[0] == tabla and all(palabra in texto for palabra in clave[1]):
+                cache_negativos.invalidar(clave)
+
+    return sorted(claves)
+
+
+# ============================================================
+# COHERENCIA ENTRE RÉPLICAS (REPLICAS_PEERS)
+# ============================================================
+
+# URLs base de todas las réplicas, la misma lista en todas (la propia se reconoce por REPLICA_URL)
+REPLICAS_PEERS = [u.strip().rstrip("/") for u in os.environ.get("REPLICAS_PEERS", "").split(",") if u.strip()]
+REPLICA_URL = os.environ.get("REPLICA_URL", f"http://127.0.0.1:{PORT}").strip().rstrip("/")
+# Secreto compartido para firmar los anuncios (HMAC-SHA256); sin secreto el canal no se activa
+REPLICAS_SECRETO = os.environ.get("REPLICAS_SECRETO", "")
+# Espera para agrupar anuncios (s) e intentos de envío por réplica
+REPLICAS_AGRUPAR_SEG = float(os.environ.get("REPLICAS_AGRUPAR_SEG", 0.05))
+REPLICAS_INTENTOS = int(os.environ.get("REPLICAS_INTENTOS", 3))
+# Antigüedad máxima aceptada de un anuncio firmado (evita que se reenvíe uno capturado)
+_REPLICAS_VENTANA_SEG = 60
+
+
+class Replicas:
+    """Canal de invalidación entre réplicas sin broker: cada réplica avisa por HTTP a las demás
+    qué casos cambiaron (webhook recibido, seguimientos guardados) y ellas invalidan sus cachés.
+
+    Cada réplica numera sus propios anuncios por caso (1, 2, 3...) dentro de una época, el
+    momento en que arrancó el proceso. Quien recibe recuerda la última (época, número) vista por
+    (origen, caso) e ignora los repetidos o atrasados, así los reintentos y los envíos
+    desordenados no invalidan de más; una réplica reiniciada arranca con una época más nueva y
+    sus anuncios valen aunque la numeración haya vuelto a 1. Si una réplica está caída los
+    anuncios se pierden: sus cachés, de todos modos, vencen solas."""
+
+    def __init__(self, propia: str, peers: list, secreto: str):
+        self.propia = propia
+        self.peers = [p for p in peers if p != propia]
+        self.secreto = secreto.encode()
+        self.activa = bool(self.peers and secreto)
+        self.epoca = time.time_ns()
+        self.versiones = {}  # (tenant, tipo, id) -> último número anunciado por esta réplica
+        self.vistas = {}  # (origen, tenant, tipo, id) -> última (época, número) recibida
+        self._pendientes = {}
+        self._hay_pendientes = asyncio.Event()
+        self._envios = set()
+        self._cliente = None
+
+    def anunciar(self, claves) -> None:
+        if not self.activa:
+            return
+        tenant = tenant_actual().nombre
+        for tipo, caso_id in claves:
+            clave = (tenant, tipo, int(caso_id))
+            self.versiones[clave] = self._pendientes[clave] = self.versiones.get(clave, 0) + 1
+        if self._pendientes:
+            self._hay_pendientes.set()
+
+    def firmar(self, cuerpo: bytes) -> str:
+        return hmac.new(self.secreto, cuerpo, hashlib.sha256).hexdigest()
+
+    def recibir(self, cuerpo: bytes, firma: str) -> int:
+        """Verifica y aplica un anuncio. Devuelve los casos invalidados; ValueError si no es válido."""
+        if not hmac.compare_digest(self.firmar(cuerpo), firma):
+            raise ValueError("firma inválida")
+        mensaje = json.loads(cuerpo)
+        if abs(time.time() - float(mensaje.get("ts", 0))) > _REPLICAS_VENTANA_SEG:
+            raise ValueError("anuncio vencido")
+        origen = mensaje.get("origen", "")
+        epoca = mensaje.get("epoca", 0)
+        invalidados = 0
+        for nombre, tipo, caso_id, version in mensaje.get("casos", []):
+            tenant = TENANTS.get(nombre)
+            if tenant is None or tipo not in ("exp", "srt"):
+                continue
+            vista = (origen, nombre, tipo, int(caso_id))
+            version = (int(epoca), int(version))
+            if version <= self.vistas.get(vista, (0, 0)):
+                metricas.sumar("replicas_anuncios_recibidos_total", {"resultado": "repetido"})
+                continue
+            self.vistas[vista] = version
+            token = _tenant.set(tenant)
+            try:
+                invalidar_caso((tipo, int(caso_id)))
+            finally:
+                _tenant.reset(token)
+            invalidados += 1
+            metricas.sumar("replicas_anuncios_recibidos_total", {"resultado": "aplicado"})
+        return invalidados
+
+    async def difundir(self) -> None:
+        """Tarea de fondo: junta los anuncios de REPLICAS_AGRUPAR_SEG y los manda a cada réplica."""
+        self._cliente = httpx.AsyncClient(timeout=2.0)
+        try:
+            while True:
+                await self._hay_pendientes.wait()
+                await asyncio.sleep(REPLICAS_AGRUPAR_SEG)
+                self._hay_pendientes.clear()
+                lote, self._pendientes = self._pendientes, {}
+                cuerpo = json.dumps({
+                    "origen": self.propia,
+                    "epoca": self.epoca,
+                    "ts": time.time(),
+                    "casos": [[nombre, tipo, caso_id, version] for (nombre, tipo, caso_id), version in lote.items()],
+                }).encode()
+                for peer in self.peers:
+                    envio = asyncio.create_task(self._enviar(peer, cuerpo))
+                    self._envios.add(envio)
+                    envio.add_done_callback(self._envios.discard)
+        finally:
+            for envio in list(self._envios):
+                envio.cancel()
+            await self._cliente.aclose()
+
+    async def _enviar(self, peer: str, cuerpo: bytes) -> None:
+        for intento in range(REPLICAS_INTENTOS):
+            try:
+                resp = await self._cliente.post(
+                    f"{peer}/replicas/invalidar",
+                    content=cuerpo,
+                    headers={"Content-Type": "application/json", "X-Replica-Firma": self.firmar(cuerpo)},
+                )
+                if resp.status_code == 200:
+                    metricas.sumar("replicas_anuncios_enviados_total", {"peer": peer, "resultado": "ok"})
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2 * 2 ** intento)
+        metricas.sumar("replicas_anuncios_enviados_total", {"peer": peer, "resultado": "error"})
+
+
+replicas = Replicas(REPLICA_URL, REPLICAS_PEERS, REPLICAS_SECRETO)
+if replicas.activa:
+    tarea_de_fondo(replicas.difundir)
+elif REPLICAS_PEERS:
+    print("[replicas] REPLICAS_PEERS sin REPLICAS_SECRETO (o sin otras réplicas): canal desactivado", file=sys.stderr)
+
+
+# ============================================================
+# PERFILADOR POR MUESTREO (/debug/profile)
+# ============================================================
+
+# Apagado no registra la ruta ni toca las llamadas (una comparación en el middleware). Arranca
+# hilos de muestreo a pedido por HTTP: además de PROFILER_ACTIVO=1 exige MCP_AUTH_TOKEN, nunca queda abierto
+PROFILER_ACTIVO = os.environ.get("PROFILER_ACTIVO", "0") == "1"
+if PROFILER_ACTIVO and not MCP_AUTH_TOKEN:
+    PROFILER_ACTIVO = False
+    print("[profile] PROFILER_ACTIVO sin MCP_AUTH_TOKEN: perfilador desactivado", file=sys.stderr)
+PROFILER_INTERVALO_MS = float(os.environ.get("PROFILER_INTERVALO_MS", 5))
+PROFILER_MAX_SEG = float(os.environ.get("PROFILER_MAX_SEG", 120))
+
+
+def _nombre_frame(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+
+class Perfilador:
+    """Muestrea desde otro hilo la pila del hilo del event loop cada `intervalo` segundos.
+    Perfila una ventana de tiempo o solo mientras hay en curso llamadas de una tool dada."""
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self.ocupado = False
+        self.sesion = 0
+        self.objetivo = None
+        self.restantes = 0
+        self.completadas = 0
+        self.en_curso = 0
+        self._fin = None
+        self._pilas = Counter()
+        self._inactivas = 0
+
+    def seguir(self, tool: str):
+        """Marca el inicio de una llamada si es de la tool perfilada. Devuelve la sesión o None."""
+        if tool != self.objetivo or self.restantes <= 0:
+            return None
+        self.restantes -= 1
+        self.en_curso += 1
+        return self.sesion
+
+    def terminar_llamada(self, sesion: int) -> None:
+        if sesion != self.sesion:
+            return
+        self.en_curso -= 1
+        self.completadas += 1
+        if self.restantes <= 0 and self.en_curso <= 0 and self._fin is not None and not self._fin.done():
+            self._fin.set_result(None)
+
+    def _muestrear(self, hilo: int, parar: threading.Event, solo_en_llamadas: bool) -> None:
+        while not parar.wait(self.intervalo):
+            if solo_en_llamadas and self.en_curso <= 0:
+                continue
+            frame = sys._current_frames().get(hilo)
+            pila = []
+            while frame is not None:
+                pila.append(_nombre_frame(frame))
+                frame = frame.f_back
+            if not pila:
+                continue
+            # Loop esperando eventos (selector): no es trabajo del server
+            if pila[0].startswith("selectors."):
+                self._inactivas += 1
+                continue
+            pila.reverse()
+            self._pilas[tuple(pila)] += 1
+
+    async def perfilar(self, segundos: float, tool: str = None, llamadas: int = 0) -> dict:
+        if self.ocupado:
+            raise RuntimeError("Ya hay un perfilado en curso")
+        self.ocupado = True
+        self.sesion += 1
+        self._pilas = Counter()
+        self._inactivas = 0
+        self.completadas = 0
+        self.en_curso = 0
+        parar = threading.Event()
+        muestreador = threading.Thread(
+            target=self._muestrear, args=(threading.get_ident(), parar, tool is not None),
+            name="perfilador", daemon=True,
+        )
+        inicio = time.monotonic()
+        try:
+            if tool:
+                self._fin = asyncio.get_running_loop().create_future()
+                self.objetivo = tool
+                self.restantes = llamadas
+            muestreador.start()
+            if tool:
+                try:
+                    await asyncio.wait_for(self._fin, segundos)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(segundos)
+        finally:
+            parar.set()
+            await asyncio.to_thread(muestreador.join)
+            self.objetivo = None
+            self.restantes = 0
+            self._fin = None
+            self.sesion += 1
+            self.ocupado = False
+        return self._informe(time.monotonic() - inicio, tool)
+
+    def _informe(self, duracion: float, tool: str) -> dict:
+        propio = Counter()
+        total = Counter()
+        for pila, cuenta in self._pilas.items():
+            propio[pila[-1]] += cuenta
+            for funcion in set(pila):
+                total[funcion] += cuenta
+        muestras = sum(self._pilas.values())
+        return {
+            "duracion_seg": round(duracion, 3),
+            "intervalo_ms": self.intervalo * 1000,
+            "tool": tool,
+            "llamadas_perfiladas": self.completadas if tool else None,
+            "muestras": muestras,
+            "muestras_inactivas": self._inactivas,
+            "top": [
+                {
+                    "funcion": funcion,
+                    "propio": cuenta,
+                    "total": total[funcion],
+                    "propio_pct": round(100 * cuenta / muestras, 1),
+                    "total_pct": round(100 * total[funcion] / muestras, 1),
+                }
+                for funcion, cuenta in propio.most_common(40)
+            ],
+            # Formato "colapsado" de flamegraph.pl / speedscope: una pila por línea con su cuenta
+            "colapsado": "\n".join(f"{';'.join(pila)} {cuenta}" for pila, cuenta in self._pilas.most_common()),
+        }
+
+
+perfilador = Perfilador(PROFILER_INTERVALO_MS / 1000)
+
+
+# ============================================================
+# MEMORIA POR LLAMADA (/debug/memoria)
+# ============================================================
+
+# Con tracemalloc encendido Python asigna más lento: solo con MEMORIA_ACTIVA=1
+MEMORIA_ACTIVA = os.environ.get("MEMORIA_ACTIVA", "0") == "1"
+# Fracción de llamadas a tools que se miden y frames guardados por asignación
+MEMORIA_MUESTREO = float(os.environ.get("MEMORIA_MUESTREO", 0.1))
+MEMORIA_FRAMES = int(os.environ.get("MEMORIA_FRAMES", 10))
+
+_BUCKETS_BYTES = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+_AGRUPAR_MEMORIA = ("lineno", "filename", "traceback")
+
+
+def memoria_proceso() -> dict:
+    """RSS actual y máximo del proceso en bytes (de /proc en Linux; si no, solo el máximo)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            campos = dict(linea.split(":", 1) for linea in f if linea.startswith(("VmRSS", "VmHWM")))
+        return {"rss": int(campos["VmRSS"].split()[0]) * 1024, "rss_pico": int(campos["VmHWM"].split()[0]) * 1024}
+    except (OSError, KeyError, ValueError):
+        try:
+            import resource
+        except ImportError:
+            return {}
+        return {"rss_pico": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+class Memoria:
+    """Memoria de las llamadas a tools con tracemalloc.
+
+    tracemalloc cuenta todo el proceso, así que se mide una llamada a la vez (una de cada
+    1/MEMORIA_MUESTREO): su pico es cuánto subió la memoria trazada por encima de la que había
+    al empezar. Si había otras llamadas en curso su memoria también suma: con muchas muestras
+    los percentiles se acercan al costo real de cada tool."""
+
+    def __init__(self, muestreo: float, frames: int):
+        self.cada = max(1, round(1 / muestreo)) if muestreo > 0 else 0
+        self.frames = frames
+        self.en_curso = 0
+        self.picos = {}  # tool -> pico más alto medido
+        self._llamadas = 0
+        self._midiendo = False
+        self._base = None
+
+    def iniciar(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._base = self._instantanea()
+
+    @staticmethod
+    def _instantanea():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def empezar(self, tool: str):
+        """Devuelve la memoria trazada al inicio si esta llamada se mide; si no, None."""
+        self.en_curso += 1
+        self._llamadas += 1
+        if not self.cada or self._midiendo or self._llamadas % self.cada or not tracemalloc.is_tracing():
+            return None
+        self._midiendo = True
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def terminar(self, tool: str, inicio) -> None:
+        self.en_curso -= 1
+        if inicio is None:
+            return
+        actual, pico = tracemalloc.get_traced_memory()
+        self._midiendo = False
+        usado = max(0, pico - inicio)
+        metricas.observar("tool_memoria_pico_bytes", usado, {"tool": tool}, buckets=_BUCKETS_BYTES)
+        metricas.observar("tool_memoria_retenida_bytes", max(0, actual - inicio), {"tool": tool}, buckets=_BUCKETS_BYTES)
+        if usado > self.picos.get(tool, 0):
+            self.picos[tool] = usado
+            metricas.fijar("tool_memoria_pico_max_bytes", usado, {"tool": tool})
+
+    def informe(self, top: int, agrupar: str, diferencia: bool) -> dict:
+        """Sitios que más memoria tienen asignada ahora (o que más crecieron desde el arranque)."""
+        snapshot = self._instantanea()
+        if diferencia and self._base is not None:
+            estadisticas = snapshot.compare_to(self._base, agrupar)
+        else:
+            estadisticas = snapshot.statistics(agrupar)
+        sitios = []
+        for e in estadisticas[:top]:
+            sitio = {"sitio": f"{e.traceback[0].filename}:{e.traceback[0].lineno}", "bytes": e.size, "bloques": e.count}
+            if agrupar == "filename":
+                sitio["sitio"] = e.traceback[0].filename
+            elif agrupar == "traceback":
+                sitio["pila"] = [f"{f.filename}:{f.lineno}" for f in e.traceback]
+            if diferencia:
+                sitio["diferencia_bytes"] = e.size_diff
+            sitios.append(sitio)
+        actual, pico = tracemalloc.get_traced_memory()
+        return {
+            "proceso": memoria_proceso(),
+            "trazada_bytes": actual,
+            "trazada_pico_bytes": pico,
+            "llamadas_en_curso": self.en_curso,
+            "pico_por_tool": dict(sorted(self.picos.items(), key=lambda x: -x[1])),
+            "sitios": sitios,
+        }
+
+
+memoria = Memoria(MEMORIA_MUESTREO, MEMORIA_FRAMES)
+if MEMORIA_ACTIVA:
+    # Desde la importación, así la base incluye lo que el server carga al arrancar
+    tracemalloc.start(MEMORIA_FRAMES)
+
+    @tarea_de_fondo
+    async def _base_memoria() -> None:
+        memoria.iniciar()
+
+
+# ============================================================
+# EVENT LOOP: RETRASO, BLOQUEOS Y TRABAJADORES (/debug/bucle)
+# ============================================================
+
+# Todas las llamadas comparten un solo event loop: un tramo sincrónico largo (traducir, generar
+# seguimientos, trigramas) demora a los demás clientes. BUCLE_INTERVALO_MS = cada cuánto se mide
+# el retraso; un retraso de más de BUCLE_BLOQUEO_MS se registra como bloqueo, con la pila
+BUCLE_MONITOR = os.environ.get("BUCLE_MONITOR", "1") == "1"
+BUCLE_INTERVALO_MS = float(os.environ.get("BUCLE_INTERVALO_MS", 100))
+BUCLE_BLOQUEO_MS = float(os.environ.get("BUCLE_BLOQUEO_MS", 200))
+BUCLE_BLOQUEOS_GUARDADOS = int(os.environ.get("BUCLE_BLOQUEOS_GUARDADOS", 50))
+# Fases de CPU grandes corren en un pool de BUCLE_TRABAJADORES hilos (0 = todo en el loop). Con
+# el GIL no van más rápido, pero el intérprete alterna cada 5 ms y el loop sigue atendiendo
+# mientras tanto. Cada fase se mide en su unidad: filas (prefiltro, preparar la timeline) o días
+# de huecos a rellenar (generar seguimientos). Pasar a un hilo cuesta ~40 µs: los umbrales
+# apuntan a ~1 ms de trabajo (~0,5 µs por fila o por día de hueco)
+BUCLE_TRABAJADORES = int(os.environ.get("BUCLE_TRABAJADORES", 2))
+BUCLE_DESCARGAR_FILAS = int(os.environ.get("BUCLE_DESCARGAR_FILAS", 1000))
+BUCLE_DESCARGAR_DIAS = int(os.environ.get("BUCLE_DESCARGAR_DIAS", 2000))
+
+_BUCKETS_RETRASO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class MonitorBucle:
+    """Una tarea duerme `intervalo` y mide cuánto tarde despierta (el retraso del loop). Un hilo
+    vigía mira cuándo despertó por última vez: si el loop lleva más de `umbral` sin despertarla,
+    toma la pila del hilo del loop, que es el código que lo está bloqueando. Al destrabarse, la
+    tarea registra el bloqueo con esa pila y la tool que la contiene."""
+
+    def __init__(self, intervalo: float, umbral: float, guardados: int):
+        self.intervalo = intervalo
+        self.umbral = umbral
+        self.bloqueos = deque(maxlen=guardados)
+        self.retraso_max = 0.0
+        self._despertar = time.monotonic() + intervalo  # cuándo debería despertar la tarea
+        self._pila = None  # pila tomada por el vigía durante el bloqueo en curso
+
+    async def medir(self) -> None:
+        hilo = threading.get_ident()
+        parar = threading.Event()
+        threading.Thread(target=self._vigilar, args=(hilo, parar), name="vigia-bucle", daemon=True).start()
+        try:
+            while True:
+                self._despertar = time.monotonic() + self.intervalo
+                await asyncio.sleep(self.intervalo)
+                retraso = max(0.0, time.monotonic() - self._despertar)
+                self._despertar = None  # despierta: lo que siga no es un bloqueo
+                metricas.observar("bucle_retraso_segundos", retraso, buckets=_BUCKETS_RETRASO)
+                if retraso > self.retraso_max:
+                    self.retraso_max = retraso
+                    metricas.fijar("bucle_retraso_max_segundos", retraso)
+                pila, self._pila = self._pila, None
+                if retraso > self.umbral:
+                    self._registrar(retraso, pila)
+        finally:
+            parar.set()
+
+    def _vigilar(self, hilo: int, parar: threading.Event) -> None:
+        despertar_visto = None
+        while not parar.wait(self.umbral / 4):
+            despertar = self._despertar
+            if despertar is None or despertar == despertar_visto or time.monotonic() - despertar <= self.umbral:
+                continue
+            despertar_visto = despertar  # una pila por bloqueo
+            frame = sys._current_frames().get(hilo)
+            pila = []
+            while frame is not None:
+                pila.append(f"{_nombre_frame(frame)}:{frame.f_lineno}")
+                frame = frame.f_back
+            pila.reverse()
+            self._pila = pila
+
+    def _registrar(self, retraso: float, pila) -> None:
+        # La tool es la corrutina más interna de la pila con nombre de tool
+        funciones = [f.rsplit(":", 1)[0].rpartition(".")[2] for f in pila or []]
+        tool = next((f for f in reversed(funciones) if f in PRIORIDAD_POR_TOOL), "-")
+        metricas.sumar("bucle_bloqueos_total", {"tool": tool})
+        self.bloqueos.append({
+            "cuando": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ms": round(retraso * 1000, 1),
+            "tool": tool,
+            "pila": pila,
+        })
+        print(f"[bucle] bloqueado {retraso * 1000:.0f} ms (tool: {tool})", file=sys.stderr)
+        for linea in (pila or [])[-12:]:
+            print(f"    {linea}", file=sys.stderr)
+
+    def informe(self) -> dict:
+        return {
+            "intervalo_ms": self.intervalo * 1000,
+            "umbral_ms": self.umbral * 1000,
+            "retraso_max_ms": round(self.retraso_max * 1000, 1),
+            "trabajadores": BUCLE_TRABAJADORES,
+            "descargar_desde_filas": BUCLE_DESCARGAR_FILAS,
+            "descargar_desde_dias": BUCLE_DESCARGAR_DIAS,
+            "bloqueos": list(reversed(self.bloqueos)),
+        }
+
+
+monitor_bucle = MonitorBucle(BUCLE_INTERVALO_MS / 1000, BUCLE_BLOQUEO_MS / 1000, BUCLE_BLOQUEOS_GUARDADOS)
+if BUCLE_MONITOR:
+    tarea_de_fondo(monitor_bucle.medir)
+
+_trabajadores = ThreadPoolExecutor(BUCLE_TRABAJADORES, thread_name_prefix="trabajador") if BUCLE_TRABAJADORES > 0 else None
+
+
+async def en_trabajador(tamano: int, funcion, *args, umbral: int = None):
+    """funcion(*args) en el pool de trabajadores si `tamano` llega al umbral de la fase
+    (BUCLE_DESCARGAR_FILAS si no se pasa), con el contexto actual: tenant, prioridad; si no,
+    directo en el loop."""
+    if _trabajadores is None or tamano < (BUCLE_DESCARGAR_FILAS if umbral is None else umbral):
+        return funcion(*args)
+    metricas.sumar("bucle_descargas_total", {"fase": funcion.__name__})
+    contexto = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_trabajadores, contexto.run, funcion, *args)
+
+
+# ============================================================
+# ASESOR DE ÍNDICES (/debug/consultas)
+# ============================================================
+
+# Registra la forma de cada consulta a PostgREST (tabla, columnas y operadores, orden) con su
+# latencia, y marca las formas que ningún índice de migrations/ cubre
+ASESOR_INDICES = os.environ.get("ASESOR_INDICES", "0") == "1"
+MIGRACIONES_DIR = os.environ.get("MIGRACIONES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
+
+_RE_INDICE = re.compile(
+    r"create\s+(?:unique\s+)?index\s+(?:concurrently\s+)?(?:if\s+not\s+exists\s+)?\w+\s+"
+    r"on\s+(?:public\.)?(\w+)\s*(?:using\s+(\w+)\s*)?\(([^;]*?)\)\s*(?:nulls\s+not\s+distinct\s*)?(?:where\s+[^;]*)?;",
+    re.IGNORECASE,
+)
+_PARAMS_NO_FILTRO = {"select", "limit", "offset", "order", "on_conflict", "columns"}
+
+
+def _partir_lista(texto: str) -> list:
+    """Separa por comas de primer nivel (respeta paréntesis y comillas)."""
+    partes, actual, nivel, comillas = [], [], 0, False
+    for c in texto:
+        if c == '"':
+            comillas = not comillas
+        elif not comillas and c == "(":
+            nivel += 1
+        elif not comillas and c == ")":
+            nivel -= 1
+        elif c == "," and not nivel and not comillas:
+            partes.append("".join(actual).strip())
+            actual = []
+            continue
+        actual.append(c)
+    if actual:
+        partes.append("".join(actual).strip())
+    return partes
+
+
+def _operador(expresion: str) -> str:
+    """"ilike.%x%" → "ilike"; las negadas quedan como "not.match" (ningún índice las resuelve)."""
+    partes = expresion.split(".", 2)
+    return f"not.{partes[1]}" if partes[0] == "not" and len(partes) > 1 else partes[0]
+
+
+def _condiciones_logicas(texto: str) -> list:
+    """and=(a.ilike.x,b.eq.y) → [("a", "ilike"), ("b", "eq")] (los or anidados también)."""
+    condiciones = []
+    for termino in _partir_lista(texto.strip()[1:-1] if texto.strip().startswith("(") else texto):
+        cabeza = termino.split("(", 1)[0]
+        if cabeza in ("and", "or", "not.and", "not.or"):
+            condiciones.extend(_condiciones_logicas(termino[len(cabeza):]))
+            continue
+        columna, _, resto = termino.partition(".")
+        condiciones.append((columna, _operador(resto)))
+    return condiciones
+
+
+class AsesorIndices:
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.indices = defaultdict(list)  # tabla -> [(método, [columnas], trigramas)]
+        self.formas = {}  # forma -> estadísticas
+        self._cargado = False
+
+    def cargar(self) -> None:
+        self._cargado = True
+        try:
+            archivos = sorted(f for f in os.listdir(self.directorio) if f.endswith(".sql"))
+        except OSError:
+            return
+        for archivo in archivos:
+            with open(os.path.join(self.directorio, archivo), encoding="utf-8") as f:
+                sql = re.sub(r"--[^\n]*", "", f.read())
+            for tabla, metodo, columnas in _RE_INDICE.findall(sql):
+                partes = [c.split() for c in _partir_lista(columnas)]
+                self.indices[tabla].append((
+                    (metodo or "btree").lower(),
+                    [p[0] for p in partes],
+                    any("gin_trgm_ops" in p for p in partes),
+                ))
+
+    def cubierta(self, tabla: str, condiciones: list, orden: str):
+        """True/False si algún índice sirve para la forma; None si no hay nada que indexar."""
+        texto = {c for c, op in condiciones if op in ("like", "ilike", "match", "imatch")}
+        igualdad = {c for c, op in condiciones if op in ("eq", "in", "is", "gt", "gte", "lt", "lte")}
+        columna_orden = orden.split(",")[0].split(".")[0] if orden else ""
+        indices = self.indices.get(tabla, [])
+        if texto:
+            return all(any(trgm and columnas[0] == c for _, columnas, trgm in indices) for c in texto)
+        buscadas = igualdad or ({columna_orden} if columna_orden else set())
+        if not buscadas:
+            return None
+        if "id" in buscadas or columna_orden == "id":
+            return True  # clave primaria (lecturas completas paginadas por id)
+        return any(not trgm and columnas[0] in buscadas for _, columnas, trgm in indices)
+
+    def registrar(self, request: httpx.Request, segundos: float) -> None:
+        if not self._cargado:
+            self.cargar()
+        tabla = request.url.path.split("/rest/v1/", 1)[-1]
+        if request.method != "GET" or tabla.startswith("rpc/"):
+            forma, cubierta = f"{request.method} {tabla}", None
+        else:
+            condiciones = []
+            orden = ""
+            for clave, valor in request.url.params.multi_items():
+                if clave == "order":
+                    orden = valor
+                elif clave in ("and", "or"):
+                    condiciones.extend(_condiciones_logicas(valor))
+                elif clave not in _PARAMS_NO_FILTRO:
+                    condiciones.append((clave, _operador(valor)))
+            partes = [f"{c}.{op}" for c, op in sorted(condiciones)]
+            if orden:
+                partes.append(f"order={orden}")
+            if "limit" in request.url.params:
+                partes.append("limit")
+            forma = f"GET {tabla}?{'&'.join(partes)}"
+            cubierta = self.cubierta(tabla, condiciones, orden)
+
+        estadistica = self.formas.get(forma)
+        if estadistica is None:
+            estadistica = self.formas[forma] = {
+                "forma": forma, "tabla": tabla, "pedidos": 0, "segundos_total": 0.0, "segundos_max": 0.0,
+                "con_indice": cubierta,
+            }
+            if cubierta is False:
+                metricas.sumar("asesor_formas_sin_indice_total", {"tabla": tabla})
+        estadistica["pedidos"] += 1
+        estadistica["segundos_total"] += segundos
+        estadistica["segundos_max"] = max(estadistica["segundos_max"], segundos)
+
+    def informe(self) -> list:
+        filas = sorted(self.formas.values(), key=lambda e: e["segundos_total"], reverse=True)
+        return [
+            {
+                **e,
+                "segundos_total": round(e["segundos_total"], 4),
+                "segundos_max": round(e["segundos_max"], 4),
+                "ms_promedio": round(1000 * e["segundos_total"] / e["pedidos"], 2),
+            }
+            for e in filas
+        ]
+
+
+asesor_indices = AsesorIndices(MIGRACIONES_DIR)
+
+
+# ============================================================
+# GRABACIÓN DE TRÁFICO (para bench/replay.py)
+# ============================================================
+
+# Archivo JSONL con una línea por llamada a tool (vacío = no se graba). Rota al pasar GRABAR_MAX_MB
+GRABAR_PATH = os.environ.get("GRABAR_PATH", "").strip()
+GRABAR_MAX_MB = float(os.environ.get("GRABAR_MAX_MB", 50))
+GRABAR_ARCHIVOS = int(os.environ.get("GRABAR_ARCHIVOS", 5))
+# Guardar también las filas que devolvió Supabase (con los textos seudonimizados)
+GRABAR_RESPUESTAS = os.environ.get("GRABAR_RESPUESTAS", "0") == "1"
+# Sal de los seudónimos: la misma palabra da el mismo seudónimo en todas las grabaciones con la misma sal.
+# Obligatoria: sin sal el seudónimo es un hash de la palabra y se revierte con una lista de apellidos
+GRABAR_SAL = os.environ.get("GRABAR_SAL", "")
+if GRABAR_PATH and not GRABAR_SAL:
+    GRABAR_PATH = ""
+    print("[grabar] GRABAR_PATH sin GRABAR_SAL: grabación desactivada", file=sys.stderr)
+# Las líneas se juntan en memoria y se escriben fuera del loop cada GRABAR_VOLCAR_SEG; con el disco
+# trabado, pasadas _GRABAR_PENDIENTES_MAX líneas se descartan
+GRABAR_VOLCAR_SEG = float(os.environ.get("GRABAR_VOLCAR_SEG", 1))
+_GRABAR_PENDIENTES_MAX = 10000
+
+# Pedidos a Supabase de la llamada en curso (None = no se está grabando)
+_grabacion = contextvars.ContextVar("grabacion", default=None)
+
+# Columnas que se graban tal cual; el resto de los textos se seudonimiza palabra por palabra
+_COLUMNAS_CLARAS = {
+    "id", "expediente_id", "caso_srt_id", "fecha", "fecha_notificacion", "estado", "etapa", "tipo",
+    "tipo_caso", "tipo_comunicacion", "tipo_descripcion", "origen", "activo",
+}
+_COLUMNAS_CASO = ("expediente_id", "caso_srt_id", "id")
+
+
+def seudonimo(palabra: str) -> str:
+    """Palabra → seudónimo estable de letras y dígitos (buscable igual que la original)."""
+    return "p" + hashlib.sha256(f"{GRABAR_SAL}:{palabra}".encode()).hexdigest()[:8]
+
+
+def seudonimizar(texto) -> str:
+    if not isinstance(texto, str):
+        return texto
+    return " ".join(p if p in _CONECTORES else seudonimo(p) for p in re.findall(r"[0-9a-z]+", plegar(texto)))
+
+
+def _fila_grabable(fila):
+    if not isinstance(fila, dict):
+        return fila
+    return {k: (v if k in _COLUMNAS_CLARAS else seudonimizar(v)) for k, v in fila.items()}
+
+
+class Grabador:
+    def __init__(self, ruta: str, max_bytes: float, archivos: int, respuestas: bool):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.archivos = archivos
+        self.respuestas = respuestas
+        self._archivo = None
+        self._pendientes = []
+        # El volcado periódico y el final (al apagar) pueden coincidir en hilos distintos
+        self._escribiendo = threading.Lock()
+
+    def pedido(self, request: httpx.Request, respuesta: httpx.Response, segundos: float) -> dict:
+        tabla = request.url.path.split("/rest/v1/", 1)[-1]
+        caso = None
+        if tabla.startswith("rpc/"):
+            try:
+                caso = json.loads(request.content or b"{}").get("p_caso_id")
+            except ValueError:
+                pass
+        else:
+            for columna in _COLUMNAS_CASO:
+                valor = request.url.params.get(columna, "")
+                if valor.startswith("eq."):
+                    caso = valor[3:]
+                    break
+            nro = request.url.params.get("srt_expediente_nro", "")
+            if nro.startswith("eq."):
+                caso = seudonimizar(nro[3:])
+        pedido = {
+            "m": request.method, "t": tabla, "caso": caso, "s": respuesta.status_code,
+            "ms": round(segundos * 1000, 2), "bytes": len(respuesta.content),
+        }
+        if request.method == "GET" or tabla.startswith("rpc/"):
+            try:
+                if respuesta.headers.get("content-type", "").startswith("text/csv"):
+                    filas = list(csv.DictReader(io.StringIO(respuesta.text)))
+                else:
+                    filas = respuesta.json()
+            except ValueError:
+                filas = None
+            if isinstance(filas, list):
+                pedido["filas"] = len(filas)
+                if self.respuestas:
+                    pedido["datos"] = [_fila_grabable(f) for f in filas]
+        return pedido
+
+    def llamada(self, tool: str, argumentos: dict, segundos: float, pedidos: list, resultado) -> None:
+        texto = ""
+        if resultado is not None and getattr(resultado, "content", None):
+            texto = getattr(resultado.content[0], "text", "") or ""
+        registro = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "tool": tool,
+            "tenant": tenant_actual().nombre,
+            "args": {k: seudonimizar(v) for k, v in (argumentos or {}).items()},
+            "ms": round(segundos * 1000, 2),
+            "resultado": "error" if texto.startswith('{"error"') else "ok",
+            "bytes": len(texto.encode()),
+            "upstream": pedidos,
+        }
+        if len(self._pendientes) >= _GRABAR_PENDIENTES_MAX:
+            metricas.sumar("grabacion_descartadas_total")
+            return
+        self._pendientes.append(json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    async def volcar_periodicamente(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(GRABAR_VOLCAR_SEG)
+                if self._pendientes:
+                    lineas, self._pendientes = self._pendientes, []
+                    await asyncio.to_thread(self._escribir, lineas)
+        finally:
+            # Al apagar se escribe lo que quedó
+            lineas, self._pendientes = self._pendientes, []
+            if lineas:
+                self._escribir(lineas)
+
+    def _escribir(self, lineas: list) -> None:
+        with self._escribiendo:
+            try:
+                if self._archivo is None:
+                    self._archivo = open(self.ruta, "a", encoding="utf-8")
+                self._archivo.write("".join(lineas))
+                self._archivo.flush()
+                if self._archivo.tell() >= self.max_bytes:
+                    self._rotar()
+            except OSError:
+                metricas.sumar("grabacion_errores_total")
+
+    def _rotar(self) -> None:
+        """ruta → ruta.1 → ruta.2 ...; se conservan GRABAR_ARCHIVOS archivos rotados."""
+        self._archivo.close()
+        self._archivo = None
+        for i in range(self.archivos - 1, 0, -1):
+            if os.path.exists(f"{self.ruta}.{i}"):
+                os.replace(f"{self.ruta}.{i}", f"{self.ruta}.{i + 1}")
+        os.replace(self.ruta, f"{self.ruta}.1")
+
+
+grabador = Grabador(GRABAR_PATH, GRABAR_MAX_MB * 1024 * 1024, GRABAR_ARCHIVOS, GRABAR_RESPUESTAS)
+if GRABAR_PATH:
+    tarea_de_fondo(grabador.volcar_periodicamente)
+
+
+# ============================================================
+# TOOLS MCP
+# ============================================================
+
+@mcp.tool()
+async def buscar_caso(nombre: str) -> str:
+    """Busca el caso de un cliente por su nombre completo en la base de expedientes legales.
+    Devuelve la caratula, el estado actual y un ID de referencia.
+    IMPORTANTE: Solo compartir con el cliente la caratula y el estado del caso.
+    Explicarle al cliente en que consiste ese estado en terminos simples.
+    No revelar numero de expediente, juzgado ni datos internos.
+
+    Args:
+        nombre: Nombre completo o parcial del cliente (ej: "Perez Juan")
+    """
+    if not tenant_actual().configurado:
+        return json.dumps({"error": "Variables de entorno SUPABASE_URL o SUPABASE_KEY no configuradas."})
+
+    palabras = palabras_busqueda(nombre)
+    if not palabras:
+        return json.dumps({"error": "Debe proporcionar un nombre para buscar."})
+
+    sin_resultados = {
+        "mensaje": f"No se encontraron casos para '{nombre}'.",
+        "sugerencia": "Verificar que el nombre esté bien escrito o probar con el apellido solamente.",
+    }
+    sin_activos = {**sin_resultados, "mensaje": f"No se encontraron casos activos para '{nombre}'."}
+    if busqueda_sin_resultados("expedientes", palabras):
+        return json.dumps(sin_resultados)
+
+    headers = _headers_supabase()
+
+    url = f"{tenant_actual().url}/rest/v1/expedientes"
+    select = "id,caratula,estado"
+    if MCP_SESIONES:
+        # La sesión recuerda también el tipo: consultar_movimientos no necesita leer el expediente
+        select += ",tipo_caso"
+
+    # Los finalizados se excluyen en la consulta: las 5 filas devueltas son todas mostrables
+    params = {"select": select, "limit": "5", **planificar_busqueda("expedientes", "caratula", nombre, excluir_finalizados=True)}
+
+    try:
+        async with _cliente(10.0) as client:
+            response = await client.get(url, headers=headers, params=params)
+            if response.status_code != 200 and MCP_SESIONES:
+                # Si tipo_caso no existe, la búsqueda de siempre
+                response = await client.get(url, headers=headers, params={**params, "select": "id,caratula,estado"})
     except Exception as e:
         return json.dumps({"error": f"No se pudo conectar a Supabase: {type(e).__name__}: {str(e)}"})
 
@@ -924,10 +3465,21 @@ async def buscar_caso(nombre: str) -> str:
     resultados = response.json()
 
     if not resultados:
-        return json.dumps({
-            "mensaje": f"No se encontraron casos para '{nombre}'.",
-            "sugerencia": "Verificar que el nombre esté bien escrito o probar con el apellido solamente.",
-        })
+        # La consulta excluye los finalizados: si el nombre coincide solo con finalizados la
+        # respuesta es otra y no es una búsqueda sin resultados (no va a la caché de negativos)
+        try:
+            async with _cliente(10.0) as client:
+                respuesta_todos = await client.get(
+                    url, headers=headers, params={"select": "id", "limit": "1", **planificar_busqueda("expedientes", "caratula", nombre)},
+                )
+        except Exception:
+            return json.dumps(sin_resultados)
+        if respuesta_todos.status_code != 200:
+            return json.dumps(sin_resultados)
+        if respuesta_todos.json():
+            return json.dumps(sin_activos)
+        cache_negativos.guardar(("expedientes", normalizar_busqueda(nombre)), True)
+        return json.dumps(sin_resultados)
 
     casos = []
     for r in resultados:
@@ -940,16 +3492,44 @@ async def buscar_caso(nombre: str) -> str:
             "caratula": limpiar_caratula(r.get("caratula", "")),
             "estado": estado,
         })
+        if "tipo_caso" in r:
+            sesiones.recordar(("exp", r.get("id")), estado=r.get("estado", ""), es_despido=(r["tipo_caso"] or "").lower() == "despido")
 
     if not casos:
-        return json.dumps({
-            "mensaje": f"No se encontraron casos activos para '{nombre}'.",
-            "sugerencia": "Verificar que el nombre esté bien escrito o probar con el apellido solamente.",
-        })
+        return json.dumps(sin_activos)
 
+    prefetch.lanzar([("exp", c["expediente_id"]) for c in casos if c["expediente_id"]])
     return json.dumps({"cantidad_resultados": len(casos), "casos": casos}, ensure_ascii=False)
 
 
+async def leer_comunicaciones_srt(caso_id, numero_srt: str, headers: dict) -> list:
+    """Últimas comunicaciones del caso: SRT (por caso_srt_id) y Mi Ventanilla (por número SRT), en paralelo."""
+    fuentes = []
+    if caso_id:
+        fuentes.append(("comunicaciones_srt", "caso_srt_id", caso_id, "SRT"))
+    if numero_srt:
+        fuentes.append(("comunicaciones_miventanilla", "srt_expediente_nro", numero_srt, "Mi Ventanilla"))
+
+    async def leer(client, tabla, campo, valor, origen):
+        try:
+            _, filas = await leer_tuplas(
+                client, tabla, ("fecha_notificacion", "tipo_comunicacion", "detalle"), headers,
+                {campo: f"eq.{valor}", "order": "fecha_notificacion.desc", "limit": "3"},
+            )
+        except Exception:
+            return []
+        return [
+            {"fecha": _fecha_canonica(fecha), "tipo": tipo, "detalle": detalle, "origen": origen}
+            for fecha, tipo, detalle in filas
+        ]
+
+    if not fuentes:
+        return []
+    async with _cliente(10.0) as client:
+        partes = await asyncio.gather(*(leer(client, *f) for f in fuentes))
+    return [c for parte in partes for c in parte]
+
+
 @mcp.tool()
 async def buscar_caso_srt(nombre: str) -> str:
     """Busca el caso de un cliente en comision medica (SRT/etapa administrativa).
@@ -962,29 +3542,24 @@ async def buscar_caso_srt(nombre: str) -> str:
     Args:
         nombre: Nombre completo o parcial del cliente (ej: "Perez Juan")
     """
-    if not SUPABASE_URL or not SUPABASE_KEY:
+    if not tenant_actual().configurado:
         return json.dumps({"error": "Variables de entorno no configuradas."})
 
-    palabras = nombre.strip().split()
+    palabras = palabras_busqueda(nombre)
     if not palabras:
         return json.dumps({"error": "Debe proporcionar un nombre para buscar."})
 
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-    }
+    if busqueda_sin_resultados("casos_srt", palabras):
+        return json.dumps({"mensaje": f"No se encontraron casos SRT para '{nombre}'."})
 
-    url_srt = f"{SUPABASE_URL}/rest/v1/casos_srt"
+    headers = _headers_supabase()
+
+    url_srt = f"{tenant_actual().url}/rest/v1/casos_srt"
     select_srt = "id,nombre,etapa,estado,numero_srt,comision_medica"
-    params = {"select": select_srt, "limit": "5", "activo": "eq.true"}
-    if len(palabras) == 1:
-        params["nombre"] = f"ilike.%{palabras[0]}%"
-    else:
-        conditions = ",".join([f"nombre.ilike.%{p}%" for p in palabras])
-        params["and"] = f"({conditions})"
+    params = {"select": select_srt, "limit": "5", "activo": "eq.true", **planificar_busqueda("casos_srt", "nombre", nombre)}
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with _cliente(10.0) as client:
             response = await client.get(url_srt, headers=headers, params=params)
     except Exception as e:
         return json.dumps({"error": f"No se pudo conectar a Supabase: {str(e)}"})
@@ -995,99 +3570,51 @@ async def buscar_caso_srt(nombre: str) -> str:
     resultados = response.json()
 
     if not resultados:
+        cache_negativos.guardar(("casos_srt", normalizar_busqueda(nombre)), True)
         return json.dumps({"mensaje": f"No se encontraron casos SRT para '{nombre}'."})
 
     casos = []
     for r in resultados:
-        caso = {
+        casos.append({
             "caso_srt_id": r.get("id", ""),
             "nombre": r.get("nombre", ""),
             "etapa": r.get("etapa", "Sin etapa"),
             "estado": r.get("estado", ""),
             "comision_medica": r.get("comision_medica", ""),
-        }
-
-        caso_id = r.get("id")
-        numero_srt = r.get("numero_srt", "")
-        comunicaciones = []
-
-        if caso_id:
-            url_com_srt = f"{SUPABASE_URL}/rest/v1/comunicaciones_srt"
-            params_com = {
-                "select": "fecha_notificacion,tipo_comunicacion,detalle,estado",
-                "caso_srt_id": f"eq.{caso_id}",
-                "order": "fecha_notificacion.desc",
-                "limit": "3",
-            }
-            try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    resp_com = await client.get(url_com_srt, headers=headers, params=params_com)
-                if resp_com.status_code == 200:
-                    for c in resp_com.json():
-                        comunicaciones.append({
-                            "fecha": c.get("fecha_notificacion", ""),
-                            "tipo": c.get("tipo_comunicacion", ""),
-                            "detalle": c.get("detalle", ""),
-                            "origen": "SRT",
-                        })
-            except Exception:
-                pass
-
-        if numero_srt:
-            url_com_mv = f"{SUPABASE_URL}/rest/v1/comunicaciones_miventanilla"
-            params_mv = {
-                "select": "fecha_notificacion,tipo_comunicacion,detalle,estado",
-                "srt_expediente_nro": f"eq.{numero_srt}",
-                "order": "fecha_notificacion.desc",
-                "limit": "3",
-            }
-            try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    resp_mv = await client.get(url_com_mv, headers=headers, params=params_mv)
-                if resp_mv.status_code == 200:
-                    for c in resp_mv.json():
-                        comunicaciones.append({
-                            "fecha": c.get("fecha_notificacion", ""),
-                            "tipo": c.get("tipo_comunicacion", ""),
-                            "detalle": c.get("detalle", ""),
-                            "origen": "Mi Ventanilla",
-                        })
-            except Exception:
-                pass
+        })
+        sesiones.recordar(("srt", r.get("id")), estado=r.get("estado", ""))
+    total = 1 + len(casos)
+    await informar_avance(1, total, {"parcial": "encabezado", "casos": casos})
 
+    async def completar(caso: dict, numero_srt: str) -> dict:
+        comunicaciones = await leer_comunicaciones_srt(caso["caso_srt_id"], numero_srt, headers)
         if comunicaciones:
             caso["ultimas_comunicaciones"] = comunicaciones
-        casos.append(caso)
+        return caso
+
+    # Las comunicaciones de todos los casos en paralelo; cada caso se informa apenas termina
+    pendientes = [completar(caso, r.get("numero_srt", "")) for caso, r in zip(casos, resultados)]
+    for paso, siguiente in enumerate(asyncio.as_completed(pendientes), start=2):
+        caso = await siguiente
+        await informar_avance(paso, total, {
+            "parcial": "comunicaciones", "caso_srt_id": caso["caso_srt_id"],
+            "ultimas_comunicaciones": caso.get("ultimas_comunicaciones", []),
+        })
 
+    prefetch.lanzar([("srt", c["caso_srt_id"]) for c in casos if c["caso_srt_id"]])
     return json.dumps({"cantidad_resultados": len(casos), "casos": casos}, ensure_ascii=False)
 
 
-@mcp.tool()
-async def consultar_movimientos(expediente_id: int) -> str:
-    """Consulta los ultimos movimientos de un expediente judicial.
-    Usar DESPUES de buscar_caso, pasando el expediente_id que devolvio.
-    Devuelve movimientos reales del juzgado y seguimientos del estudio, todo traducido.
-    IMPORTANTE: Mostrar al cliente los movimientos tal cual. NO inventar movimientos.
-
-    Args:
-        expediente_id: ID numerico del expediente (obtenido de buscar_caso)
-    """
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        return json.dumps({"error": "Variables de entorno no configuradas."})
-
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-    }
-
-    # Obtener estado y tipo_caso del expediente
+async def leer_metadatos_expediente(expediente_id: int, headers: dict):
+    """Devuelve (estado, es_despido) del expediente (("", False) si no existe), o None si la lectura
+    falló: quien la llama decide qué hacer sin confundir un error con un caso sin estado."""
     estado_str = ""
     es_despido = False
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with _cliente(10.0) as client:
             # Intentar con tipo_caso primero
             resp = await client.get(
-                f"{SUPABASE_URL}/rest/v1/expedientes",
+                f"{tenant_actual().url}/rest/v1/expedientes",
                 headers=headers,
                 params={
                     "select": "estado,tipo_caso",
@@ -1103,7 +3630,7 @@ async def consultar_movimientos(expediente_id: int) -> str:
             else:
                 # Si tipo_caso no existe, intentar solo estado
                 resp2 = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/expedientes",
+                    f"{tenant_actual().url}/rest/v1/expedientes",
                     headers=headers,
                     params={
                         "select": "estado",
@@ -1111,13 +3638,44 @@ async def consultar_movimientos(expediente_id: int) -> str:
                         "limit": "1",
                     },
                 )
-                if resp2.status_code == 200:
-                    data2 = resp2.json()
-                    if data2:
-                        estado_str = data2[0].get("estado", "")
+                if resp2.status_code != 200:
+                    return None
+                data2 = resp2.json()
+                if data2:
+                    estado_str = data2[0].get("estado", "")
     except Exception:
-        pass
+        return None
+    return estado_str, es_despido
+
+
+async def leer_metadatos_srt(caso_srt_id: int, headers: dict):
+    """Devuelve el estado del caso SRT ("" si no existe), o None si la lectura falló."""
+    estado_str = ""
+    try:
+        async with _cliente(10.0) as client:
+            resp = await client.get(
+                f"{tenant_actual().url}/rest/v1/casos_srt",
+                headers=headers,
+                params={
+                    "select": "estado",
+                    "id": f"eq.{caso_srt_id}",
+                    "limit": "1",
+                },
+            )
+            if resp.status_code != 200:
+                return None
+            data = resp.json()
+            if data:
+                estado_str = data[0].get("estado", "")
+    except Exception:
+        return None
+    return estado_str
 
+
+async def armar_respuesta_movimientos(
+    expediente_id: int, estado_str: str, es_despido: bool, headers: dict, pendientes: list = None,
+) -> str:
+    """Salida final de consultar_movimientos a partir de los metadatos del expediente."""
     # No mostrar movimientos de casos finalizados (estados 80-84)
     if es_caso_finalizado(estado_str):
         return json.dumps({"mensaje": "No se encontraron movimientos para este expediente."})
@@ -1130,6 +3688,7 @@ async def consultar_movimientos(expediente_id: int) -> str:
             es_despido=es_despido,
             headers=headers,
             campo_id="expediente_id",
+            pendientes=pendientes,
         )
     except Exception as e:
         return json.dumps({"error": f"Error al consultar movimientos: {str(e)}"})
@@ -1144,44 +3703,8 @@ async def consultar_movimientos(expediente_id: int) -> str:
     }, ensure_ascii=False)
 
 
-@mcp.tool()
-async def consultar_movimientos_srt(caso_srt_id: int) -> str:
-    """Consulta los ultimos movimientos de un caso SRT (comision medica).
-    Usar DESPUES de buscar_caso_srt, pasando el caso_srt_id que devolvio.
-    Devuelve movimientos reales de la SRT y seguimientos del estudio, todo traducido.
-    IMPORTANTE: Mostrar al cliente los movimientos tal cual. NO inventar movimientos.
-
-    Args:
-        caso_srt_id: ID numerico del caso SRT (obtenido de buscar_caso_srt)
-    """
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        return json.dumps({"error": "Variables de entorno no configuradas."})
-
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-    }
-
-    # Obtener estado del caso SRT
-    estado_str = ""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{SUPABASE_URL}/rest/v1/casos_srt",
-                headers=headers,
-                params={
-                    "select": "estado",
-                    "id": f"eq.{caso_srt_id}",
-                    "limit": "1",
-                },
-            )
-            if resp.status_code == 200:
-                data = resp.json()
-                if data:
-                    estado_str = data[0].get("estado", "")
-    except Exception:
-        pass
-
+async def armar_respuesta_movimientos_srt(caso_srt_id: int, estado_str: str, headers: dict, pendientes: list = None) -> str:
+    """Salida final de consultar_movimientos_srt a partir del estado del caso."""
     try:
         movimientos = await obtener_y_generar_movimientos(
             caso_id=caso_srt_id,
@@ -1190,6 +3713,7 @@ async def consultar_movimientos_srt(caso_srt_id: int) -> str:
             es_despido=False,
             headers=headers,
             campo_id="caso_srt_id",
+            pendientes=pendientes,
         )
     except Exception as e:
         return json.dumps({"error": f"Error al consultar movimientos SRT: {str(e)}"})
@@ -1204,5 +3728,200 @@ async def consultar_movimientos_srt(caso_srt_id: int) -> str:
     }, ensure_ascii=False)
 
 
+@mcp.tool()
+async def consultar_movimientos(expediente_id: int) -> str:
+    """Consulta los ultimos movimientos de un expediente judicial.
+    Usar DESPUES de buscar_caso, pasando el expediente_id que devolvio.
+    Devuelve movimientos reales del juzgado y seguimientos del estudio, todo traducido.
+    IMPORTANTE: Mostrar al cliente los movimientos tal cual. NO inventar movimientos.
+
+    Args:
+        expediente_id: ID numerico del expediente (obtenido de buscar_caso)
+    """
+    if not tenant_actual().configurado:
+        return json.dumps({"error": "Variables de entorno no configuradas."})
+
+    popularidad.registrar(("exp", expediente_id))
+    respuesta = snapshots.obtener(("exp", expediente_id))
+    if respuesta is None:
+        respuesta = await prefetch.tomar(("exp", expediente_id))
+    if respuesta is not None:
+        return respuesta
+
+    headers = _headers_supabase()
+    metadatos = sesiones.metadatos(("exp", expediente_id))
+    if metadatos is not None:
+        estado_str, es_despido = metadatos["estado"], metadatos["es_despido"]
+    else:
+        metadatos = await leer_metadatos_expediente(expediente_id, headers)
+        if metadatos is not None:
+            sesiones.recordar(("exp", expediente_id), estado=metadatos[0], es_despido=metadatos[1])
+        # Con la lectura fallida se responde como siempre (sin estado), pero no se recuerda
+        estado_str, es_despido = metadatos or ("", False)
+    await informar_avance(1, 3, {"expediente_id": expediente_id, "parcial": "encabezado"})
+    return await armar_respuesta_movimientos(expediente_id, estado_str, es_despido, headers)
+
+
+@mcp.tool()
+async def consultar_movimientos_srt(caso_srt_id: int) -> str:
+    """Consulta los ultimos movimientos de un caso SRT (comision medica).
+    Usar DESPUES de buscar_caso_srt, pasando el caso_srt_id que devolvio.
+    Devuelve movimientos reales de la SRT y seguimientos del estudio, todo traducido.
+    IMPORTANTE: Mostrar al cliente los movimientos tal cual. NO inventar movimientos.
+
+    Args:
+        caso_srt_id: ID numerico del caso SRT (obtenido de buscar_caso_srt)
+    """
+    if not tenant_actual().configurado:
+        return json.dumps({"error": "Variables de entorno no configuradas."})
+
+    popularidad.registrar(("srt", caso_srt_id))
+    respuesta = snapshots.obtener(("srt", caso_srt_id))
+    if respuesta is None:
+        respuesta = await prefetch.tomar(("srt", caso_srt_id))
+    if respuesta is not None:
+        return respuesta
+
+    headers = _headers_supabase()
+    metadatos = sesiones.metadatos(("srt", caso_srt_id))
+    if metadatos is not None:
+        estado_str = metadatos["estado"]
+    else:
+        estado_str = await leer_metadatos_srt(caso_srt_id, headers)
+        if estado_str is not None:
+            sesiones.recordar(("srt", caso_srt_id), estado=estado_str)
+        estado_str = estado_str or ""
+    await informar_avance(1, 3, {"caso_srt_id": caso_srt_id, "parcial": "encabezado"})
+    return await armar_respuesta_movimientos_srt(caso_srt_id, estado_str, headers)
+
+
+# ============================================================
+# RUTAS HTTP
+# ============================================================
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def ruta_metricas(request: Request) -> PlainTextResponse:
+    if not _autorizado(request):
+        return PlainTextResponse("No autorizado", status_code=401)
+    for tenant in TENANTS.values():
+        etiquetas = {"tenant": tenant.nombre} if _MULTI_TENANT else None
+        metricas.fijar("upstream_en_uso", tenant.limitador.en_uso, etiquetas)
+        metricas.fijar("upstream_en_cola", tenant.limitador.en_espera(), etiquetas)
+        if MCP_SESIONES and tenant.nombre in sesiones._instancias:
+            metricas.fijar("sesiones_activas", len(sesiones._instancias[tenant.nombre]), etiquetas)
+    # Series del proceso entero, no de un tenant
+    todos = {"tenant": "*"} if _MULTI_TENANT else None
+    for nombre, valor in memoria_proceso().items():
+        metricas.fijar(f"proceso_{nombre}_bytes", valor, todos)
+    if MEMORIA_ACTIVA:
+        metricas.fijar("tool_llamadas_en_curso", memoria.en_curso, todos)
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+
+@mcp.custom_route("/hooks/invalidate", methods=["POST"])
+async def ruta_invalidar(request: Request) -> JSONResponse:
+    """Destino de los Database Webhooks de Supabase (INSERT/UPDATE en tablas de casos y movimientos)."""
+    recibido = request.headers.get("authorization", "")
+    # Cada tenant tiene su webhook_token: el evento invalida solo sus cachés
+    tenant = next(
+        (t for t in TENANTS.values() if t.webhook_token and hmac.compare_digest(recibido, f"Bearer {t.webhook_token}")),
+        None,
+    )
+    if tenant is None:
+        return JSONResponse({"error": "No autorizado"}, status_code=401)
+    _tenant.set(tenant)
+    try:
+        payload = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "JSON inválido"}, status_code=400)
+    if not isinstance(payload, dict):
+        return JSONResponse({"error": "Se esperaba un evento de webhook"}, status_code=400)
+    try:
+        invalidados = await procesar_webhook(payload)
+    except ValueError as e:
+        metricas.sumar("webhook_rechazados_total")
+        return JSONResponse({"error": str(e)}, status_code=400)
+    # Supabase avisa a una sola réplica: que ella les pase el aviso a las demás
+    replicas.anunciar(invalidados)
+    return JSONResponse({"invalidados": [f"{tipo}:{caso_id}" for tipo, caso_id in invalidados]})
+
+
+if replicas.activa:
+    @mcp.custom_route("/replicas/invalidar", methods=["POST"])
+    async def ruta_replicas(request: Request) -> JSONResponse:
+        """Anuncios de las otras réplicas: casos que cambiaron allá."""
+        try:
+            invalidados = replicas.recibir(await request.body(), request.headers.get("x-replica-firma", ""))
+        except (ValueError, TypeError) as e:
+            metricas.sumar("replicas_anuncios_rechazados_total")
+            return JSONResponse({"error": str(e)}, status_code=401)
+        return JSONResponse({"invalidados": invalidados})
+
+
+# Las rutas /debug/* muestran código y datos del proceso: como /debug/profile, existen solo con
+# MCP_AUTH_TOKEN (sin él las métricas de memoria, bucle y consultas siguen en /metrics)
+for _activa, _ruta in ((MEMORIA_ACTIVA, "/debug/memoria"), (ASESOR_INDICES, "/debug/consultas")):
+    if _activa and not MCP_AUTH_TOKEN:
+        print(f"[debug] {_ruta} sin MCP_AUTH_TOKEN: ruta no registrada", file=sys.stderr)
+
+if MEMORIA_ACTIVA and MCP_AUTH_TOKEN:
+    @mcp.custom_route("/debug/memoria", methods=["GET"])
+    async def ruta_memoria(request: Request) -> JSONResponse:
+        """Memoria del proceso, pico por tool y los `top` sitios de asignación agrupados por
+        `agrupar` (lineno, filename o traceback). `diferencia=1` los compara con el arranque."""
+        if not _autorizado(request):
+            return JSONResponse({"error": "No autorizado"}, status_code=401)
+        agrupar = request.query_params.get("agrupar", "lineno")
+        if agrupar not in _AGRUPAR_MEMORIA:
+            return JSONResponse({"error": f"agrupar debe ser uno de {', '.join(_AGRUPAR_MEMORIA)}"}, status_code=400)
+        try:
+            top = int(request.query_params.get("top", 25))
+        except ValueError:
+            return JSONResponse({"error": "top debe ser numérico"}, status_code=400)
+        return JSONResponse(memoria.informe(top, agrupar, request.query_params.get("diferencia") == "1"))
+
+
+if BUCLE_MONITOR and MCP_AUTH_TOKEN:
+    @mcp.custom_route("/debug/bucle", methods=["GET"])
+    async def ruta_bucle(request: Request) -> JSONResponse:
+        """Retraso máximo del event loop y los últimos bloqueos (más nuevo primero) con su pila."""
+        if not _autorizado(request):
+            return JSONResponse({"error": "No autorizado"}, status_code=401)
+        return JSONResponse(monitor_bucle.informe())
+
+
+if ASESOR_INDICES and MCP_AUTH_TOKEN:
+    @mcp.custom_route("/debug/consultas", methods=["GET"])
+    async def ruta_consultas(request: Request) -> JSONResponse:
+        """Formas de consulta vistas desde el arranque, de la más costosa a la menos;
+        con_indice=false marca las que ningún índice de migrations/ cubre."""
+        if not _autorizado(request):
+            return JSONResponse({"error": "No autorizado"}, status_code=401)
+        formas = asesor_indices.informe()
+        return JSONResponse({"sin_indice": sum(1 for f in formas if f["con_indice"] is False), "formas": formas})
+
+
+if PROFILER_ACTIVO:
+    @mcp.custom_route("/debug/profile", methods=["GET"])
+    async def ruta_perfil(request: Request):
+        """Perfila `segundos` (por defecto 10) o, con `tool`, las próximas `llamadas` de esa tool
+        (esperando como mucho `segundos`). `formato=colapsado` devuelve solo las pilas en texto."""
+        if not _autorizado(request):
+            return JSONResponse({"error": "No autorizado"}, status_code=401)
+        try:
+            segundos = min(float(request.query_params.get("segundos", 10)), PROFILER_MAX_SEG)
+            llamadas = int(request.query_params.get("llamadas", 10))
+        except ValueError:
+            return JSONResponse({"error": "segundos y llamadas deben ser numéricos"}, status_code=400)
+        tool = request.query_params.get("tool") or None
+        try:
+            informe = await perfilador.perfilar(segundos, tool, llamadas)
+        except RuntimeError as e:
+            return JSONResponse({"error": str(e)}, status_code=409)
+        if request.query_params.get("formato") == "colapsado":
+            return PlainTextResponse(informe["colapsado"] + "\n")
+        return JSONResponse(informe)
+
+
 if __name__ == "__main__":
     mcp.run(transport="http", host="0.0.0.0", port=PORT, path="/mcp")
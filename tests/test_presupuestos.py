@@ -0,0 +1,18 @@
+"""Los presupuestos de pedidos a Supabase por tool (bench/presupuestos.py) como test: un
+escenario que se pasa de lo declarado en bench/presupuestos.json hace fallar pytest."""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+
+import presupuestos  # noqa: E402
+
+
+def test_ninguna_tool_se_pasa_de_su_presupuesto():
+    with open(presupuestos.PRESUPUESTOS, encoding="utf-8") as f:
+        datos = json.load(f)
+    excedidos = asyncio.run(presupuestos.correr(datos["escenarios"], datos["latencia_seg"], "", False))
+    assert excedidos == 0, "hay escenarios que se pasan de su presupuesto (ver la tabla en la salida)"